@@ -1,15 +1,34 @@
 const express = require("express");
-const { execFile } = require("child_process");
+const { execFile, spawn } = require("child_process");
 const path = require("path");
 const fs = require("fs");
 const router = express.Router();
 const FileModel = require('../models/File');
+const PythonWorker = require('../utils/pythonWorker');
+
+// Resident handwriting worker: loads the Siamese model once for all requests.
+// The timeout covers a cold model load plus a full queue of concurrent checks.
+const handwritingWorker = new PythonWorker(
+    path.join(__dirname, "../../model/compare_handwriting.py"),
+    ["--serve", "--concurrency", process.env.HANDWRITING_CONCURRENCY || "4"],
+    { timeout: Number(process.env.HANDWRITING_TIMEOUT_MS) || 600000 }
+);
+
+// SQLite attendance history, written by the face service and read by the routes below
+const ATTENDANCE_DB_PATH = process.env.ATTENDANCE_DB || path.join(__dirname, "../../backend/attendance.db");
+
+// Resident face service: keeps MTCNN, ArcFace and the student gallery warm
+const faceWorker = new PythonWorker(
+    path.join(__dirname, "../../model_for_face/face_recognition_system.py"),
+    ["--serve"],
+    { timeout: 90000, env: { ATTENDANCE_DB: ATTENDANCE_DB_PATH } }
+);
 
 // =================================================================
 // --- ⚙️ Reusable Helper Function to Run Python Scripts ---
-const runPythonScript = (scriptPath, args = []) => {
+const runPythonScript = (scriptPath, args = [], options = {}) => {
     return new Promise((resolve) => {
-        execFile("python", [scriptPath, ...args], (error, stdout, stderr) => {
+        execFile("python", [scriptPath, ...args], options, (error, stdout, stderr) => {
             if (error) console.error(`[Python Error] ${error.message}`);
             if (stderr) console.error(`[Python STDERR] ${stderr}`);
 
@@ -64,59 +83,37 @@ async function deleteAssignmentFromDB(studentId) {
 }
 
 // =================================================================
-// --- Helper Function to Update Attendance CSV ---
+// --- Attendance Database Helpers ---
 // =================================================================
-const updateAttendanceCSV = (studentId, date, time, newStatus) => {
-    return new Promise((resolve, reject) => {
-        const filePath = path.join(__dirname, '../../backend/attendance.csv');
-        
-        if (!fs.existsSync(filePath)) {
-            return reject(new Error("Attendance file not found"));
-        }
-
-        fs.readFile(filePath, 'utf8', (err, data) => {
-            if (err) {
-                return reject(err);
-            }
-
-            const lines = data.split('\n');
-            let updated = false;
-            const updatedLines = lines.map((line, index) => {
-                // Skip empty lines and header
-                if (!line.trim() || index === 0) return line;
-                
-                const fields = line.split(',');
-                if (fields.length >= 6) {
-                    const lineStudentId = fields[0]?.trim();
-                    const lineDate = fields[2]?.trim();
-                    const lineTime = fields[3]?.trim();
-                    
-                    // Match by studentId, date, AND time to ensure unique record
-                    if (lineStudentId === studentId && lineDate === date && lineTime === time) {
-                        console.log(`📝 Found matching record: ${line}`);
-                        fields[5] = newStatus; // Update status (6th field)
-                        updated = true;
-                        return fields.join(',');
-                    }
-                }
-                return line;
-            });
+const ATTENDANCE_STORE_SCRIPT = path.join(__dirname, "../../model_for_face/attendance_store.py");
+
+// Unfiltered queries return the whole history as one JSON document, well past execFile's 1 MB default
+const ATTENDANCE_STORE_MAX_BUFFER = Number(process.env.ATTENDANCE_STORE_MAX_BUFFER) || 512 * 1024 * 1024;
+
+// Runs one attendance_store.py command (query | stats | update) against the SQLite store
+const runAttendanceStore = (args) => runPythonScript(
+    ATTENDANCE_STORE_SCRIPT,
+    ["--db", ATTENDANCE_DB_PATH, ...args],
+    { maxBuffer: ATTENDANCE_STORE_MAX_BUFFER }
+);
+
+// Stable record id used by the frontend: "studentId_date_hour-minute-second"
+const toAttendanceRecord = (row) => ({
+    _id: `${row.student_id}_${row.date}_${row.time.replace(/:/g, '-')}`.replace(/[^a-zA-Z0-9_-]/g, '_'),
+    student_id: row.student_id || 'N/A',
+    name: row.name || 'N/A',
+    date: row.date || 'N/A',
+    time: row.time || 'N/A',
+    subject: row.subject || 'N/A',
+    status: row.status || 'N/A'
+});
 
-            if (!updated) {
-                console.log(`❌ No record found for: ${studentId}, ${date}, ${time}`);
-                return reject(new Error("record_not_found"));
-            }
+const withPercentages = (counts) => ({
+    ...counts,
+    presentPercentage: counts.total > 0 ? ((counts.present / counts.total) * 100).toFixed(1) : "0",
+    absentPercentage: counts.total > 0 ? ((counts.absent / counts.total) * 100).toFixed(1) : "0"
+});
 
-            fs.writeFile(filePath, updatedLines.join('\n'), 'utf8', (writeErr) => {
-                if (writeErr) {
-                    return reject(writeErr);
-                }
-                console.log(`💾 CSV file updated successfully`);
-                resolve(true);
-            });
-        });
-    });
-};
 // =================================================================
 // --- Refactored Routes ---
 // =================================================================
@@ -138,7 +135,8 @@ router.post("/fetch-file-path", async (req, res) => {
         res.json({
             status: "success",
             message: "Files fetched successfully",
-            files: result.files
+            files: result.files,
+            spans: result.spans
         });
 
     } catch (error) {
@@ -159,30 +157,27 @@ router.get("/compare-handwriting/:studentId", async (req, res) => {
     }
 
     try {
-        const fetchScript = path.join(__dirname, "../../model/fetch_file.py");
-        const compareScript = path.join(__dirname, "../../model/compare_handwriting.py");
-
-        console.log(`[Step 1/2] Fetching files for student: ${studentId}`);
-        const fetchResult = await runPythonScript(fetchScript, [studentId, "all", authToken]);
-
-        // Stop if fetch fails or warning
-        if (fetchResult.status !== "success") {
-            await deleteAssignmentFromDB(studentId);
-            return res.status(400).json({
-                status: fetchResult.status || "error",
-                message: fetchResult.message || "File fetch failed. Assignment deleted.",
-                ...fetchResult
+        // Files are fetched from MongoDB and decoded in memory by the worker,
+        // so concurrent checks never share the fetched_files directory.
+        console.log(`[Step 1/1] Fetching and comparing handwriting for student: ${studentId}`);
+        const compareResult = await handwritingWorker.request({ student_id: studentId, source: "mongo" });
+        console.log(`[⏱️] Handwriting check took ${compareResult.latency_ms} ms (${compareResult.cold ? "cold" : "warm"})`);
+
+        // Errors, timeouts and a dead worker say nothing about the handwriting: keep the upload
+        if (compareResult.status !== "success") {
+            return res.status(500).json({
+                ...compareResult,
+                status: "error",
+                message: getFriendlyErrorMessage(compareResult.message || "Handwriting comparison failed")
             });
         }
 
-        console.log(`[Step 2/2] Comparing handwriting for student: ${studentId}`);
-        const compareResult = await runPythonScript(compareScript, ["--student_id", studentId]);
-
-        if (compareResult.status !== "success" || !compareResult.matched) {
+        // Only a completed comparison that did not match removes the assignment
+        if (!compareResult.matched) {
             await deleteAssignmentFromDB(studentId);
             return res.status(400).json({
-                status: compareResult.status || "error",
-                message: compareResult.message || "Handwriting mismatch. Assignment deleted.",
+                status: compareResult.status,
+                message: "Handwriting mismatch. Assignment deleted.",
                 ...compareResult
             });
         }
@@ -196,14 +191,40 @@ router.get("/compare-handwriting/:studentId", async (req, res) => {
 
     } catch (error) {
         console.error(`[🔥 Error] Compare handwriting failed for student ${studentId}:`, error.message);
-        await deleteAssignmentFromDB(studentId);
         return res.status(500).json({
             status: "error",
-            message: error.message || "Unexpected server error. Assignment deleted."
+            message: error.message || "Unexpected server error."
         });
     }
 });
 
+// BULK COMPARE HANDWRITING ROUTE
+// Streams one NDJSON line per assignment as soon as it is scored. Unlike the
+// single-student route, mismatched assignments are reported, not deleted.
+router.post("/compare-handwriting-bulk", (req, res) => {
+    const { student_ids: studentIds, since } = req.body;
+    const authToken = req.headers.authorization?.split(" ")[1];
+
+    if (!authToken || (!since && !(Array.isArray(studentIds) && studentIds.length))) {
+        return res.status(400).json({ status: "error", message: "Pass student_ids and/or since" });
+    }
+
+    const args = [path.join(__dirname, "../../model/bulk_verify.py")];
+    if (since) args.push("--since", String(since));
+    if (Array.isArray(studentIds) && studentIds.length) args.push("--student_ids", ...studentIds.map(String));
+
+    const child = spawn("python", args, { stdio: ["ignore", "pipe", "pipe"] });
+    res.setHeader("Content-Type", "application/x-ndjson");
+    child.stdout.pipe(res);
+    child.stderr.on("data", (chunk) => process.stderr.write(chunk));
+    child.on("error", (error) => {
+        console.error(`[🔥 Error] Bulk handwriting check failed to start: ${error.message}`);
+        res.end(JSON.stringify({ status: "error", message: error.message }) + "\n");
+    });
+    // Stop the scan if the client goes away
+    res.on("close", () => child.kill());
+});
+
 // ---------------------------
 // NEW ROUTE: Register Student with Face (FIXED TEMP CLEANUP)
 // ---------------------------
@@ -266,45 +287,18 @@ router.post("/register-face", async (req, res) => {
             throw new Error("Failed to save image file");
         }
 
-        // Construct arguments with validation
-        const args = [
-            "register",
-            student_id.trim(),
-            name.trim(),
-            tempImagePath,
-            authToken
-        ];
-
-        console.log(`🔍 Executing: python ${pythonScript} register ${student_id} [name] [image_path] [token_redacted]`);
-
-        const result = await new Promise((resolve, reject) => {
-            const child = execFile("python", [pythonScript, ...args], { timeout: 90000 }, (error, stdout, stderr) => {
-                if (error) {
-                    console.error(`🐍 Python Error (${error.code}): ${stderr || error.message}`);
-                    const errorMsg = error.code === 'ETIMEDOUT' 
-                        ? "Face recognition process timed out"
-                        : `Face registration failed: ${stderr || error.message}`;
-                    reject(new Error(errorMsg));
-                } else {
-                    try {
-                        const output = stdout.trim();
-                        if (!output) {
-                            throw new Error("Empty response from Python script");
-                        }
-                        resolve(JSON.parse(output));
-                    } catch (e) {
-                        console.error("Failed to parse Python output:", stdout);
-                        reject(new Error("Invalid JSON response from Python script"));
-                    }
-                }
-            });
+        console.log(`🔍 Sending register ${student_id} [name] [image_path] [token_redacted] to face service`);
 
-            child.on('exit', (code) => {
-                if (code !== 0) {
-                    console.error(`Python process exited with code ${code}`);
-                }
-            });
+        const result = await faceWorker.request({
+            operation: "register",
+            student_id: student_id.trim(),
+            name: name.trim(),
+            image_path: tempImagePath,
+            token: authToken
         });
+        if (result.status === "error") {
+            throw new Error(`Face registration failed: ${result.message}`);
+        }
 
         // Validate Python script response structure
         if (typeof result.success !== 'boolean') {
@@ -322,7 +316,9 @@ router.post("/register-face", async (req, res) => {
         res.status(result.success ? 200 : 400).json({
             success: result.success,
             message: result.message || (result.success ? "Face registered successfully" : "Face registration failed"),
-            data: result.data || null
+            data: result.data || null,
+            spans: result.spans,
+            profile: result.profile
         });
 
     } catch (error) {
@@ -415,48 +411,18 @@ router.post("/take-attendance", async (req, res) => {
             throw new Error("Failed to save attendance image");
         }
 
-        // Construct arguments with input sanitization - ADD DATE ARGUMENT
-        const args = [
-            "attendance",
-            subject.trim(),
-            tempImagePath,
-            date.trim(), // Add the date as an argument
-            authToken
-        ];
-
-        console.log(`🔍 Executing: python ${pythonScript} attendance ${subject} [image_path] ${date} [token_redacted]`);
-
-        const result = await new Promise((resolve, reject) => {
-            const child = execFile(
-                "python", 
-                [pythonScript, ...args], 
-                { timeout: 30000 },
-                (error, stdout, stderr) => {
-                    if (error) {
-                        const errorMsg = error.code === 'ETIMEDOUT' 
-                            ? "Attendance process timed out"
-                            : `Attendance failed: ${stderr || error.message}`;
-                        console.error(`🐍 Python Error (${error.code}): ${errorMsg}`);
-                        reject(new Error(errorMsg));
-                    } else {
-                        try {
-                            const output = stdout.trim();
-                            if (!output) throw new Error("Empty response from Python script");
-                            resolve(JSON.parse(output));
-                        } catch (e) {
-                            console.error("Failed to parse Python output:", stdout);
-                            reject(new Error("Invalid response from attendance system"));
-                        }
-                    }
-                }
-            );
-
-            child.on('exit', (code) => {
-                if (code !== 0) {
-                    console.error(`Python process exited with code ${code}`);
-                }
-            });
+        console.log(`🔍 Sending attendance ${subject} [image_path] ${date} [token_redacted] to face service`);
+
+        const result = await faceWorker.request({
+            operation: "attendance",
+            subject: subject.trim(),
+            image_path: tempImagePath,
+            date: date.trim(),
+            token: authToken
         });
+        if (result.status === "error") {
+            throw new Error(`Attendance failed: ${result.message}`);
+        }
 
         // Validate and standardize response
         if (typeof result.success !== 'boolean') {
@@ -476,7 +442,10 @@ router.post("/take-attendance", async (req, res) => {
             message: result.message || (result.success ? "Attendance recorded successfully" : "Failed to record attendance"),
             data: result.data || null,
             recognized: result.recognized || [],
-            unrecognized: result.unrecognized || []
+            unrecognized: result.unrecognized || [],
+            timings: result.timings || null,
+            spans: result.spans,
+            profile: result.profile
         });
 
     } catch (error) {
@@ -497,6 +466,103 @@ router.post("/take-attendance", async (req, res) => {
         });
     }
 });
+
+// ---------------------------
+// Burst / Video Attendance Route
+// ---------------------------
+// Several photos and/or short clips of the same class. The face service tracks
+// faces across frames and writes one merged attendance report.
+router.post("/take-attendance-burst", async (req, res) => {
+    console.log("------ [BURST ATTENDANCE API HIT] ------");
+
+    const { subject = '', media = [], date = '' } = req.body;
+    const authToken = req.headers.authorization?.split(" ")[1] || '';
+
+    const missingFields = [];
+    if (!authToken) missingFields.push('authorization');
+    if (!subject) missingFields.push('subject');
+    if (!Array.isArray(media) || media.length === 0) missingFields.push('media');
+    if (!date) missingFields.push('date');
+
+    if (missingFields.length > 0) {
+        return res.status(400).json({
+            success: false,
+            message: "Missing required fields",
+            missing_fields: missingFields,
+            required_fields: ["authorization", "subject", "media", "date"]
+        });
+    }
+
+    const validMediaRegex = /^data:(image\/(jpeg|jpg|png)|video\/(mp4|webm|quicktime));base64,/;
+    if (!media.every(item => typeof item === 'string' && validMediaRegex.test(item))) {
+        return res.status(400).json({
+            success: false,
+            message: "Invalid media format. Only JPEG/JPG/PNG images and MP4/WEBM/MOV videos (base64) supported",
+            supported_formats: ["image/jpeg", "image/jpg", "image/png", "video/mp4", "video/webm", "video/quicktime"]
+        });
+    }
+
+    if (!/^\d{4}-\d{2}-\d{2}$/.test(date)) {
+        return res.status(400).json({
+            success: false,
+            message: "Invalid date format. Please use YYYY-MM-DD"
+        });
+    }
+
+    const tempDir = path.join(__dirname, "../../backend/temp");
+    if (!fs.existsSync(tempDir)) {
+        fs.mkdirSync(tempDir, { recursive: true });
+    }
+
+    const tempPaths = [];
+    try {
+        const batchId = Date.now();
+        for (const [index, item] of media.entries()) {
+            const mimeSubtype = item.split(';')[0].split('/')[1];
+            const extension = mimeSubtype === 'quicktime' ? 'mov' : mimeSubtype;
+            const tempPath = path.join(tempDir, `attendance_${batchId}_${index}.${extension}`);
+            await fs.promises.writeFile(tempPath, item.replace(validMediaRegex, ""), 'base64');
+            tempPaths.push(tempPath);
+        }
+
+        console.log(`🔍 Sending burst attendance ${subject} [${tempPaths.length} files] ${date} [token_redacted] to face service`);
+
+        const result = await faceWorker.request({
+            operation: "attendance_burst",
+            subject: subject.trim(),
+            media_paths: tempPaths,
+            date: date.trim(),
+            token: authToken
+        });
+        if (result.status === "error") {
+            throw new Error(`Attendance failed: ${result.message}`);
+        }
+        if (typeof result.success !== 'boolean') {
+            throw new Error("Invalid response structure from attendance system");
+        }
+
+        res.status(result.success ? 200 : 400).json({
+            success: result.success,
+            message: result.message || (result.success ? "Attendance recorded successfully" : "Failed to record attendance"),
+            timings: result.timings || null,
+            spans: result.spans,
+            profile: result.profile
+        });
+
+    } catch (error) {
+        console.error("🚨 Burst Attendance Error:", error.message);
+        res.status(500).json({
+            success: false,
+            message: error.message,
+            error_type: error.constructor.name,
+            system_error: process.env.NODE_ENV === 'development' ? error.stack : undefined
+        });
+    } finally {
+        tempPaths.forEach(tempPath => fs.unlink(tempPath, (err) => {
+            if (err) console.error("Failed to cleanup temp media:", err.message);
+        }));
+    }
+});
 // ---------------------------
 // Update Attendance Status Route (LONG-TERM FIX)
 // ---------------------------
@@ -547,8 +613,11 @@ router.put("/update-attendance-status", async (req, res) => {
         
         console.log(`🔍 Looking for record: ${studentId}, ${date}, ${time}`);
         
-        // Update the CSV file
-        await updateAttendanceCSV(studentId, date, time, status);
+        // Keyed update on (student_id, date, time)
+        const result = await runAttendanceStore(["update", studentId, date, time, status]);
+        if (!result.success) {
+            throw new Error(result.message || "update_failed");
+        }
         
         console.log(`✅ Attendance status updated: ${studentId} on ${date} at ${time} -> ${status}`);
         
@@ -598,58 +667,11 @@ router.get("/get-attendance", async (req, res) => {
             });
         }
 
-        const filePath = path.join(__dirname, '../../backend/attendance.csv');
-        
-        if (!fs.existsSync(filePath)) {
-            return res.status(200).json({
-                success: true,
-                records: [],
-                message: "Attendance file not found"
-            });
-        }
-
-        const fileContent = fs.readFileSync(filePath, 'utf-8');
-        const lines = fileContent.split('\n').filter(line => line.trim());
-        
-        if (lines.length === 0) {
-            return res.status(200).json({
-                success: true,
-                records: [],
-                message: "Attendance file is empty"
-            });
-        }
-
-        const records = [];
-        const startIndex = lines[0].includes('student_id') ? 1 : 0;
-
-        for (let i = startIndex; i < lines.length; i++) {
-            const line = lines[i];
-            if (!line.trim()) continue;
-            
-            const fields = line.split(',');
-            if (fields.length >= 6) {
-                const studentId = fields[0]?.trim();
-                const recordDate = fields[2]?.trim();
-                const time = fields[3]?.trim();
-                
-                // FIXED: Use hyphens instead of underscores for time
-                const _id = `${studentId}_${recordDate}_${time.replace(/:/g, '-')}`.replace(/[^a-zA-Z0-9_-]/g, '_');
-                
-                const record = {
-                    _id,
-                    student_id: studentId || 'N/A',
-                    name: fields[1]?.trim() || 'N/A',
-                    date: recordDate || 'N/A',
-                    time: time || 'N/A',
-                    subject: fields[4]?.trim() || 'N/A',
-                    status: fields[5]?.trim() || 'N/A'
-                };
-                
-                if (!date || record.date === date) {
-                    records.push(record);
-                }
-            }
+        const result = await runAttendanceStore(date ? ["query", "--date", date] : ["query"]);
+        if (!result.success) {
+            throw new Error(result.message || "Attendance query failed");
         }
+        const records = result.records.map(toAttendanceRecord);
 
         res.status(200).json({
             success: true,
@@ -670,54 +692,11 @@ router.get("/get-attendance", async (req, res) => {
 // ---------------------------
 router.get("/get-all-attendance", async (req, res) => {
     try {
-        const filePath = path.join(__dirname, '../../backend/attendance.csv');
-        
-        if (!fs.existsSync(filePath)) {
-            return res.status(200).json({
-                success: true,
-                records: [],
-                message: "Attendance file not found"
-            });
-        }
-
-        const fileContent = fs.readFileSync(filePath, 'utf-8');
-        const lines = fileContent.split('\n').filter(Boolean);
-        
-        if (lines.length === 0) {
-            return res.status(200).json({
-                success: true,
-                records: [],
-                message: "Attendance file is empty"
-            });
-        }
-
-        const records = [];
-        const startIndex = lines[0].includes('student_id') ? 1 : 0;
-
-        for (let i = startIndex; i < lines.length; i++) {
-            const line = lines[i];
-            if (!line.trim()) continue;
-            
-            const fields = line.split(',');
-            if (fields.length >= 6) {
-                const studentId = fields[0]?.trim();
-                const recordDate = fields[2]?.trim();
-                const time = fields[3]?.trim();
-                
-                // FIXED: Use hyphens instead of underscores for time
-                const _id = `${studentId}_${recordDate}_${time.replace(/:/g, '-')}`.replace(/[^a-zA-Z0-9_-]/g, '_');
-                
-                records.push({
-                    _id,
-                    student_id: studentId || 'N/A',
-                    name: fields[1]?.trim() || 'N/A',
-                    date: recordDate || 'N/A',
-                    time: time || 'N/A',
-                    subject: fields[4]?.trim() || 'N/A',
-                    status: fields[5]?.trim() || 'N/A'
-                });
-            }
+        const result = await runAttendanceStore(["query"]);
+        if (!result.success) {
+            throw new Error(result.message || "Attendance query failed");
         }
+        const records = result.records.map(toAttendanceRecord);
 
         return res.status(200).json({
             success: true,
@@ -743,110 +722,32 @@ router.get("/attendance-statistics", async (req, res) => {
     try {
         const { date, subject } = req.query; // Optional filters
         
-        const filePath = path.join(__dirname, '../../backend/attendance.csv');
-        
-        if (!fs.existsSync(filePath)) {
-            return res.status(200).json({
-                success: true,
-                statistics: {
-                    total: 0,
-                    present: 0,
-                    absent: 0,
-                    presentPercentage: 0,
-                    absentPercentage: 0,
-                    bySubject: {}
-                }
-            });
-        }
-
-        const fileContent = fs.readFileSync(filePath, 'utf-8');
-        const lines = fileContent.split('\n').filter(line => line.trim());
-        
-        if (lines.length <= 1) { // Only header or empty
-            return res.status(200).json({
-                success: true,
-                statistics: {
-                    total: 0,
-                    present: 0,
-                    absent: 0,
-                    presentPercentage: 0,
-                    absentPercentage: 0,
-                    bySubject: {}
-                }
-            });
+        const args = ["stats"];
+        if (date) args.push("--date", date);
+        if (subject) args.push("--subject", subject);
+
+        // Counts are aggregated by SQLite; only the percentages are formatted here
+        const result = await runAttendanceStore(args);
+        if (!result.success) {
+            throw new Error(result.message || "Attendance statistics failed");
         }
 
+        const counts = result.statistics;
         const statistics = {
-            total: 0,
-            present: 0,
-            absent: 0,
-            presentPercentage: 0,
-            absentPercentage: 0,
+            ...withPercentages(counts),
             bySubject: {},
             byDate: {}
         };
-
-        const startIndex = lines[0].includes('student_id') ? 1 : 0;
-
-        for (let i = startIndex; i < lines.length; i++) {
-            const line = lines[i];
-            if (!line.trim()) continue;
-            
-            const fields = line.split(',');
-            if (fields.length >= 6) {
-                const recordDate = fields[2]?.trim();
-                const recordSubject = fields[4]?.trim();
-                const status = fields[5]?.trim();
-                
-                // Apply filters if provided - FIXED: changed subjectFilter to subject
-                if (date && recordDate !== date) continue;
-                if (subject && recordSubject !== subject) continue;
-                
-                statistics.total++;
-                
-                if (status === 'Present') {
-                    statistics.present++;
-                } else if (status === 'Absent') {
-                    statistics.absent++;
-                }
-                
-                // Group by subject
-                if (!statistics.bySubject[recordSubject]) {
-                    statistics.bySubject[recordSubject] = { total: 0, present: 0, absent: 0 };
-                }
-                statistics.bySubject[recordSubject].total++;
-                if (status === 'Present') statistics.bySubject[recordSubject].present++;
-                if (status === 'Absent') statistics.bySubject[recordSubject].absent++;
-                
-                // Group by date
-                if (!statistics.byDate[recordDate]) {
-                    statistics.byDate[recordDate] = { total: 0, present: 0, absent: 0 };
-                }
-                statistics.byDate[recordDate].total++;
-                if (status === 'Present') statistics.byDate[recordDate].present++;
-                if (status === 'Absent') statistics.byDate[recordDate].absent++;
-            }
-        }
-
-        // Calculate percentages
-        if (statistics.total > 0) {
-            statistics.presentPercentage = ((statistics.present / statistics.total) * 100).toFixed(1);
-            statistics.absentPercentage = ((statistics.absent / statistics.total) * 100).toFixed(1);
-            
-            // Calculate percentages for each subject
-            Object.keys(statistics.bySubject).forEach(subject => {
-                const subjectStats = statistics.bySubject[subject];
-                subjectStats.presentPercentage = subjectStats.total > 0 ? ((subjectStats.present / subjectStats.total) * 100).toFixed(1) : "0";
-                subjectStats.absentPercentage = subjectStats.total > 0 ? ((subjectStats.absent / subjectStats.total) * 100).toFixed(1) : "0";
-            });
-            
-            // Calculate percentages for each date
-            Object.keys(statistics.byDate).forEach(date => {
-                const dateStats = statistics.byDate[date];
-                dateStats.presentPercentage = dateStats.total > 0 ? ((dateStats.present / dateStats.total) * 100).toFixed(1) : "0";
-                dateStats.absentPercentage = dateStats.total > 0 ? ((dateStats.absent / dateStats.total) * 100).toFixed(1) : "0";
-            });
+        if (counts.total === 0) {
+            statistics.presentPercentage = 0;
+            statistics.absentPercentage = 0;
         }
+        Object.keys(counts.bySubject).forEach(key => {
+            statistics.bySubject[key] = withPercentages(counts.bySubject[key]);
+        });
+        Object.keys(counts.byDate).forEach(key => {
+            statistics.byDate[key] = withPercentages(counts.byDate[key]);
+        });
 
         res.status(200).json({
             success: true,
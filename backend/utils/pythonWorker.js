@@ -0,0 +1,97 @@
+const { spawn } = require("child_process");
+const readline = require("readline");
+
+// =================================================================
+// --- 🔁 Resident Python Worker (NDJSON over stdin/stdout) ---
+// =================================================================
+// Keeps one Python process alive so the model is loaded once instead of on
+// every request. Requests are written as one JSON object per line and matched
+// to replies by their "id". The process is restarted lazily if it dies.
+class PythonWorker {
+    constructor(scriptPath, args = [], { timeout = 120000, env = {} } = {}) {
+        this.scriptPath = scriptPath;
+        this.args = args;
+        this.timeout = timeout;
+        this.env = env;
+        this.child = null;
+        this.nextId = 1;
+        this.pending = new Map();
+    }
+
+    start() {
+        if (this.child) return;
+
+        this.child = spawn("python", [this.scriptPath, ...this.args], {
+            stdio: ["pipe", "pipe", "pipe"],
+            env: { ...process.env, ...this.env }
+        });
+
+        readline.createInterface({ input: this.child.stdout }).on("line", (line) => {
+            let reply;
+            try {
+                reply = JSON.parse(line);
+            } catch (parseError) {
+                console.error(`[Python Worker] Ignoring non-JSON output: ${line}`);
+                return;
+            }
+
+            const entry = this.pending.get(reply.id);
+            if (!entry) return;
+            clearTimeout(entry.timer);
+            this.pending.delete(reply.id);
+            entry.resolve(reply);
+        });
+
+        this.child.stderr.on("data", (data) => console.error(`[Python Worker STDERR] ${data}`));
+
+        const child = this.child;
+        child.on("exit", (code) => {
+            console.error(`[Python Worker] ${this.scriptPath} exited with code ${code}`);
+            this.fail(child, "Python worker exited unexpectedly");
+        });
+
+        // Spawn failures (e.g. ENOENT) and writes to a dead worker (EPIPE) are
+        // emitted as 'error' events, which would otherwise crash the server
+        child.on("error", (error) => {
+            console.error(`[Python Worker] ${this.scriptPath} failed: ${error.message}`);
+            this.fail(child, `Python worker failed: ${error.message}`);
+        });
+        child.stdin.on("error", (error) => {
+            console.error(`[Python Worker] Write to ${this.scriptPath} failed: ${error.message}`);
+            this.fail(child, `Python worker failed: ${error.message}`);
+        });
+    }
+
+    // Answers every pending request with an error and forgets the process so the next request respawns it
+    fail(child, message) {
+        if (this.child !== child) return;
+        this.child = null;
+        for (const [id, entry] of this.pending) {
+            clearTimeout(entry.timer);
+            entry.resolve({ id, status: "error", message });
+        }
+        this.pending.clear();
+        child.kill();
+    }
+
+    request(payload) {
+        this.start();
+        const id = this.nextId++;
+
+        return new Promise((resolve) => {
+            const timer = setTimeout(() => {
+                this.pending.delete(id);
+                resolve({ id, status: "error", message: "Python worker timed out" });
+            }, this.timeout);
+
+            this.pending.set(id, { resolve, timer });
+            this.child.stdin.write(JSON.stringify({ ...payload, id }) + "\n");
+        });
+    }
+
+    stop() {
+        if (this.child) this.child.kill();
+    }
+}
+
+module.exports = PythonWorker;
@@ -0,0 +1,64 @@
+import sys
+import os
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "model_for_matching"))
+
+from dataset import HandwritingPairDataset
+from train import build_dataloader
+
+def epoch_time(dataset, batch_size, workers, epochs):
+    """Median wall time of a full pass over the loader (no model), after one warm-up pass."""
+    loader = build_dataloader(dataset, batch_size, workers, torch.device("cpu"))
+    timings = []
+    for epoch in range(epochs + 1):
+        started = time.perf_counter()
+        for _ in loader:
+            pass
+        if epoch > 0:  # the first pass also starts the worker processes
+            timings.append((time.perf_counter() - started) * 1000)
+    return round(float(np.median(timings)), 2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Epoch loading time of HandwritingPairDataset, cached vs uncached.")
+    parser.add_argument("--data", default=os.path.join(os.path.dirname(__file__), "..", "model_for_matching", "data"))
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--epochs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, "image_cache")
+        uncached = HandwritingPairDataset(args.data)
+        started = time.perf_counter()
+        cached = HandwritingPairDataset(args.data, cache_path=cache_path)
+        cache_build_ms = (time.perf_counter() - started) * 1000
+
+        results = []
+        for workers in args.workers:
+            uncached_ms = epoch_time(uncached, args.batch_size, workers, args.epochs)
+            cached_ms = epoch_time(cached, args.batch_size, workers, args.epochs)
+            results.append({
+                "workers": workers,
+                "uncached_epoch_ms": uncached_ms,
+                "cached_epoch_ms": cached_ms,
+                "speedup": round(uncached_ms / max(cached_ms, 1e-6), 2)
+            })
+        cache_bytes = os.path.getsize(f"{cache_path}.npy")
+
+    print(json.dumps({
+        "benchmark": "dataset_loading",
+        "pairs": len(uncached),
+        "cache_build_ms": round(cache_build_ms, 2),
+        "cache_bytes": cache_bytes,
+        "results": results
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import sys
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "model_for_face"))
+
+from face_gallery import FaceGallery
+from face_index import IVFIndex
+
+# Same values as ArcFaceSystem
+MATCH_THRESHOLD = 0.68
+DUPLICATE_THRESHOLD = 0.80
+DIM = 512
+
+def synthetic_gallery(students: int, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, a rough stand-in for real ArcFace embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(8, students // 50), DIM))
+    owners = rng.integers(0, len(centers), students)
+    return FaceGallery.normalize(centers[owners] + 1.2 * rng.normal(size=(students, DIM)))
+
+def synthetic_queries(gallery: np.ndarray, count: int, seed: int = 1):
+    """Half noisy re-captures of enrolled students, half strangers."""
+    rng = np.random.default_rng(seed)
+    owners = rng.integers(0, len(gallery), count // 2)
+    enrolled = FaceGallery.normalize(gallery[owners] + 0.035 * rng.normal(size=(len(owners), DIM)))
+    strangers = FaceGallery.normalize(rng.normal(size=(count - len(owners), DIM)))
+    return np.vstack([enrolled, strangers])
+
+def timed_top1(gallery: FaceGallery, queries: np.ndarray, repeats: int):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        indices, scores = gallery.top_k(queries, k=1)
+        timings.append((time.perf_counter() - started) * 1000)
+    return indices[:, 0], scores[:, 0], float(np.median(timings))
+
+def decisions(indices, scores, threshold):
+    return np.where(scores > threshold, indices, -1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency of the IVF face index against brute force.")
+    parser.add_argument("--students", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=60, help="Faces per classroom photo.")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    results = []
+    for students in args.students:
+        embeddings = synthetic_gallery(students)
+        queries = synthetic_queries(embeddings, args.queries)
+
+        exact = FaceGallery()
+        exact.load([str(i) for i in range(students)], [""] * students, embeddings)
+        exact_idx, exact_scores, exact_ms = timed_top1(exact, queries, args.repeats)
+
+        started = time.perf_counter()
+        index = IVFIndex.build(exact.matrix)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            approx = FaceGallery()
+            approx.load(exact.ids, exact.names, embeddings)
+            approx.attach_index(index)
+            ann_idx, ann_scores, ann_ms = timed_top1(approx, queries, args.repeats)
+
+            results.append({
+                "students": students,
+                "nlist": len(index.lists),
+                "nprobe": nprobe,
+                "build_ms": round(build_ms, 2),
+                "brute_force_ms": round(exact_ms, 3),
+                "ann_ms": round(ann_ms, 3),
+                # Recall only means something for faces that are actually enrolled
+                "recall_at_1": round(float(np.mean((ann_idx == exact_idx)[:args.queries // 2])), 4),
+                "match_agreement": round(float(np.mean(
+                    decisions(ann_idx, ann_scores, MATCH_THRESHOLD) == decisions(exact_idx, exact_scores, MATCH_THRESHOLD)
+                )), 4),
+                "duplicate_agreement": round(float(np.mean(
+                    decisions(ann_idx, ann_scores, DUPLICATE_THRESHOLD) == decisions(exact_idx, exact_scores, DUPLICATE_THRESHOLD)
+                )), 4)
+            })
+
+    print(json.dumps({"benchmark": "face_ann", "queries": args.queries, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
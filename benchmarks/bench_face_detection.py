@@ -0,0 +1,96 @@
+import sys
+import os
+import json
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "model_for_face"))
+
+from deepface import DeepFace
+from face_detection import TiledFaceDetector
+
+def detect_full(img, detector_backend):
+    """The current path: one extract_faces call on the whole CLAHE-adjusted photo."""
+    faces = DeepFace.extract_faces(img_path=img, detector_backend=detector_backend, enforce_detection=False)
+    return [face for face in faces if face['confidence'] != 0]
+
+def adjust_brightness(img):
+    """Same CLAHE step as ArcFaceSystem._adjust_brightness."""
+    h, s, v = cv2.split(cv2.cvtColor(img, cv2.COLOR_BGR2HSV))
+    v = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(v)
+    return cv2.cvtColor(cv2.merge((h, s, v)), cv2.COLOR_HSV2BGR)
+
+def iou(a, b):
+    ax2, ay2, bx2, by2 = a['x'] + a['w'], a['y'] + a['h'], b['x'] + b['w'], b['y'] + b['h']
+    inter = max(0, min(ax2, bx2) - max(a['x'], b['x'])) * max(0, min(ay2, by2) - max(a['y'], b['y']))
+    return inter / (a['w'] * a['h'] + b['w'] * b['h'] - inter + 1e-6)
+
+def matched_count(reference, candidate, threshold=0.5):
+    """Faces from the full-resolution pass that the tiled pass also found."""
+    return sum(
+        any(iou(ref['facial_area'], cand['facial_area']) >= threshold for cand in candidate)
+        for ref in reference
+    )
+
+def timed(fn, img, repeats):
+    timings, faces = [], []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        faces = fn(img)
+        timings.append((time.perf_counter() - started) * 1000)
+    return faces, round(float(np.median(timings)), 2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-resolution and tiled face detection on classroom photos.")
+    parser.add_argument("images", nargs="+", help="Classroom photos to detect faces in.")
+    parser.add_argument("--detector", default="mtcnn")
+    parser.add_argument("--max-side", type=int, nargs="+", default=[1920, 2560, 3200])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    DeepFace.build_model(model_name=args.detector, task="face_detector")
+    detectors = {
+        max_side: TiledFaceDetector(args.detector, max_side=max_side, workers=args.workers)
+        for max_side in args.max_side
+    }
+    for detector in detectors.values():
+        detector.warm_up()
+
+    results = []
+    for image_path in args.images:
+        img = cv2.imread(image_path)
+        if img is None:
+            print(f"Skipping unreadable image: {image_path}", file=sys.stderr)
+            continue
+        processed = adjust_brightness(img)
+
+        full_faces, full_ms = timed(lambda im: detect_full(im, args.detector), processed, args.repeats)
+        entry = {
+            "image": os.path.basename(image_path),
+            "megapixels": round(img.shape[0] * img.shape[1] / 1e6, 1),
+            "full": {"faces": len(full_faces), "median_ms": full_ms},
+            "tiled": []
+        }
+        for max_side, detector in detectors.items():
+            tiled_faces, tiled_ms = timed(detector.detect, processed, args.repeats)
+            entry["tiled"].append({
+                "max_side": max_side,
+                "faces": len(tiled_faces),
+                "matched_full_faces": matched_count(full_faces, tiled_faces),
+                "median_ms": tiled_ms,
+                "speedup": round(full_ms / max(tiled_ms, 1e-6), 2)
+            })
+        results.append(entry)
+
+    for detector in detectors.values():
+        detector.close()
+
+    print(json.dumps({"benchmark": "face_detection", "detector": args.detector, "workers": args.workers,
+                      "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
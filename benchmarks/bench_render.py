@@ -0,0 +1,88 @@
+import sys
+import os
+import json
+import time
+import argparse
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "model"))
+
+import compare_handwriting as ch
+
+def make_scanned_pdf(pages: int, dpi: int, seed: int = 0) -> bytes:
+    """Builds an A4 PDF whose pages are full-page noisy images at the given DPI."""
+    rng = np.random.default_rng(seed)
+    width_pt, height_pt = 595, 842
+    width_px, height_px = int(width_pt / 72 * dpi), int(height_pt / 72 * dpi)
+
+    doc = fitz.open()
+    for _ in range(pages):
+        scan = np.full((height_px, width_px, 3), 235, dtype=np.uint8)
+        for _ in range(60):
+            y = int(rng.integers(0, height_px))
+            cv2.line(scan, (0, y), (width_px, y + int(rng.integers(-20, 20))), (40, 40, 40), max(1, dpi // 100))
+        ok, png = cv2.imencode(".png", scan)
+        page = doc.new_page(width=width_pt, height=height_pt)
+        page.insert_image(page.rect, stream=png.tobytes())
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def render_legacy(data: bytes, page_indices):
+    """The previous path: default colour pixmap, then cvtColor to gray."""
+    images = []
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for page_num in page_indices:
+            pix = doc.load_page(page_num).get_pixmap()
+            img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+            if img.shape[2] == 3:
+                img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+            elif img.shape[2] == 4:
+                img = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
+            images.append(img)
+    return images
+
+def render_current(data: bytes, page_indices):
+    return ch.convert_bytes_to_image(data, "bench.pdf", "bench", page_indices=page_indices)
+
+def time_path(fn, data, page_indices, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        images = fn(data, page_indices)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "median_ms": round(float(np.median(timings)), 2),
+        "min_ms": round(min(timings), 2),
+        "pixels_per_page": int(np.mean([img.size for img in images])),
+        "peak_page_bytes": int(max(img.nbytes for img in images))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare legacy and grayscale PDF page rendering.")
+    parser.add_argument("--pages", type=int, default=ch.PAGES_TO_SAMPLE)
+    parser.add_argument("--dpi", type=int, nargs="+", default=[150, 300, 600])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    results = []
+    for dpi in args.dpi:
+        data = make_scanned_pdf(args.pages, dpi)
+        page_indices = list(range(args.pages))
+        legacy = time_path(render_legacy, data, page_indices, args.repeats)
+        current = time_path(render_current, data, page_indices, args.repeats)
+        results.append({
+            "dpi": dpi,
+            "pages": args.pages,
+            "legacy": legacy,
+            "grayscale_targeted": current,
+            "speedup": round(legacy["median_ms"] / max(current["median_ms"], 1e-6), 2)
+        })
+
+    print(json.dumps({"benchmark": "pdf_render", "render_workers": ch.RENDER_WORKERS, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import sys
+import os
+import io
+import json
+import time
+import types
+import hashlib
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+
+import cv2
+import numpy as np
+import torch
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "model"))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "model_for_face"))
+
+from bench_render import make_scanned_pdf
+
+EMBEDDING_DIM = 512  # ArcFace
+
+def install_deepface_stub():
+    """
+    Registers a stand-in ``deepface`` module when the real one is missing, so
+    the face timings run offline. represent() returns a deterministic vector
+    per input instead of running ArcFace; nothing here measures the model.
+    """
+    try:
+        import deepface  # noqa: F401
+        return False
+    except ImportError:
+        pass
+
+    def represent(img_path, **kwargs):
+        images = img_path if isinstance(img_path, list) else [img_path]
+        results = []
+        for image in images:
+            seed = int(hashlib.md5(np.ascontiguousarray(image).tobytes()).hexdigest()[:8], 16)
+            vector = np.random.default_rng(seed).normal(size=EMBEDDING_DIM)
+            results.append([{"embedding": vector.tolist()}])
+        return results if len(results) > 1 else results[0]
+
+    stub = types.ModuleType("deepface")
+    stub.DeepFace = types.SimpleNamespace(
+        represent=represent,
+        extract_faces=lambda **kwargs: [],
+        build_model=lambda **kwargs: None
+    )
+    sys.modules["deepface"] = stub
+    return True
+
+def measure(fn, repeats: int, warmup: int = 1) -> dict:
+    """Median/min wall time of fn() in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(float(np.median(timings)), 3), "min_ms": round(min(timings), 3), "repeats": repeats}
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def make_sample_image(size: int, seed: int = 0) -> bytes:
+    """A PNG of scribbled strokes standing in for a handwriting sample."""
+    rng = np.random.default_rng(seed)
+    img = np.full((size, size), 235, dtype=np.uint8)
+    for _ in range(40):
+        points = rng.integers(0, size, (2, 2))
+        cv2.line(img, tuple(map(int, points[0])), tuple(map(int, points[1])), 30, max(1, size // 300))
+    return cv2.imencode(".png", img)[1].tobytes()
+
+def bench_handwriting(args, results: dict) -> None:
+    import compare_handwriting as ch
+    import inference_backends
+    from siamese_network import SiameseNetwork
+
+    model = SiameseNetwork(pretrained=False).eval()
+    sample_png = make_sample_image(args.image_size)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            for dpi in args.dpi:
+                pdf = make_scanned_pdf(pages, dpi)
+                pdf_path = os.path.join(tmp, f"scan_{pages}_{dpi}.pdf")
+                with open(pdf_path, "wb") as f:
+                    f.write(pdf)
+                results[f"handwriting.convert_to_image.pages={pages}.dpi={dpi}"] = measure(
+                    lambda: ch.convert_to_image(pdf_path, "bench"), args.repeats)
+
+        image = ch.convert_bytes_to_image(sample_png, "sample.png", "bench")[0]
+        results[f"handwriting.preprocess_image.size={args.image_size}"] = measure(
+            lambda: ch.preprocess_image(image), args.repeats)
+
+        for batch_size in args.batch_sizes:
+            batch = torch.randn(batch_size, 3, 224, 224)
+
+            def forward():
+                with torch.no_grad():
+                    model.forward_once(batch)
+            results[f"handwriting.forward_once.batch={batch_size}"] = measure(forward, args.repeats)
+
+        # End to end through main(): random weights, in-memory files, no embedding cache
+        weights_path = os.path.join(tmp, "siamese_model_contrastive.pth")
+        torch.save(model.state_dict(), weights_path)
+        inference_backends.SIAMESE_MODEL_PATH = weights_path
+        ch.open_embedding_store = lambda *args, **kwargs: None
+        for pages in args.pages:
+            files = [("handwriting_sample_bench.png", sample_png),
+                     ("latest_assignment_bench.pdf", make_scanned_pdf(pages, args.dpi[0]))]
+            ch.load_files = lambda student_id, source, files=files: files
+
+            def end_to_end():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    ch.main("bench", source="mongo")
+            results[f"handwriting.main.pages={pages}.dpi={args.dpi[0]}"] = measure(end_to_end, args.repeats)
+
+def write_face_store(prefix: str, students: int, seed: int = 0) -> None:
+    """Writes a FaceStore with ``students`` random embeddings in one go."""
+    from face_store import FaceStore
+    store = FaceStore(prefix)
+    embeddings = np.random.default_rng(seed).normal(size=(students, EMBEDDING_DIM)).astype("<f4")
+    store._write_meta(EMBEDDING_DIM)
+    with open(store.emb_path, "wb") as f:
+        f.write(embeddings.tobytes())
+    with open(store.index_path, "w", encoding="utf-8") as f:
+        f.writelines(f"S{i},Student {i}\n" for i in range(students))
+
+def bench_face(args, results: dict) -> None:
+    from face_recognition_system import ArcFaceSystem
+
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # ArcFaceSystem reads registered_students.* from the working directory
+        try:
+            for students in args.students:
+                for name in os.listdir(tmp):
+                    os.remove(os.path.join(tmp, name))
+                write_face_store("registered_students", students)
+                system = ArcFaceSystem()
+                results[f"face.load_registered_students.students={students}"] = measure(
+                    system.load_registered_students, args.repeats)
+
+                queries = np.random.default_rng(1).normal(size=(args.faces, EMBEDDING_DIM)).astype(np.float32)
+                results[f"face.match_faces.students={students}.faces={args.faces}"] = measure(
+                    lambda: system.match_faces(queries), args.repeats)
+                results[f"face.best_matches.students={students}.faces={args.faces}"] = measure(
+                    lambda: system.gallery.best_matches(queries, system.threshold), args.repeats)
+
+                crops = [np.random.default_rng(i).random((112, 112, 3)) for i in range(args.faces)]
+                results[f"face.embed_faces.faces={args.faces}"] = measure(
+                    lambda: system._embed_faces(crops), args.repeats)
+        finally:
+            os.chdir(previous_dir)
+
+def compare_runs(baseline: dict, current: dict) -> dict:
+    """Per-benchmark current/baseline median ratio; > 1 means slower than the baseline."""
+    return {
+        key: round(current["results"][key]["median_ms"] / max(baseline["results"][key]["median_ms"], 1e-9), 3)
+        for key in sorted(set(baseline.get("results", {})) & set(current["results"]))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Timing suite for the handwriting and face pipelines.")
+    parser.add_argument("--suite", choices=["all", "handwriting", "face"], default="all")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 3, 10])
+    parser.add_argument("--dpi", type=int, nargs="+", default=[150, 300])
+    parser.add_argument("--image-size", type=int, default=1200, help="Side of the synthetic handwriting sample.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 3, 10])
+    parser.add_argument("--students", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--faces", type=int, default=60, help="Faces per classroom photo.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+    parser.add_argument("--compare", help="Earlier report to compute median ratios against.")
+    args = parser.parse_args()
+
+    stubbed = install_deepface_stub()
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+            "deepface_stub": stubbed,
+            "args": vars(args)
+        },
+        "results": {}
+    }
+
+    if args.suite in ("all", "handwriting"):
+        bench_handwriting(args, report["results"])
+    if args.suite in ("all", "face"):
+        bench_face(args, report["results"])
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["ratio_to_baseline"] = compare_runs(json.load(f), report)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"Wrote {len(report['results'])} results to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
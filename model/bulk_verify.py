@@ -0,0 +1,269 @@
+import os
+import io
+import sys
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, List, Optional
+
+import numpy as np
+import torch
+
+import compare_handwriting as ch
+from embedding_store import compute_content_hash
+from fetch_file import (CONTENT_TYPE_EXTENSIONS, FILE_PROJECTION, FetchError, close_client,
+                        find_handwriting_sample, find_latest_assignment, get_collection)
+from inference_backends import BACKENDS
+from preprocessing import preprocess_batch
+
+# Fields read from each assignment document; skips names, marks, etc.
+ASSIGNMENT_PROJECTION = {"studentId": 1, "fileData": 1, "contentType": 1, "uploadDate": 1}
+
+def iter_assignments(collection, student_ids: Optional[List[str]] = None,
+                     since: Optional[datetime] = None, cursor_batch: int = 16) -> Iterator[dict]:
+    """
+    Yields the assignment documents to verify. With ``since`` that is every
+    assignment uploaded on or after it (optionally limited to ``student_ids``),
+    streamed oldest first through one cursor. Without it, the latest
+    assignment of each listed student, which is what the single-student route
+    checks.
+    """
+    if since is None:
+        if not student_ids:
+            raise ValueError("Pass --since and/or --student_ids.")
+        for student_id in student_ids:
+            document = find_latest_assignment(collection, student_id, ASSIGNMENT_PROJECTION)
+            if document:
+                yield document
+            else:
+                yield {"studentId": student_id, "missing": True}
+        return
+
+    query = {"fileCategory": "assignment", "uploadDate": {"$gte": since}}
+    if student_ids:
+        query["studentId"] = {"$in": student_ids}
+    yield from collection.find(query, ASSIGNMENT_PROJECTION, batch_size=cursor_batch).sort("uploadDate", 1)
+
+def init_worker() -> None:
+    """Decode workers: one render/torch thread each, since the pool already spans the cores."""
+    torch.set_num_threads(1)
+    ch.RENDER_WORKERS = 1
+    logging.getLogger().setLevel(logging.WARNING)
+
+def decode_file(file_name: str, data: bytes, student_id: str, channels: int = 3, sample: bool = False):
+    """
+    Renders and preprocesses a file's selected pages in a worker process
+    (only the first one for a handwriting ``sample``). Returns (page_indices,
+    content_hash, (pages, channels, 224, 224) float array), or None when the
+    file cannot be decoded.
+    """
+    if sample:
+        page_indices = ch.get_sample_page_indices(data, file_name, student_id)
+    else:
+        page_indices = ch.get_page_indices(data, file_name, student_id)[:ch.MAX_PAGES_TO_PROCESS]
+    if not page_indices:
+        return None
+    images = ch.convert_bytes_to_image(data, file_name, student_id, page_indices=page_indices)
+    if len(images) != len(page_indices):
+        return None
+    batch = preprocess_batch(images, channels)
+    return page_indices, compute_content_hash(data), batch
+
+def decode_job(student_id: str, sample, assignment, channels: int = 3):
+    """Decodes an assignment, plus the student's sample when it has not been embedded yet."""
+    decoded_sample = decode_file(*sample, student_id, channels, sample=True) if sample is not None else None
+    if sample is not None and decoded_sample is None:
+        raise ValueError(f"Could not convert handwriting sample to image: {sample[0]}")
+    decoded_assignment = decode_file(*assignment, student_id, channels)
+    if decoded_assignment is None:
+        raise ValueError(f"Could not convert assignment to images: {assignment[0]}")
+    return decoded_sample, decoded_assignment
+
+class BulkVerifier:
+    """
+    Verifies a stream of assignment documents. A process pool renders and
+    preprocesses pages while the main process batches whatever is already
+    decoded into one forward pass, so inference never waits for the slowest
+    file. Results are written as NDJSON as soon as their batch finishes.
+
+    Each student's handwriting sample is fetched and embedded once. Fresh
+    page embeddings are written to the embedding store when one is
+    configured, so later single-student checks of the same files hit the cache.
+    """
+
+    def __init__(self, collection, model, device: str, store=None, workers: int = None,
+                 batch_size: int = 32, out=None):
+        self.collection = collection
+        self.model = model
+        self.device = device
+        self.store = store
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.out = out or sys.stdout
+        self.samples = {}  # student_id -> (file_name, data) or None when missing
+        self.sample_embeddings = {}
+        self.stats = {"verified": 0, "matched": 0, "errors": 0}
+
+    def _sample_for(self, student_id: str):
+        if student_id not in self.samples:
+            document = find_handwriting_sample(self.collection, student_id, FILE_PROJECTION)
+            extension = CONTENT_TYPE_EXTENSIONS.get(document.get("contentType")) if document else None
+            self.samples[student_id] = (
+                (f"handwriting_sample_{student_id}{extension}", bytes(document["fileData"])) if extension else None
+            )
+        return self.samples[student_id]
+
+    def _emit(self, result: dict) -> None:
+        if result.get("status") == "success":
+            self.stats["verified"] += 1
+            self.stats["matched"] += int(result["matched"])
+        else:
+            self.stats["errors"] += 1
+        self.out.write(json.dumps(result) + "\n")
+        self.out.flush()
+
+    def _submit(self, executor, document: dict):
+        """Queues one document for decoding; returns (meta, future) or None if it failed up front."""
+        student_id = str(document.get("studentId"))
+        meta = {"student_id": student_id}
+        if document.get("missing"):
+            self._emit({**meta, "status": "error", "message": "assignment_not_found"})
+            return None
+
+        meta["assignment_id"] = str(document["_id"])
+        if document.get("uploadDate"):
+            meta["upload_date"] = document["uploadDate"].isoformat()
+        extension = CONTENT_TYPE_EXTENSIONS.get(document.get("contentType"))
+        sample = self._sample_for(student_id)
+        if not extension or sample is None:
+            message = "failed_to_save_assignment" if not extension else "handwriting_sample_not_found"
+            self._emit({**meta, "status": "error", "message": message})
+            return None
+
+        # Same name as the single-student route, so the same pages are sampled
+        assignment = (f"latest_assignment_{student_id}{extension}", bytes(document["fileData"]))
+        pending_sample = None if student_id in self.sample_embeddings else sample
+        channels = getattr(self.model, "input_channels", 3)
+        return meta, executor.submit(decode_job, student_id, pending_sample, assignment, channels)
+
+    def _run_batch(self, ready: list) -> None:
+        """One forward pass over every page of the decoded documents in ``ready``."""
+        arrays, offsets = [], []
+        for meta, (decoded_sample, decoded_assignment) in ready:
+            for decoded in (decoded_sample, decoded_assignment):
+                if decoded is None:
+                    offsets.append(None)
+                    continue
+                offsets.append((sum(len(a) for a in arrays), len(decoded[2])))
+                arrays.append(decoded[2])
+
+        with torch.no_grad():
+            embeddings = self.model.forward_once(torch.from_numpy(np.concatenate(arrays)).to(self.device))
+
+        for index, (meta, (decoded_sample, decoded_assignment)) in enumerate(ready):
+            sample_span, assignment_span = offsets[2 * index], offsets[2 * index + 1]
+            if sample_span is not None:
+                self.sample_embeddings.setdefault(meta["student_id"], embeddings[sample_span[0]:sample_span[0] + 1])
+            page_embs = embeddings[assignment_span[0]:assignment_span[0] + assignment_span[1]]
+            if self.store is not None:
+                self._cache(decoded_sample, embeddings, sample_span, meta.get("assignment_id"))
+                self._cache(decoded_assignment, embeddings, assignment_span, meta.get("assignment_id"))
+            similarities = ch.similarity_scores(self.sample_embeddings[meta["student_id"]], page_embs)
+            self._emit({**meta, **ch.build_result(similarities)})
+
+    def _cache(self, decoded, embeddings, span, file_id) -> None:
+        if decoded is None:
+            return
+        page_indices, content_hash, _ = decoded
+        fresh = dict(zip(page_indices, embeddings[span[0]:span[0] + span[1]].cpu().numpy()))
+        try:
+            self.store.put_many(content_hash, fresh, file_id=file_id)
+        except Exception as e:
+            logging.warning(f"Embedding cache write failed: {e}")
+
+    def run(self, documents: Iterator[dict]) -> dict:
+        """
+        Streams ``documents`` through the pool. At most two documents per
+        worker are in flight, so memory stays flat however large the class is.
+        A batch is run as soon as it holds ``batch_size`` pages or nothing
+        else has finished decoding, which keeps the first results quick.
+        """
+        started = time.perf_counter()
+        documents = iter(documents)
+        in_flight, ready, exhausted = {}, [], False
+        # Forked workers inherit the imported decoders (like DataLoader workers);
+        # spawn would re-import torch in every one before the first page
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=init_worker) as executor:
+            while True:
+                while not exhausted and len(in_flight) < 2 * self.workers:
+                    document = next(documents, None)
+                    if document is None:
+                        exhausted = True
+                    else:
+                        submitted = self._submit(executor, document)
+                        if submitted is not None:
+                            in_flight[submitted[1]] = submitted[0]
+                if not in_flight and not ready:
+                    break
+
+                done = set()
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=0 if ready else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    meta = in_flight.pop(future)
+                    try:
+                        ready.append((meta, future.result()))
+                    except Exception as e:
+                        self._emit({**meta, "status": "error", "message": str(e)})
+
+                pages = sum(len(decoded[2]) for _, pair in ready for decoded in pair if decoded is not None)
+                if ready and (pages >= self.batch_size or not done or not in_flight):
+                    try:
+                        self._run_batch(ready)
+                    except Exception as e:
+                        logging.error(f"Batch inference failed: {e}")
+                        for meta, _ in ready:
+                            self._emit({**meta, "status": "error", "message": str(e)})
+                    ready = []
+
+        self.stats["seconds"] = round(time.perf_counter() - started, 2)
+        total = self.stats["verified"] + self.stats["errors"]
+        self.stats["per_second"] = round(total / self.stats["seconds"], 2) if self.stats["seconds"] else None
+        return self.stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify many assignments against their handwriting samples, streaming NDJSON.")
+    parser.add_argument("--student_ids", nargs="+", help="Students to check, e.g. one class.")
+    parser.add_argument("--since", type=datetime.fromisoformat,
+                        help="Check every assignment uploaded on or after this date (YYYY-MM-DD).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Decode processes.")
+    parser.add_argument("--batch-size", type=int, default=32, help="Pages per forward pass.")
+    parser.add_argument("--backend", choices=BACKENDS, default=ch.INFERENCE_BACKEND)
+    args = parser.parse_args()
+    if not args.since and not args.student_ids:
+        parser.error("pass --since and/or --student_ids")
+
+    device = ch.select_device(args.backend)
+    model = ch.load_siamese_model(device, args.backend)
+    verifier = BulkVerifier(get_collection(), model, device, ch.open_embedding_store(args.backend),
+                            workers=args.workers, batch_size=args.batch_size)
+    stats = verifier.run(iter_assignments(verifier.collection, args.student_ids, args.since))
+    logging.info(f"Bulk verification finished: {stats}")
+
+if __name__ == "__main__":
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    try:
+        main()
+    except Exception as e:
+        logging.error(f"Bulk verification failed: {e}", exc_info=not isinstance(e, FetchError))
+        sys.stdout.write(json.dumps({"status": "error", "message": str(e)}) + "\n")
+        sys.exit(1)
+    finally:
+        close_client()
+        sys.stdout.flush()
@@ -10,10 +10,17 @@ import argparse
 import random
 import logging
 import hashlib
-from typing import List, Optional
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
 from siamese_network import SiameseNetwork  # Assuming this file exists
-from torchvision import transforms
+from embedding_store import EmbeddingStore, compute_content_hash, compute_model_checksum
+from fetch_file import FetchError, fetch_in_memory
+from inference_backends import BACKENDS, load_backend, weights_path
+from preprocessing import INPUT_SIZE, batch_buffer, preprocess_batch
+from timing import Trace, span
 import torch.nn.functional as F
 
 # --- Constants ---
@@ -21,6 +28,14 @@ SIMILARITY_THRESHOLD = 80.0
 MAX_PAGES_TO_PROCESS = 10
 PAGES_TO_SAMPLE = 3  # How many random pages to check
 ALLOWED_EXTENSIONS = ["png", "jpg", "jpeg", "pdf"]
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")  # torch | torchscript | onnx (see export_model.py)
+PREPROCESS_VERSION = "2"  # Bump whenever rendering/preprocessing changes, to invalidate cached embeddings
+RENDER_TARGET_SIZE = INPUT_SIZE  # Model input side length
+RENDER_OVERSAMPLE = 2  # Render above the input size so the final resize still antialiases
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "4"))  # Threads used to render selected PDF pages
+VERIFY_MODES = ("full", "adaptive")
+VERIFY_MODE = os.getenv("VERIFY_MODE", "full")  # full | adaptive (lazy pages, early exit, see verify_adaptive)
+BORDERLINE_MARGIN = float(os.getenv("BORDERLINE_MARGIN", "5.0"))  # Points above the threshold that still count as borderline
 
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s', stream=sys.stderr)
@@ -28,74 +43,146 @@ logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s', st
 # --- Type Aliases for Readability ---
 ImageType = np.ndarray  # Type alias for a cv2 image
 
-def convert_to_image(path: str, student_id: str) -> List[ImageType]:
+def page_order(total_pages: int, student_id: str, file_name: str) -> List[int]:
     """
-    Converts a given file (PDF or Image) into a list of grayscale OpenCV images.
-    For PDFs, it uses a seeded random sample of pages for reproducible checks.
+    Every page of a student's file in seeded checking order. The first
+    PAGES_TO_SAMPLE entries are the usual random sample (sorted); the
+    remaining pages follow in an order drawn from the same generator, for
+    adaptive verification to take when it needs more evidence.
+    """
+    # --- Seeded Random Sampling Logic ---
+    # Create a unique, consistent seed for this specific student and file.
+    # Using a hash makes it robust.
+    seed_str = f"{student_id}-{file_name}"
+    seed = int(hashlib.md5(seed_str.encode()).hexdigest(), 16) % (10**8)
+    # A private generator keeps concurrent requests from reseeding each other.
+    rng = random.Random(seed)
+    logging.info(f"Using seed {seed} for random page selection.")
+
+    if total_pages <= PAGES_TO_SAMPLE:
+        # If the doc is short, just use all pages.
+        return list(range(total_pages))
+
+    # Otherwise, take a random sample. This will be the same "random"
+    # sample every time for this student/file combination.
+    sampled = sorted(rng.sample(range(total_pages), PAGES_TO_SAMPLE))
+    chosen = set(sampled)
+    rest = [page for page in range(total_pages) if page not in chosen]
+    rng.shuffle(rest)
+    return sampled + rest
+
+def select_pages(total_pages: int, student_id: str, file_name: str) -> List[int]:
+    """
+    Picks the seeded random sample of PDF pages to check for a student's file.
+    The same student/file combination always yields the same pages.
+    """
+    selected_pages_indices = page_order(total_pages, student_id, file_name)[:PAGES_TO_SAMPLE]
+    logging.info(f"Selected pages {', '.join(str(p+1) for p in selected_pages_indices)} out of {total_pages}.")
+    return selected_pages_indices
+
+def get_page_indices(data: bytes, file_name: str, student_id: str, ordered: bool = False) -> List[int]:
+    """
+    Returns the page indices that would be checked for a file, without rendering.
+    Images always have a single page 0. With ``ordered`` it returns the full
+    seeded checking order instead, capped at MAX_PAGES_TO_PROCESS.
+    """
+    file_ext = file_name.lower().split('.')[-1]
+    if file_ext == "pdf":
+        try:
+            with fitz.open(stream=data, filetype="pdf") as doc:
+                if ordered:
+                    return page_order(len(doc), student_id, file_name)[:MAX_PAGES_TO_PROCESS]
+                return select_pages(len(doc), student_id, file_name)
+        except Exception as e:
+            logging.error(f"Failed to open PDF {file_name}: {e}")
+            return []
+    if file_ext in ALLOWED_EXTENSIONS:
+        return [0]
+    logging.warning(f"Unsupported file type: {file_ext}")
+    return []
+
+def get_sample_page_indices(data: bytes, file_name: str, student_id: str) -> List[int]:
+    """The handwriting sample is compared through its first seeded page only, so only that page is embedded."""
+    return get_page_indices(data, file_name, student_id)[:1]
+
+def render_pdf_page(data: bytes, page_num: int) -> ImageType:
+    """
+    Renders one PDF page straight into an 8-bit grayscale image, scaled so its
+    shorter side is RENDER_TARGET_SIZE * RENDER_OVERSAMPLE pixels.
+
+    The model only ever sees a 224x224 input, so rendering at the page's full
+    resolution in colour wastes time and memory on large scanned pages. Each
+    call opens its own document because fitz documents must not be shared
+    between threads.
+    """
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        page = doc.load_page(page_num)
+        zoom = RENDER_TARGET_SIZE * RENDER_OVERSAMPLE / min(page.rect.width, page.rect.height)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+        return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+
+def convert_bytes_to_image(data: bytes, file_name: str, student_id: str,
+                           page_indices: Optional[List[int]] = None) -> List[ImageType]:
+    """
+    Decodes in-memory file bytes (PDF or Image) into a list of grayscale OpenCV images.
 
     Args:
-        path (str): The full path to the file.
+        data (bytes): The raw file contents.
+        file_name (str): The file name; its extension selects the decoder and it
+            seeds the PDF page selection.
         student_id (str): The student's ID, used to seed the random page selection.
+        page_indices (Optional[List[int]]): PDF pages to render. Defaults to the
+            seeded random sample.
 
     Returns:
         List[ImageType]: A list of images, where each image is a NumPy array.
     """
-    if not os.path.exists(path):
-        logging.error(f"File not found at path: {path}")
-        return []
-
-    file_ext = path.lower().split('.')[-1]
+    file_ext = file_name.lower().split('.')[-1]
 
     if file_ext == "pdf":
         try:
-            doc = fitz.open(path)
-            total_pages = len(doc)
-
-            # --- Seeded Random Sampling Logic ---
-            # Create a unique, consistent seed for this specific student and file.
-            # Using a hash makes it robust.
-            seed_str = f"{student_id}-{os.path.basename(path)}"
-            seed = int(hashlib.md5(seed_str.encode()).hexdigest(), 16) % (10**8)
-            random.seed(seed)
-            logging.info(f"Using seed {seed} for random page selection.")
-
-            if total_pages <= PAGES_TO_SAMPLE:
-                # If the doc is short, just use all pages.
-                selected_pages_indices = list(range(total_pages))
-            else:
-                # Otherwise, take a random sample. This will be the same "random"
-                # sample every time for this student/file combination.
-                selected_pages_indices = sorted(random.sample(range(total_pages), PAGES_TO_SAMPLE))
-            
-            logging.info(f"Selected pages {', '.join(str(p+1) for p in selected_pages_indices)} out of {total_pages}.")
-
-            images = []
-            for page_num in selected_pages_indices:
-                page = doc.load_page(page_num)
-                pix = page.get_pixmap()
-                img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
-                if img.shape[2] == 3: # RGB
-                    img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-                elif img.shape[2] == 4: # RGBA
-                    img = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
-                images.append(img)
-            return images
+            if page_indices is None:
+                page_indices = get_page_indices(data, file_name, student_id)
+            if len(page_indices) <= 1 or RENDER_WORKERS <= 1:
+                return [render_pdf_page(data, page_num) for page_num in page_indices]
+            with ThreadPoolExecutor(max_workers=min(RENDER_WORKERS, len(page_indices))) as executor:
+                return list(executor.map(lambda page_num: render_pdf_page(data, page_num), page_indices))
         except Exception as e:
-            logging.error(f"Failed to process PDF {path}: {e}")
+            logging.error(f"Failed to process PDF {file_name}: {e}")
             return []
     elif file_ext in ALLOWED_EXTENSIONS:
         try:
-            img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
             if img is None:
-                raise ValueError("cv2.imread returned None. Check file integrity.")
+                raise ValueError("cv2.imdecode returned None. Check file integrity.")
             return [img]
         except Exception as e:
-            logging.error(f"Failed to read image {path}: {e}")
+            logging.error(f"Failed to read image {file_name}: {e}")
             return []
     else:
         logging.warning(f"Unsupported file type: {file_ext}")
         return []
 
+def convert_to_image(path: str, student_id: str) -> List[ImageType]:
+    """
+    Converts a given file (PDF or Image) into a list of grayscale OpenCV images.
+    For PDFs, it uses a seeded random sample of pages for reproducible checks.
+
+    Args:
+        path (str): The full path to the file.
+        student_id (str): The student's ID, used to seed the random page selection.
+
+    Returns:
+        List[ImageType]: A list of images, where each image is a NumPy array.
+    """
+    if not os.path.exists(path):
+        logging.error(f"File not found at path: {path}")
+        return []
+
+    with open(path, "rb") as f:
+        data = f.read()
+    return convert_bytes_to_image(data, os.path.basename(path), student_id)
+
 def find_file_with_prefix(folder: str, prefix: str) -> Optional[str]:
     """
     Finds the first file in a folder that matches a prefix and allowed extensions.
@@ -109,39 +196,145 @@ def find_file_with_prefix(folder: str, prefix: str) -> Optional[str]:
 
 def preprocess_image(img_array: ImageType) -> torch.Tensor:
     """
-    Preprocesses a NumPy image array into a PyTorch tensor for the Siamese model.
+    Preprocesses a NumPy image array into a (1, 3, 224, 224) ImageNet-normalised
+    tensor for the exported (RGB-input) Siamese models.
     """
-    if len(img_array.shape) == 2:
-        img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
-
-    transform = transforms.Compose([
-        transforms.ToPILImage(),
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ])
-    return transform(img_array).unsqueeze(0)
+    return torch.from_numpy(preprocess_batch([img_array]))
 
-def compare_images_siamese(img1: ImageType, img2: ImageType, model: SiameseNetwork, device: str) -> float:
+def embed_images(images: List[ImageType], model: SiameseNetwork, device: str) -> torch.Tensor:
     """
-    Compares two images using the Siamese model and returns a similarity score.
+    Embeds a list of images with a single batched forward pass. Pages are
+    resized into this thread's reusable batch buffer, as one channel when the
+    model has a folded grayscale stem (the eager torch backend) and as three
+    normalised channels otherwise.
+
+    Returns:
+        torch.Tensor: An (N, 128) tensor of L2-normalised embeddings.
     """
-    t1 = preprocess_image(img1).to(device)
-    t2 = preprocess_image(img2).to(device)
+    channels = getattr(model, "input_channels", 3)
+    with span("preprocess"):
+        batch = preprocess_batch(images, channels, out=batch_buffer(len(images), channels))
+        batch = torch.from_numpy(batch).to(device)
+    with span("inference"), torch.no_grad():
+        return model.forward_once(batch)
 
+def similarity_scores(sample_emb: torch.Tensor, page_embs: torch.Tensor) -> List[float]:
+    """
+    Converts embedding distances between one sample and several pages into
+    similarity percentages, in page order.
+    """
     with torch.no_grad():
-        emb1 = model.forward_once(t1)
-        emb2 = model.forward_once(t2)
-        distance = F.pairwise_distance(emb1, emb2).item()
-        similarity = max(0, 1 - distance)
-    
-    return round(similarity * 100, 2)
+        distances = F.pairwise_distance(sample_emb.expand_as(page_embs), page_embs)
 
-def main(student_id: str) -> None:
+    return [round(max(0, 1 - distance) * 100, 2) for distance in distances.tolist()]
+
+def compare_images_siamese(sample_img: ImageType, page_imgs: List[ImageType], model: SiameseNetwork, device: str) -> List[float]:
     """
-    Main execution function to compare handwriting samples.
+    Compares one handwriting sample against several pages using the Siamese model.
+
+    The sample is embedded once and all pages (capped at MAX_PAGES_TO_PROCESS)
+    are embedded in a single batched forward pass, so the scores are the same
+    as comparing each pair on its own.
+
+    Returns:
+        List[float]: One similarity percentage per page, in input order.
     """
-    logging.info(f"Starting handwriting comparison for student: {student_id}")
+    sample_emb = embed_images([sample_img], model, device)
+    page_embs = embed_images(page_imgs[:MAX_PAGES_TO_PROCESS], model, device)
+    return similarity_scores(sample_emb, page_embs)
+
+def get_file_embeddings(data: bytes, file_name: str, student_id: str, model: SiameseNetwork, device: str,
+                        store: Optional[EmbeddingStore] = None, file_id=None,
+                        page_indices: Optional[List[int]] = None) -> Tuple[Optional[torch.Tensor], int]:
+    """
+    Returns the embeddings of a file's selected pages (or of ``page_indices``),
+    reusing cached entries from the embedding store and rendering only the
+    pages that are missing.
+
+    Returns:
+        Tuple[Optional[torch.Tensor], int]: The (pages, 128) embeddings in page
+        order (None if the file could not be decoded) and the number of pages
+        that had to be rendered and embedded.
+    """
+    if page_indices is None:
+        with span("page_selection"):
+            page_indices = get_page_indices(data, file_name, student_id)
+    if not page_indices:
+        return None, 0
+
+    content_hash = compute_content_hash(data)
+    cached = {}
+    if store is not None:
+        try:
+            with span("cache_lookup"):
+                cached = store.get_many(content_hash, page_indices)
+        except Exception as e:
+            logging.warning(f"Embedding cache lookup failed: {e}")
+
+    missing = [page for page in page_indices if page not in cached]
+    if missing:
+        with span("render"):
+            images = convert_bytes_to_image(data, file_name, student_id, page_indices=missing)
+        if len(images) != len(missing):
+            return None, 0
+        fresh = dict(zip(missing, embed_images(images, model, device).cpu().numpy()))
+        if store is not None:
+            try:
+                with span("cache_write"):
+                    store.put_many(content_hash, fresh, file_id=file_id)
+            except Exception as e:
+                logging.warning(f"Embedding cache write failed: {e}")
+        cached.update(fresh)
+
+    logging.info(f"{file_name}: {len(page_indices) - len(missing)} cached page(s), {len(missing)} embedded.")
+    embeddings = torch.from_numpy(np.stack([cached[page] for page in page_indices])).to(device)
+    return embeddings, len(missing)
+
+def get_model_checksum(backend: str = INFERENCE_BACKEND) -> str:
+    """Returns the checksum that versions cached embeddings for the current model."""
+    return compute_model_checksum(weights_path(backend), extra=PREPROCESS_VERSION)
+
+def select_device(backend: str = INFERENCE_BACKEND) -> str:
+    """CUDA when available for the eager model; the exported backends run on CPU."""
+    return "cuda" if backend == "torch" and torch.cuda.is_available() else "cpu"
+
+def load_siamese_model(device: str, backend: str = INFERENCE_BACKEND) -> SiameseNetwork:
+    """
+    Loads the trained contrastive model through the selected inference backend.
+    Every backend exposes forward_once(batch), so the rest of the pipeline does
+    not care which one is in use.
+
+    The ImageNet backbone weights are not fetched because the state dict
+    overwrites every parameter anyway.
+    """
+    logging.info(f"Inference backend: {backend}")
+    return load_backend(backend, device)
+
+def live_model_checksums() -> set:
+    """Checksums of every backend whose weights are on disk; their cache entries are not stale."""
+    return {get_model_checksum(backend) for backend in BACKENDS if os.path.exists(weights_path(backend))}
+
+def open_embedding_store(backend: str = INFERENCE_BACKEND) -> Optional[EmbeddingStore]:
+    """
+    Connects to the embedding cache for the current model. Returns None if
+    the cache is unavailable. Entries from older weights are left for
+    ``embedding_store.py purge``: other backends and instances mid-rollout
+    share the collection, so a request must not delete their entries.
+    """
+    if not os.path.exists(weights_path(backend)):
+        return None
+    return EmbeddingStore.from_env(get_model_checksum(backend))
+
+def load_files(student_id: str, source: str) -> List[Tuple[str, bytes]]:
+    """
+    Loads the handwriting sample and latest assignment as (file_name, data) pairs.
+
+    ``source="disk"`` reads what fetch_file.py wrote into fetched_files.
+    ``source="mongo"`` pulls both documents straight from MongoDB and keeps the
+    bytes in memory, so concurrent verifications never share a directory.
+    """
+    if source == "mongo":
+        return fetch_in_memory(student_id)
 
     script_dir = os.path.dirname(__file__)
     folder = os.path.join(script_dir, "fetched_files")
@@ -152,33 +345,95 @@ def main(student_id: str) -> None:
     if not sample_path or not assignment_path:
         raise FileNotFoundError("One or both required files are missing.")
 
-    sample_imgs = convert_to_image(sample_path, student_id)
-    if not sample_imgs:
-        raise ValueError(f"Could not convert handwriting sample to image: {sample_path}")
-    
-    assignment_imgs = convert_to_image(assignment_path, student_id)
-    if not assignment_imgs:
-        raise ValueError(f"Could not convert assignment to images: {assignment_path}")
+    files = []
+    for path in (sample_path, assignment_path):
+        with open(path, "rb") as f:
+            files.append((os.path.basename(path), f.read()))
+    return files
+
+def verify(student_id: str, siamese_model: SiameseNetwork, device: str,
+           store: Optional[EmbeddingStore] = None, source: str = "disk", mode: str = VERIFY_MODE) -> dict:
+    """
+    Compares the handwriting sample with the latest assignment using an
+    already loaded model and returns the result dictionary. Page embeddings are
+    read from and written to ``store`` when one is given. ``mode="adaptive"``
+    checks pages lazily (see verify_adaptive) instead of the whole sample.
+    """
+    if mode not in VERIFY_MODES:
+        raise ValueError(f"Unknown verification mode '{mode}', expected one of {', '.join(VERIFY_MODES)}")
+    logging.info(f"Starting handwriting comparison for student: {student_id}")
+
+    with span("fetch"):
+        (sample_name, sample_data), (assignment_name, assignment_data) = load_files(student_id, source)
+
+    sample_embs, _ = get_file_embeddings(
+        sample_data, sample_name, student_id, siamese_model, device, store,
+        page_indices=get_sample_page_indices(sample_data, sample_name, student_id)
+    )
+    if sample_embs is None:
+        raise ValueError(f"Could not convert handwriting sample to image: {sample_name}")
 
-    logging.info(f"Loaded handwriting sample and {len(assignment_imgs)} assignment page(s).")
+    if mode == "adaptive":
+        return verify_adaptive(sample_embs, assignment_data, assignment_name, student_id,
+                               siamese_model, device, store)
     
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    logging.info(f"Using device: {device}")
+    assignment_embs, _ = get_file_embeddings(
+        assignment_data, assignment_name, student_id, siamese_model, device, store
+    )
+    if assignment_embs is None:
+        raise ValueError(f"Could not convert assignment to images: {assignment_name}")
+
+    logging.info(f"Loaded handwriting sample and {len(assignment_embs)} assignment page(s).")
+
+    similarities_siamese = similarity_scores(sample_embs, assignment_embs[:MAX_PAGES_TO_PROCESS])
+    for idx, sim_siamese in enumerate(similarities_siamese):
+        logging.info(f"[Page check {idx+1}/{len(similarities_siamese)}] Siamese Similarity: {sim_siamese}%")
+
+    return build_result(similarities_siamese)
+
+def verify_adaptive(sample_emb: torch.Tensor, data: bytes, file_name: str, student_id: str,
+                    model: SiameseNetwork, device: str, store: Optional[EmbeddingStore] = None) -> dict:
+    """
+    Renders and scores assignment pages one at a time in the seeded order.
+
+    - A page below SIMILARITY_THRESHOLD decides the mismatch, so checking stops there.
+    - Once the usual PAGES_TO_SAMPLE pages pass, checking stops if every
+      score is at least BORDERLINE_MARGIN points clear of the threshold.
+    - Otherwise further seeded pages are checked, up to MAX_PAGES_TO_PROCESS,
+      until one fails or the pages run out.
+    """
+    with span("page_selection"):
+        order = get_page_indices(data, file_name, student_id, ordered=True)
+    if not order:
+        raise ValueError(f"Could not convert assignment to images: {file_name}")
 
-    siamese_model_path = os.path.join(script_dir, "siamese_model_contrastive.pth")
-    if not os.path.exists(siamese_model_path):
-        raise FileNotFoundError(f"Siamese model not found at: {siamese_model_path}")
+    scores, stop_reason = [], "exhausted"
+    for page in order:
+        page_embs, _ = get_file_embeddings(data, file_name, student_id, model, device, store, page_indices=[page])
+        if page_embs is None:
+            raise ValueError(f"Could not convert assignment to images: {file_name}")
+        score = similarity_scores(sample_emb, page_embs)[0]
+        scores.append(score)
+        logging.info(f"[Page check {len(scores)}, page {page + 1}] Siamese Similarity: {score}%")
 
-    siamese_model = SiameseNetwork().to(device)
-    siamese_model.load_state_dict(torch.load(siamese_model_path, map_location=device))
-    siamese_model.eval()
+        if score < SIMILARITY_THRESHOLD:
+            stop_reason = "failed_page"
+            break
+        if len(scores) >= PAGES_TO_SAMPLE and min(scores) >= SIMILARITY_THRESHOLD + BORDERLINE_MARGIN:
+            stop_reason = "confident"
+            break
 
-    similarities_siamese = []
-    for idx, assignment_img in enumerate(assignment_imgs):
-        sim_siamese = compare_images_siamese(sample_imgs[0], assignment_img, siamese_model, device)
-        similarities_siamese.append(sim_siamese)
-        logging.info(f"[Page check {idx+1}/{len(assignment_imgs)}] Siamese Similarity: {sim_siamese}%")
+    result = build_result(scores)
+    result["pages_available"] = len(order)
+    result["stop_reason"] = stop_reason
+    logging.info(f"Adaptive check evaluated {len(scores)} of {len(order)} candidate page(s).")
+    return result
 
+def build_result(similarities_siamese: List[float]) -> dict:
+    """
+    Turns per-page similarities into the result dictionary: a match needs the
+    average and every single page to reach SIMILARITY_THRESHOLD.
+    """
     if not similarities_siamese:
         raise ValueError("No similarities were calculated.")
 
@@ -186,26 +441,118 @@ def main(student_id: str) -> None:
     is_matched = (average_siamese_similarity >= SIMILARITY_THRESHOLD and 
                   all(score >= SIMILARITY_THRESHOLD for score in similarities_siamese))
 
-    result = {
+    return {
         "status": "success",
         "average_similarity": average_siamese_similarity,
         "matched": is_matched,
         "individual_similarities": similarities_siamese,
-        "threshold": SIMILARITY_THRESHOLD
+        "threshold": SIMILARITY_THRESHOLD,
+        "pages_evaluated": len(similarities_siamese)
     }
-    
-    sys.stdout.write(json.dumps(result))
+
+def main(student_id: str, source: str = "disk", backend: str = INFERENCE_BACKEND, mode: str = VERIFY_MODE) -> None:
+    """
+    Main execution function to compare handwriting samples. With
+    PIPELINE_TIMINGS=1 the result carries per-stage "spans" in ms.
+    """
+    device = select_device(backend)
+    logging.info(f"Using device: {device}")
+
+    with Trace("verify") as trace:
+        with span("model_load"):
+            siamese_model = load_siamese_model(device, backend)
+        with span("embedding_store"):
+            store = open_embedding_store(backend)
+        result = verify(student_id, siamese_model, device, store, source, mode)
+    sys.stdout.write(json.dumps(trace.attach(result)))
+
+def serve(concurrency: int = 1, backend: str = INFERENCE_BACKEND, source: str = "disk",
+          mode: str = VERIFY_MODE) -> None:
+    """
+    Runs a long-lived worker that answers newline-delimited JSON requests.
+
+    Each stdin line is an object such as {"id": 1, "student_id": "abc",
+    "source": "mongo"}. Each reply is one stdout line holding the same result
+    JSON as a one-shot run, plus the request "id", "latency_ms" and "cold". The
+    model is loaded on the first request, so only that reply is marked cold.
+    A request with "profile": true is profiled regardless of PIPELINE_PROFILE.
+    "source" and "mode" default to ``source`` and ``mode`` (--source/--mode)
+    and can be overridden per request.
+
+    With ``concurrency`` > 1 requests are handled on a thread pool; only use
+    that with the in-memory "mongo" source, as "disk" shares fetched_files.
+    """
+    device = select_device(backend)
+    logging.info(f"Worker started with concurrency {concurrency}. Using device: {device}")
+    state = {"model": None, "store": None}
+    load_lock = threading.Lock()
+    write_lock = threading.Lock()
+
+    def handle(line: str) -> None:
+        started = time.perf_counter()
+        cold = False
+        request_id = None
+        trace = Trace("verify")
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            student_id = request.get("student_id")
+            if not student_id:
+                raise ValueError("Missing student_id in request.")
+            if request.get("profile"):
+                trace = Trace("verify", profile=True)
+
+            with trace:
+                with load_lock:
+                    if state["model"] is None:
+                        cold = True
+                        with span("model_load"):
+                            state["model"] = load_siamese_model(device, backend)
+                            state["store"] = open_embedding_store(backend)
+                result = verify(str(student_id), state["model"], device, state["store"],
+                                request.get("source", source), request.get("mode", mode))
+        except Exception as e:
+            logging.error(f"Worker request failed: {e}", exc_info=not isinstance(e, FetchError))
+            result = {"status": "error", "message": str(e)}
+
+        trace.attach(result)
+        result["id"] = request_id
+        result["cold"] = cold
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        logging.info(f"Request {request_id} served in {result['latency_ms']} ms ({'cold' if cold else 'warm'}).")
+        with write_lock:
+            sys.stdout.write(json.dumps(result) + "\n")
+            sys.stdout.flush()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for line in sys.stdin:
+            line = line.strip()
+            if line:
+                executor.submit(handle, line)
 
 if __name__ == "__main__":
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     parser = argparse.ArgumentParser(description="Compare handwriting sample with an assignment.")
-    parser.add_argument("--student_id", required=True, help="The ID of the student to process.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--student_id", help="The ID of the student to process.")
+    group.add_argument("--serve", action="store_true", help="Run as a resident worker reading NDJSON requests from stdin.")
+    parser.add_argument("--source", choices=["disk", "mongo"], default="disk",
+                        help="Read files from fetched_files (disk) or straight from MongoDB in memory (mongo).")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests handled in parallel in --serve mode.")
+    parser.add_argument("--backend", choices=BACKENDS, default=INFERENCE_BACKEND,
+                        help="Inference backend; torchscript/onnx need the artifacts from export_model.py.")
+    parser.add_argument("--mode", choices=VERIFY_MODES, default=VERIFY_MODE,
+                        help="full: score the whole page sample; adaptive: lazy pages with early exit.")
     args = parser.parse_args()
     
+    if args.serve:
+        serve(args.concurrency, args.backend, args.source, args.mode)
+        sys.exit(0)
+
     try:
-        main(args.student_id)
+        main(args.student_id, args.source, args.backend, args.mode)
     except Exception as e:
-        logging.error(f"An unhandled exception occurred: {e}", exc_info=True)
+        logging.error(f"An unhandled exception occurred: {e}", exc_info=not isinstance(e, FetchError))
         result = {"status": "error", "message": str(e)}
         sys.stdout.write(json.dumps(result))
         sys.exit(1)
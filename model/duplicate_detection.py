@@ -0,0 +1,286 @@
+import os
+import io
+import sys
+import json
+import logging
+import argparse
+from collections import Counter
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+import fitz  # PyMuPDF
+import numpy as np
+
+import compare_handwriting as ch
+from fetch_file import CONTENT_TYPE_EXTENSIONS, FetchError, close_client, get_collection
+from inference_backends import BACKENDS
+
+# The IVF index is shared with the face gallery in ../model_for_face
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model_for_face'))
+from face_index import IVFIndex
+
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "97.0"))  # Page similarity (%) reported as a copy
+ANN_MIN_PAGES = 5000  # Below this the index has a single list, i.e. exact search
+SAVE_EVERY = 50  # Assignments indexed between checkpoints, so an interrupted run keeps its work
+ASSIGNMENT_PROJECTION = {"studentId": 1, "fileData": 1, "contentType": 1, "uploadDate": 1}
+
+def similarity_from_cosine(cosine: np.ndarray) -> np.ndarray:
+    """The percentage compare_handwriting reports, (1 - L2 distance) * 100, for unit vectors."""
+    distance = np.sqrt(np.maximum(0.0, 2.0 - 2.0 * cosine))
+    return np.round(np.maximum(0.0, 1.0 - distance) * 100, 2)
+
+def cosine_from_similarity(similarity: float) -> float:
+    distance = 1.0 - similarity / 100
+    return 1.0 - distance * distance / 2
+
+class PageIndex:
+    """
+    Every embedded assignment page of a course with its owner, persisted as
+    ``<prefix>.pages.npz`` plus the IVF layout in ``<prefix>.ivf.npz``.
+
+    Until ANN_MIN_PAGES the IVF has one list, so search is exact. Past that
+    it has sqrt(pages) lists, retrained whenever the index has doubled since
+    the last training, so each page is compared with about
+    nprobe * sqrt(pages) others instead of all of them.
+    """
+
+    def __init__(self, prefix: str, model_checksum: str):
+        self.prefix = prefix
+        self.model_checksum = model_checksum
+        # Grown by doubling, so adding one assignment does not copy every page
+        self._buffer = np.empty((0, 128), dtype=np.float32)
+        self.size = 0
+        self.student_ids: List[str] = []
+        self.assignment_ids: List[str] = []
+        self.pages: List[int] = []
+        self.student_pages = Counter()  # student_id -> indexed pages
+        self.last_upload = None
+        self.trained_size = 0
+        self.ivf = None
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._buffer[:self.size]
+
+    @property
+    def pages_path(self) -> str:
+        return f"{self.prefix}.pages.npz"
+
+    @property
+    def ivf_path(self) -> str:
+        return f"{self.prefix}.ivf.npz"
+
+    def load(self) -> bool:
+        """Restores a saved index. Returns False (and stays empty) if there is none or the model changed."""
+        if not os.path.exists(self.pages_path):
+            return False
+        data = np.load(self.pages_path)
+        if str(data["model_checksum"]) != self.model_checksum:
+            logging.warning("Model weights changed since the index was built; re-embedding every assignment.")
+            return False
+        self._buffer = np.array(data["embeddings"], dtype=np.float32)
+        self.size = len(self._buffer)
+        self.student_ids = data["student_ids"].tolist()
+        self.assignment_ids = data["assignment_ids"].tolist()
+        self.pages = data["pages"].tolist()
+        self.student_pages = Counter(self.student_ids)
+        self.last_upload = datetime.fromisoformat(str(data["last_upload"])) if str(data["last_upload"]) else None
+        self.trained_size = int(data["trained_size"])
+        if os.path.exists(self.ivf_path):
+            self.ivf = IVFIndex.load(self.ivf_path)
+            self.ivf.bind(self.embeddings)
+        if self.size and (self.ivf is None or sum(len(rows) for rows in self.ivf.lists) != self.size):
+            # Interrupted between writing the two files: the layout no longer covers every page
+            self._retrain()
+        return True
+
+    def save(self) -> None:
+        """Writes both files through temporary names, so a crash mid-save keeps the previous checkpoint."""
+        with open(f"{self.pages_path}.tmp", "wb") as f:
+            np.savez(
+                f,
+                embeddings=self.embeddings,
+                student_ids=np.array(self.student_ids, dtype=str),
+                assignment_ids=np.array(self.assignment_ids, dtype=str),
+                pages=np.array(self.pages, dtype=np.int32),
+                last_upload=self.last_upload.isoformat() if self.last_upload else "",
+                trained_size=self.trained_size,
+                model_checksum=self.model_checksum
+            )
+        os.replace(f"{self.pages_path}.tmp", self.pages_path)
+        if self.ivf is not None:
+            with open(f"{self.ivf_path}.tmp", "wb") as f:
+                self.ivf.save(f)
+            os.replace(f"{self.ivf_path}.tmp", self.ivf_path)
+
+    def _retrain(self) -> None:
+        total = len(self.embeddings)
+        nlist = 1 if total < ANN_MIN_PAGES else None
+        self.ivf = IVFIndex.build(self.embeddings, nlist=nlist, nprobe=8)
+        self.trained_size = total
+        logging.info(f"Trained page index: {total} pages in {len(self.ivf.lists)} list(s).")
+
+    def search(self, queries: np.ndarray, k: int, exclude_student: Optional[str] = None):
+        """
+        Top-k (row indices, cosines) over the indexed pages, skipping
+        ``exclude_student``'s own pages; empty slots hold index -1. A student's
+        own pages are usually their nearest neighbours, so the search asks for
+        k more than that student has indexed and filters afterwards.
+        """
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        cosines = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if self.ivf is None or not self.size:
+            return indices, cosines
+        own = self.student_pages[exclude_student] if exclude_student is not None else 0
+        rows, scores = self.ivf.search(queries, min(k + own, self.size))
+        for i, (query_rows, query_scores) in enumerate(zip(rows, scores)):
+            keep = [j for j, row in enumerate(query_rows)
+                    if row >= 0 and (own == 0 or self.student_ids[row] != exclude_student)][:k]
+            indices[i, :len(keep)] = query_rows[keep]
+            cosines[i, :len(keep)] = query_scores[keep]
+        return indices, cosines
+
+    def add(self, embeddings: np.ndarray, student_id: str, assignment_id: str, pages: List[int]) -> None:
+        start, total = self.size, self.size + len(embeddings)
+        if total > len(self._buffer):
+            grown = np.empty((max(total, 2 * len(self._buffer), 1024), self._buffer.shape[1]), dtype=np.float32)
+            grown[:start] = self._buffer[:start]
+            self._buffer = grown
+        self._buffer[start:total] = embeddings
+        self.size = total
+        self.student_ids += [student_id] * len(pages)
+        self.assignment_ids += [assignment_id] * len(pages)
+        self.pages += list(pages)
+        self.student_pages[student_id] += len(pages)
+
+        if self.ivf is None or (total >= ANN_MIN_PAGES and total >= 2 * self.trained_size):
+            self._retrain()
+        else:
+            self.ivf.add(np.arange(start, total), embeddings)
+
+def iter_new_assignments(collection, known_ids: set, student_ids: Optional[List[str]] = None,
+                         since: Optional[datetime] = None) -> Iterator[dict]:
+    """Assignments uploaded since ``since`` (all of them if None) that are not indexed yet, oldest first."""
+    query = {"fileCategory": "assignment"}
+    if since is not None:
+        query["uploadDate"] = {"$gte": since}
+    if student_ids:
+        query["studentId"] = {"$in": student_ids}
+    for document in collection.find(query, ASSIGNMENT_PROJECTION, batch_size=16).sort("uploadDate", 1):
+        if str(document["_id"]) not in known_ids:
+            yield document
+
+def embed_pages(document: dict, model, device: str, store, max_pages: int):
+    """Embeds the first ``max_pages`` pages of an assignment; returns (page indices, (pages, 128) array) or None."""
+    extension = CONTENT_TYPE_EXTENSIONS.get(document.get("contentType"))
+    if not extension:
+        return None
+    data = bytes(document["fileData"])
+    file_name = f"assignment_{document['_id']}{extension}"
+    page_count = 1
+    if extension == ".pdf":
+        try:
+            with fitz.open(stream=data, filetype="pdf") as doc:
+                page_count = len(doc)
+        except Exception as e:
+            logging.error(f"Failed to open PDF {file_name}: {e}")
+            return None
+    pages = list(range(min(page_count, max_pages)))
+    embeddings, _ = ch.get_file_embeddings(data, file_name, str(document["studentId"]), model, device,
+                                           store, file_id=document["_id"], page_indices=pages)
+    if embeddings is None:
+        return None
+    return pages, embeddings.cpu().numpy()
+
+def detect(index: PageIndex, documents: Iterator[dict], model, device: str, store=None,
+           threshold: float = DUPLICATE_THRESHOLD, neighbors: int = 10, max_pages: int = ch.MAX_PAGES_TO_PROCESS,
+           out=None, save_every: int = SAVE_EVERY) -> dict:
+    """
+    Embeds each new assignment once, looks up each page's ``neighbors``
+    nearest indexed pages and reports other students' assignments with pages
+    at or above ``threshold`` percent similarity. Each new assignment is
+    searched before it is added, so every pair is reported once, by the later
+    upload. One NDJSON line per assignment pair is written to ``out``. The
+    index is saved every ``save_every`` assignments (0 to leave it to the caller).
+    """
+    out = out or sys.stdout
+    min_cosine = cosine_from_similarity(threshold)
+    stats = {"assignments": 0, "pages": 0, "pairs": 0, "skipped": 0}
+
+    for document in documents:
+        student_id, assignment_id = str(document["studentId"]), str(document["_id"])
+        embedded = embed_pages(document, model, device, store, max_pages)
+        if embedded is None:
+            logging.warning(f"Skipping assignment {assignment_id}: could not decode it.")
+            stats["skipped"] += 1
+            continue
+        pages, embeddings = embedded
+
+        rows, cosines = index.search(embeddings, neighbors, exclude_student=student_id)
+        matches = {}
+        for page, page_rows, page_cosines in zip(pages, rows, cosines):
+            for row, cosine in zip(page_rows, page_cosines):
+                if row < 0 or cosine < min_cosine or index.student_ids[row] == student_id:
+                    continue
+                other = index.assignment_ids[row]
+                matches.setdefault(other, []).append((page, int(row), float(cosine)))
+
+        for other, page_pairs in matches.items():
+            similarities = similarity_from_cosine(np.array([cosine for _, _, cosine in page_pairs]))
+            out.write(json.dumps({
+                "assignment_id": assignment_id,
+                "student_id": student_id,
+                "matched_assignment_id": other,
+                "matched_student_id": index.student_ids[page_pairs[0][1]],
+                "max_similarity": float(similarities.max()),
+                "pages": [{"page": page + 1, "matched_page": index.pages[row] + 1, "similarity": float(similarity)}
+                          for (page, row, _), similarity in zip(page_pairs, similarities)]
+            }) + "\n")
+            out.flush()
+            stats["pairs"] += 1
+
+        index.add(embeddings, student_id, assignment_id, pages)
+        if document.get("uploadDate") and (index.last_upload is None or document["uploadDate"] > index.last_upload):
+            index.last_upload = document["uploadDate"]
+        stats["assignments"] += 1
+        stats["pages"] += len(pages)
+        if save_every and stats["assignments"] % save_every == 0:
+            index.save()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Report near-duplicate assignment pages across students, incrementally.")
+    parser.add_argument("--index", required=True, help="Path prefix of the persisted page index, e.g. one per course.")
+    parser.add_argument("--student_ids", nargs="+", help="Restrict to these students (the course roster).")
+    parser.add_argument("--threshold", type=float, default=DUPLICATE_THRESHOLD, help="Page similarity (%%) to report.")
+    parser.add_argument("--neighbors", type=int, default=10, help="Nearest indexed pages checked per page.")
+    parser.add_argument("--max-pages", type=int, default=ch.MAX_PAGES_TO_PROCESS, help="Pages embedded per assignment.")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the saved index and re-embed everything.")
+    parser.add_argument("--save-every", type=int, default=SAVE_EVERY, help="Assignments between index checkpoints.")
+    parser.add_argument("--backend", choices=BACKENDS, default=ch.INFERENCE_BACKEND)
+    args = parser.parse_args()
+
+    device = ch.select_device(args.backend)
+    model = ch.load_siamese_model(device, args.backend)
+    index = PageIndex(args.index, ch.get_model_checksum(args.backend))
+    if not args.rebuild and index.load():
+        logging.info(f"Loaded page index with {len(index.embeddings)} pages; last upload {index.last_upload}.")
+
+    collection = get_collection()
+    documents = iter_new_assignments(collection, set(index.assignment_ids), args.student_ids, index.last_upload)
+    stats = detect(index, documents, model, device, ch.open_embedding_store(args.backend),
+                   args.threshold, args.neighbors, args.max_pages, save_every=args.save_every)
+    index.save()
+    logging.info(f"Duplicate detection finished: {stats}")
+
+if __name__ == "__main__":
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    try:
+        main()
+    except Exception as e:
+        logging.error(f"Duplicate detection failed: {e}", exc_info=not isinstance(e, FetchError))
+        sys.stdout.write(json.dumps({"status": "error", "message": str(e)}) + "\n")
+        sys.exit(1)
+    finally:
+        close_client()
+        sys.stdout.flush()
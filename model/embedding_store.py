@@ -0,0 +1,187 @@
+import sys
+import os
+import json
+import hashlib
+import argparse
+import logging
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from bson.binary import Binary
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Constants ---
+EMBEDDINGS_COLLECTION = "file_embeddings"
+EMBEDDING_DTYPE = np.dtype("<f4")
+
+def compute_content_hash(data: bytes) -> str:
+    """Returns the SHA-256 hex digest of an uploaded file's bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+def compute_model_checksum(model_path: str, extra: str = "") -> str:
+    """
+    Returns a checksum identifying the weights file and the preprocessing
+    pipeline (``extra``). Any change to either invalidates stored embeddings.
+    """
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    digest.update(extra.encode())
+    return digest.hexdigest()
+
+class EmbeddingStore:
+    """
+    Caches SiameseNetwork page embeddings in the same database as the ``files``
+    collection. Entries are keyed by (content_hash, page_index, model_checksum),
+    so identical uploads share embeddings and a retrained model never reads
+    stale vectors.
+    """
+
+    def __init__(self, collection, model_checksum: str):
+        self.collection = collection
+        self.model_checksum = model_checksum
+
+    @classmethod
+    def from_env(cls, model_checksum: str) -> Optional["EmbeddingStore"]:
+        """Connects using MONGO_URI. Returns None when the cache is unavailable."""
+        mongo_uri = os.getenv("MONGO_URI")
+        if not mongo_uri:
+            logging.warning("MONGO_URI is not set; embedding cache disabled.")
+            return None
+        try:
+            client = MongoClient(mongo_uri)
+            store = cls(client["test"][EMBEDDINGS_COLLECTION], model_checksum)
+            store.ensure_indexes()
+            return store
+        except Exception as e:
+            logging.warning(f"Embedding cache unavailable: {e}")
+            return None
+
+    def ensure_indexes(self) -> None:
+        self.collection.create_index(
+            [("content_hash", ASCENDING), ("page_index", ASCENDING), ("model_checksum", ASCENDING)],
+            unique=True
+        )
+        self.collection.create_index([("model_checksum", ASCENDING)])
+
+    def get_many(self, content_hash: str, page_indices: Iterable[int]) -> Dict[int, np.ndarray]:
+        """Returns the cached embeddings for the requested pages that exist."""
+        cursor = self.collection.find(
+            {
+                "content_hash": content_hash,
+                "page_index": {"$in": list(page_indices)},
+                "model_checksum": self.model_checksum
+            },
+            {"_id": 0, "page_index": 1, "embedding": 1}
+        )
+        return {
+            doc["page_index"]: np.frombuffer(doc["embedding"], dtype=EMBEDDING_DTYPE)
+            for doc in cursor
+        }
+
+    def put_many(self, content_hash: str, embeddings: Dict[int, np.ndarray], file_id=None) -> None:
+        """Upserts one embedding per page index, all in a single bulk write."""
+        if not embeddings:
+            return
+        self.collection.bulk_write([
+            UpdateOne(
+                {"content_hash": content_hash, "page_index": page_index, "model_checksum": self.model_checksum},
+                {"$set": {
+                    "embedding": Binary(np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes()),
+                    "file_id": file_id
+                }},
+                upsert=True
+            )
+            for page_index, embedding in embeddings.items()
+        ], ordered=False)
+
+    def purge_stale(self, keep=()) -> int:
+        """
+        Deletes every entry computed with a model checksum other than this
+        store's or one in ``keep`` (e.g. the other backends still deployed).
+        """
+        live = [self.model_checksum, *keep]
+        deleted = self.collection.delete_many({"model_checksum": {"$nin": live}}).deleted_count
+        if deleted:
+            logging.info(f"Dropped {deleted} stale embedding(s) from an older model.")
+        return deleted
+
+def backfill(file_category: str, limit: int = 0) -> dict:
+    """
+    Embeds existing uploads in bulk so the first verification is already warm.
+    Assignment pages use the same seeded selection as a live comparison.
+    """
+    # Imported here because compare_handwriting itself depends on this module.
+    import compare_handwriting as ch
+    from fetch_file import CONTENT_TYPE_EXTENSIONS
+
+    device = ch.select_device()
+    model = ch.load_siamese_model(device)
+    store = EmbeddingStore.from_env(ch.get_model_checksum())
+    if store is None:
+        raise RuntimeError("MONGO_URI must be set to backfill embeddings.")
+    store.purge_stale(keep=ch.live_model_checksums())
+
+    categories = ["handwriting_sample", "assignment"] if file_category == "all" else [file_category]
+    files = store.collection.database["files"]
+    cursor = files.find(
+        {"fileCategory": {"$in": categories}},
+        {"studentId": 1, "fileCategory": 1, "contentType": 1, "fileData": 1}
+    )
+    if limit:
+        cursor = cursor.limit(limit)
+
+    summary = {"files": 0, "embedded_pages": 0, "cached_pages": 0, "skipped": 0}
+    for doc in cursor:
+        extension = CONTENT_TYPE_EXTENSIONS.get(doc.get("contentType"))
+        if not extension:
+            summary["skipped"] += 1
+            continue
+
+        label = "handwriting_sample" if doc["fileCategory"] == "handwriting_sample" else "latest_assignment"
+        student_id = str(doc["studentId"])
+        file_name = f"{label}_{student_id}{extension}"
+        data = bytes(doc["fileData"])
+        page_indices = ch.get_sample_page_indices(data, file_name, student_id) if label == "handwriting_sample" else None
+        embeddings, embedded = ch.get_file_embeddings(
+            data, file_name, student_id, model, device, store, file_id=doc["_id"], page_indices=page_indices
+        )
+        if embeddings is None:
+            summary["skipped"] += 1
+            continue
+        summary["files"] += 1
+        summary["embedded_pages"] += embedded
+        summary["cached_pages"] += len(embeddings) - embedded
+
+    return summary
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s', stream=sys.stderr)
+    parser = argparse.ArgumentParser(description="Maintain the handwriting embedding cache.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill_parser = subparsers.add_parser("backfill", help="Embed existing uploads in bulk.")
+    backfill_parser.add_argument("--category", default="all", choices=["all", "handwriting_sample", "assignment"])
+    backfill_parser.add_argument("--limit", type=int, default=0, help="Stop after this many files (0 = no limit).")
+
+    subparsers.add_parser("purge", help="Drop embeddings from weights no backend on disk uses any more.")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "backfill":
+            result = {"status": "success", **backfill(args.category, args.limit)}
+        else:
+            import compare_handwriting as ch
+            store = EmbeddingStore.from_env(ch.get_model_checksum())
+            if store is None:
+                raise RuntimeError("MONGO_URI must be set to purge embeddings.")
+            result = {"status": "success", "deleted": store.purge_stale(keep=ch.live_model_checksums())}
+        print(json.dumps(result))
+    except Exception as e:
+        logging.error(f"Embedding store command failed: {e}", exc_info=True)
+        print(json.dumps({"status": "error", "message": str(e)}))
+        sys.exit(1)
@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import time
+import glob
+import logging
+import argparse
+
+import numpy as np
+import torch
+
+import compare_handwriting as ch
+from inference_backends import (EmbeddingHead, ONNX_MODEL_PATH, TORCHSCRIPT_MODEL_PATH,
+                                load_backend, load_torch_model)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+DEFAULT_PAIRS_DIR = os.path.join(os.path.dirname(__file__), "..", "model_for_matching", "data")
+
+def export_torchscript(model, path: str) -> None:
+    """Traces forward_once and freezes the graph so weights are inlined as constants."""
+    example = torch.zeros(1, 3, 224, 224)
+    with torch.no_grad():
+        traced = torch.jit.trace(EmbeddingHead(model).eval(), example)
+        # optimize_for_inference() is left out: its MKLDNN-packed weights do not reload
+        frozen = torch.jit.freeze(traced)
+    frozen.save(path)
+
+def export_onnx(model, path: str) -> None:
+    """Exports forward_once with a dynamic batch dimension."""
+    example = torch.zeros(1, 3, 224, 224)
+    torch.onnx.export(
+        EmbeddingHead(model).eval(), (example,), path,
+        input_names=["input"], output_names=["embedding"],
+        dynamic_axes={"input": {0: "batch"}, "embedding": {0: "batch"}},
+        opset_version=17, dynamo=False
+    )
+
+def load_pairs(pairs_dir: str):
+    """Every img1/img2 pair under matched/ and unmatched/, as grayscale arrays like the live pipeline sees them."""
+    pairs = []
+    for pair_dir in sorted(glob.glob(os.path.join(pairs_dir, "*", "pair_*"))):
+        images = []
+        for name in ("img1.png", "img2.png"):
+            with open(os.path.join(pair_dir, name), "rb") as f:
+                images += ch.convert_bytes_to_image(f.read(), name, "parity")
+        if len(images) == 2:
+            pairs.append((os.path.relpath(pair_dir, pairs_dir), images[0], images[1]))
+    return pairs
+
+def score_pairs(backend, pairs):
+    """Similarity score of every pair plus the median per-page embedding latency."""
+    scores, timings = [], []
+    for _, sample, page in pairs:
+        started = time.perf_counter()
+        scores.append(ch.compare_images_siamese(sample, [page], backend, "cpu")[0])
+        timings.append((time.perf_counter() - started) * 1000 / 2)
+    return scores, float(np.median(timings))
+
+def check_parity(formats, pairs_dir: str, tolerance: float) -> dict:
+    """
+    Scores the pair folders with the unfolded eager model the exports are
+    traced from, then with the served "torch" backend (folded grayscale stem
+    unless GRAYSCALE_STEM=0) and each exported backend, and compares them.
+    """
+    pairs = load_pairs(pairs_dir)
+    if not pairs:
+        raise FileNotFoundError(f"No img1/img2 pairs found under {pairs_dir}")
+
+    reference, reference_ms = score_pairs(load_torch_model("cpu"), pairs)
+    report = {"pairs": len(pairs), "tolerance": tolerance,
+              "reference": {"page_ms": round(reference_ms, 2)}, "passed": True}
+    for name in ["torch", *formats]:
+        scores, page_ms = score_pairs(load_backend(name, "cpu"), pairs)
+        diffs = np.abs(np.array(scores) - np.array(reference))
+        worst = int(np.argmax(diffs))
+        ok = bool(diffs.max() <= tolerance)
+        report[name] = {
+            "page_ms": round(page_ms, 2),
+            "max_abs_diff": round(float(diffs.max()), 4),
+            "worst_pair": pairs[worst][0],
+            "passed": ok
+        }
+        report["passed"] = report["passed"] and ok
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Export siamese_model_contrastive.pth to TorchScript and/or ONNX.")
+    parser.add_argument("--formats", nargs="+", choices=["torchscript", "onnx"], default=["torchscript", "onnx"])
+    parser.add_argument("--skip-check", action="store_true",
+                        help="Skip comparing the served and exported backends' similarity scores on the pair folders.")
+    parser.add_argument("--pairs-dir", default=DEFAULT_PAIRS_DIR)
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Max allowed difference in similarity percentage points.")
+    args = parser.parse_args()
+
+    model = load_torch_model("cpu")
+    result = {"exported": {}}
+    if "torchscript" in args.formats:
+        export_torchscript(model, TORCHSCRIPT_MODEL_PATH)
+        result["exported"]["torchscript"] = TORCHSCRIPT_MODEL_PATH
+    if "onnx" in args.formats:
+        export_onnx(model, ONNX_MODEL_PATH)
+        result["exported"]["onnx"] = ONNX_MODEL_PATH
+    logging.info(f"Exported: {', '.join(result['exported'])}")
+
+    if not args.skip_check:
+        result["parity"] = check_parity(args.formats, args.pairs_dir, args.tolerance)
+
+    print(json.dumps(result, indent=2))
+    if not args.skip_check and not result["parity"]["passed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
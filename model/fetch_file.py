@@ -4,54 +4,87 @@ import json
 import shutil
 from pymongo import MongoClient
 from dotenv import load_dotenv
+from timing import Trace, span
 
 load_dotenv()
 
-if len(sys.argv) != 4:
-    print(json.dumps({"status": "error", "message": "invalid_number_of_arguments"}))
-    sys.exit(1)
-
-student_id = sys.argv[1]
-file_category = sys.argv[2]
-token = sys.argv[3]
-
-# Connect to MongoDB
-MONGO_URI = os.getenv("MONGO_URI")
-if not MONGO_URI:
-    print(json.dumps({"status": "error", "message": "mongodb_not_set"}))
-    sys.exit(1)
-
-try:
-    client = MongoClient(MONGO_URI)
-    db = client["test"]
-    collection = db["files"]
-except Exception:
-    print(json.dumps({"status": "error", "message": "database_connection_failed"}))
-    sys.exit(1)
-
-output_dir = os.path.join(os.path.dirname(__file__), "fetched_files")
+CONTENT_TYPE_EXTENSIONS = {
+    "application/pdf": ".pdf",
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg"
+}
+
+# Only the fields needed to decode a file; skips names, marks, etc.
+FILE_PROJECTION = {"fileData": 1, "contentType": 1}
+
+class FetchError(Exception):
+    """Raised with one of the error codes the Node routes already understand."""
+
+_client = None
+
+def get_collection():
+    """
+    Returns the ``files`` collection through one process-wide MongoClient, so
+    a resident worker reuses its connection pool across requests.
+    """
+    global _client
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise FetchError("mongodb_not_set")
+    try:
+        if _client is None:
+            _client = MongoClient(mongo_uri, maxPoolSize=int(os.getenv("MONGO_POOL_SIZE", "10")))
+        return _client["test"]["files"]
+    except Exception:
+        raise FetchError("database_connection_failed")
+
+def close_client():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+def find_handwriting_sample(collection, student_id, projection=None):
+    return collection.find_one(
+        {"studentId": student_id, "fileCategory": "handwriting_sample"},
+        projection
+    )
 
-# Clean up and create output directory
-try:
-    if os.path.exists(output_dir):
-        shutil.rmtree(output_dir)
-    os.makedirs(output_dir)
-except Exception:
-    print(json.dumps({"status": "error", "message": "failed_to_create_output_directory"}))
-    client.close()
-    sys.exit(1)
+def find_latest_assignment(collection, student_id, projection=None):
+    return collection.find_one(
+        {"studentId": student_id, "fileCategory": "assignment"},
+        projection,
+        sort=[("uploadDate", -1)]
+    )
 
-result_files = []
+def fetch_in_memory(student_id):
+    """
+    Fetches a student's handwriting sample and latest assignment without
+    touching the filesystem.
+
+    Returns a list of (file_name, data) tuples, sample first. The file names
+    match what the on-disk mode would write, so page sampling is unchanged.
+    """
+    with span("fetch.connect"):
+        collection = get_collection()
+    files = []
+    for label, finder in (("handwriting_sample", find_handwriting_sample),
+                          ("latest_assignment", find_latest_assignment)):
+        with span("fetch.query"):
+            document = finder(collection, student_id, FILE_PROJECTION)
+        if not document:
+            raise FetchError("handwriting_sample_not_found" if label == "handwriting_sample" else "assignment_not_found")
+
+        extension = CONTENT_TYPE_EXTENSIONS.get(document.get("contentType"))
+        if not extension:
+            raise FetchError("failed_to_save_sample" if label == "handwriting_sample" else "failed_to_save_assignment")
+        files.append((f"{label}_{student_id}{extension}", bytes(document["fileData"])))
+    return files
 
-def save_file(document, label):
+def save_file(document, label, student_id, output_dir):
     try:
-        content_type = document["contentType"]
-        extension = {
-            "application/pdf": ".pdf",
-            "image/png": ".png",
-            "image/jpeg": ".jpg",
-            "image/jpg": ".jpg"
-        }.get(content_type)
+        extension = CONTENT_TYPE_EXTENSIONS.get(document["contentType"])
 
         if not extension:
             return None
@@ -66,67 +99,86 @@ def save_file(document, label):
     except Exception:
         return None
 
-# Handle different file category requests
-if file_category == "all":
-    # Fetch handwriting sample
-    sample_doc = collection.find_one({
-        "studentId": student_id,
-        "fileCategory": "handwriting_sample"
-    })
-
-    if not sample_doc:
-        print(json.dumps({"status": "error", "message": "handwriting_sample_not_found"}))
-        client.close()
-        sys.exit(1)
-
-    sample_path = save_file(sample_doc, "handwriting_sample")
-    if not sample_path:
-        print(json.dumps({"status": "error", "message": "failed_to_save_sample"}))
-        client.close()
-        sys.exit(1)
-    result_files.append(sample_path)
-
-    # Fetch latest assignment
-    assignment_doc = collection.find_one(
-        {"studentId": student_id, "fileCategory": "assignment"},
-        sort=[("uploadDate", -1)]
-    )
-
-    if not assignment_doc:
-        print(json.dumps({"status": "error", "message": "assignment_not_found"}))
-        client.close()
-        sys.exit(1)
-
-    assignment_path = save_file(assignment_doc, "latest_assignment")
-    if not assignment_path:
-        print(json.dumps({"status": "error", "message": "failed_to_save_assignment"}))
-        client.close()
-        sys.exit(1)
-    result_files.append(assignment_path)
-
-else:
-    # Fetch specific file category
-    file_doc = collection.find_one({
-        "studentId": student_id,
-        "fileCategory": file_category
-    })
-
-    if not file_doc:
-        print(json.dumps({"status": "error", "message": f"{file_category}_not_found"}))
-        client.close()
-        sys.exit(1)
+def fail(message):
+    print(json.dumps({"status": "error", "message": message}))
+    close_client()
+    sys.exit(1)
 
-    file_path = save_file(file_doc, file_category)
-    if not file_path:
-        print(json.dumps({"status": "error", "message": f"failed_to_save_{file_category}"}))
-        client.close()
+def main():
+    if len(sys.argv) != 4:
+        print(json.dumps({"status": "error", "message": "invalid_number_of_arguments"}))
         sys.exit(1)
-    result_files.append(file_path)
-
-# Success response
-print(json.dumps({
-    "status": "success",
-    "files": result_files
-}))
 
-client.close()
\ No newline at end of file
+    student_id = sys.argv[1]
+    file_category = sys.argv[2]
+    token = sys.argv[3]
+
+    with Trace("fetch_file") as trace:
+        # Connect to MongoDB
+        try:
+            with span("connect"):
+                collection = get_collection()
+        except FetchError as e:
+            fail(str(e))
+
+        output_dir = os.path.join(os.path.dirname(__file__), "fetched_files")
+
+        # Clean up and create output directory
+        try:
+            if os.path.exists(output_dir):
+                shutil.rmtree(output_dir)
+            os.makedirs(output_dir)
+        except Exception:
+            fail("failed_to_create_output_directory")
+
+        result_files = []
+
+        # Handle different file category requests
+        if file_category == "all":
+            # Fetch handwriting sample
+            with span("query"):
+                sample_doc = find_handwriting_sample(collection, student_id)
+            if not sample_doc:
+                fail("handwriting_sample_not_found")
+
+            sample_path = save_file(sample_doc, "handwriting_sample", student_id, output_dir)
+            if not sample_path:
+                fail("failed_to_save_sample")
+            result_files.append(sample_path)
+
+            # Fetch latest assignment
+            with span("query"):
+                assignment_doc = find_latest_assignment(collection, student_id)
+            if not assignment_doc:
+                fail("assignment_not_found")
+
+            assignment_path = save_file(assignment_doc, "latest_assignment", student_id, output_dir)
+            if not assignment_path:
+                fail("failed_to_save_assignment")
+            result_files.append(assignment_path)
+
+        else:
+            # Fetch specific file category
+            with span("query"):
+                file_doc = collection.find_one({
+                    "studentId": student_id,
+                    "fileCategory": file_category
+                })
+            if not file_doc:
+                fail(f"{file_category}_not_found")
+
+            file_path = save_file(file_doc, file_category, student_id, output_dir)
+            if not file_path:
+                fail(f"failed_to_save_{file_category}")
+            result_files.append(file_path)
+
+    # Success response
+    print(json.dumps(trace.attach({
+        "status": "success",
+        "files": result_files
+    })))
+
+    close_client()
+
+if __name__ == "__main__":
+    main()
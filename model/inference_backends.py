@@ -0,0 +1,101 @@
+import os
+import logging
+import torch
+
+from siamese_network import SiameseNetwork
+from preprocessing import GRAYSCALE_STEM, fold_grayscale_stem
+
+MODEL_DIR = os.path.dirname(__file__)
+SIAMESE_MODEL_PATH = os.path.join(MODEL_DIR, "siamese_model_contrastive.pth")
+TORCHSCRIPT_MODEL_PATH = os.path.join(MODEL_DIR, "siamese_model_contrastive.ts")
+ONNX_MODEL_PATH = os.path.join(MODEL_DIR, "siamese_model_contrastive.onnx")
+INT8_ONNX_MODEL_PATH = os.path.join(MODEL_DIR, "siamese_model_contrastive.int8.onnx")
+BACKENDS = ("torch", "torchscript", "onnx", "onnx_int8")
+
+class EmbeddingHead(torch.nn.Module):
+    """Exportable wrapper whose forward() is SiameseNetwork.forward_once."""
+
+    def __init__(self, model: SiameseNetwork):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.model.forward_once(x)
+
+def load_torch_model(device: str, grayscale_stem: bool = False) -> SiameseNetwork:
+    """
+    Eager SiameseNetwork with the trained weights, in eval mode. With
+    ``grayscale_stem`` the first conv is folded to take one [0, 1] grayscale
+    channel (see preprocessing.GrayscaleStem) and ``input_channels`` is 1;
+    exports keep the three-channel RGB input.
+    """
+    if not os.path.exists(SIAMESE_MODEL_PATH):
+        raise FileNotFoundError(f"Siamese model not found at: {SIAMESE_MODEL_PATH}")
+    model = SiameseNetwork(pretrained=False).to(device)
+    model.load_state_dict(torch.load(SIAMESE_MODEL_PATH, map_location=device))
+    model.eval()
+    model.input_channels = 3
+    if grayscale_stem:
+        fold_grayscale_stem(model.backbone)
+        model.input_channels = 1
+    return model
+
+class TorchScriptBackend:
+    """Frozen TorchScript graph written by export_model.py."""
+
+    def __init__(self, path: str, device: str):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"TorchScript model not found at: {path} (run export_model.py)")
+        self.module = torch.jit.load(path, map_location=device)
+        self.module.eval()
+
+    def forward_once(self, batch: torch.Tensor) -> torch.Tensor:
+        return self.module(batch)
+
+class OnnxBackend:
+    """
+    ONNX Runtime CPU session over the exported graph. Threads per session
+    come from ORT_THREADS (default 1), so several verify requests can run in
+    parallel without oversubscribing the cores.
+    """
+
+    def __init__(self, path: str):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError("INFERENCE_BACKEND=onnx needs the onnxruntime package") from e
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"ONNX model not found at: {path} (run export_model.py)")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = int(os.getenv("ORT_THREADS", "1"))
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def forward_once(self, batch: torch.Tensor) -> torch.Tensor:
+        embeddings = self.session.run(None, {self.input_name: batch.detach().cpu().numpy()})[0]
+        return torch.from_numpy(embeddings)
+
+def weights_path(name: str) -> str:
+    """
+    The file whose checksum versions cached embeddings for a backend. The INT8
+    model produces its own embeddings; the float exports match the .pth.
+    """
+    return INT8_ONNX_MODEL_PATH if name == "onnx_int8" else SIAMESE_MODEL_PATH
+
+def load_backend(name: str, device: str):
+    """
+    Returns an object with forward_once(batch) -> embeddings for the named
+    backend: "torch" (eager SiameseNetwork), "torchscript", "onnx" or
+    "onnx_int8" (quantize_model.py). The exported backends only run on CPU.
+    """
+    if name == "torch":
+        return load_torch_model(device, grayscale_stem=GRAYSCALE_STEM)
+    if name == "torchscript":
+        return TorchScriptBackend(TORCHSCRIPT_MODEL_PATH, device)
+    if name in ("onnx", "onnx_int8"):
+        if device != "cpu":
+            logging.warning("ONNX backends run on CPU only; ignoring device %s", device)
+        return OnnxBackend(INT8_ONNX_MODEL_PATH if name == "onnx_int8" else ONNX_MODEL_PATH)
+    raise ValueError(f"Unknown inference backend '{name}', expected one of {', '.join(BACKENDS)}")
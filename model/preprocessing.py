@@ -0,0 +1,100 @@
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from torch import nn
+
+INPUT_SIZE = 224  # Model input side length
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+# Eager models take one grayscale channel instead of three identical ones (GRAYSCALE_STEM=0 to disable)
+GRAYSCALE_STEM = os.getenv("GRAYSCALE_STEM", "1") != "0"
+
+_buffers = threading.local()
+
+def resize(img: np.ndarray, size: int = INPUT_SIZE) -> np.ndarray:
+    """
+    Resizes a uint8 (H, W) or (H, W, 3) array to size x size with PIL's
+    antialiased bilinear filter, i.e. exactly what transforms.Resize does.
+    Grayscale stays one channel, so a page is resampled once, not three times.
+    """
+    return np.asarray(Image.fromarray(img).resize((size, size), Image.BILINEAR))
+
+def batch_buffer(n: int, channels: int = 3) -> np.ndarray:
+    """
+    A per-thread float32 (n, channels, INPUT_SIZE, INPUT_SIZE) scratch batch,
+    reused across calls. Its contents are only valid until the same thread
+    asks for another buffer.
+    """
+    buffer = getattr(_buffers, str(channels), None)
+    if buffer is None or len(buffer) < n:
+        buffer = np.empty((n, channels, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+        setattr(_buffers, str(channels), buffer)
+    return buffer[:n]
+
+def preprocess_batch(images: List[np.ndarray], channels: int = 3, normalize: bool = True,
+                     out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Resizes uint8 images straight into a float32 (N, channels, 224, 224) batch.
+
+    ``channels=3`` reproduces ToTensor() (+ ImageNet Normalize() when
+    ``normalize``): a grayscale page is resized once and broadcast into the
+    three channels. ``channels=1`` returns the page in [0, 1] for a model
+    whose stem was folded by fold_grayscale_stem, which applies the
+    normalisation itself. ``out`` (e.g. from batch_buffer) avoids allocating.
+    """
+    if out is None:
+        out = np.empty((len(images), channels, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+    for i, img in enumerate(images):
+        resized = resize(img).astype(np.float32) / 255
+        if resized.ndim == 3:
+            if channels != 3:
+                raise ValueError("Colour images need channels=3")
+            resized = resized.transpose(2, 0, 1)
+        if channels == 1:
+            out[i, 0] = resized
+        elif normalize:
+            out[i] = (resized - IMAGENET_MEAN[:, None, None]) / IMAGENET_STD[:, None, None]
+        else:
+            out[i] = resized
+    return out
+
+class GrayscaleStem(nn.Module):
+    """
+    The first conv of an ImageNet-normalised RGB network, rewritten to take a
+    single [0, 1] grayscale channel. With x_c = (g - mean_c) / std_c for all
+    three channels, conv(x) = conv_1(g) + offset: the RGB kernels divided by
+    std and summed, plus the convolution of the constant -mean/std planes.
+    Because of zero padding that constant is not uniform near the border, so
+    the offset is kept as a full (out_channels, H, W) map for INPUT_SIZE inputs.
+    Normalised three-channel input still goes through the original conv.
+    """
+
+    def __init__(self, conv: nn.Conv2d, mean=IMAGENET_MEAN, std=IMAGENET_STD, input_size: int = INPUT_SIZE):
+        super().__init__()
+        mean = torch.as_tensor(mean, dtype=conv.weight.dtype, device=conv.weight.device).view(1, 3, 1, 1)
+        std = torch.as_tensor(std, dtype=conv.weight.dtype, device=conv.weight.device).view(1, 3, 1, 1)
+        self.stride, self.padding = conv.stride, conv.padding
+        with torch.no_grad():
+            self.weight = nn.Parameter((conv.weight / std).sum(dim=1, keepdim=True), requires_grad=False)
+            planes = (mean / std).expand(1, 3, input_size, input_size)
+            offset = -F.conv2d(planes, conv.weight, None, conv.stride, conv.padding)[0]
+            if conv.bias is not None:
+                offset += conv.bias.view(-1, 1, 1)
+        self.register_buffer("offset", offset)
+        self.register_buffer("rgb_weight", conv.weight.detach().clone(), persistent=False)
+        self.register_buffer("rgb_bias", None if conv.bias is None else conv.bias.detach().clone(), persistent=False)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if x.size(1) == 3:
+            return F.conv2d(x, self.rgb_weight, self.rgb_bias, self.stride, self.padding)
+        return F.conv2d(x, self.weight, None, self.stride, self.padding) + self.offset
+
+def fold_grayscale_stem(backbone: nn.Sequential) -> nn.Sequential:
+    """Swaps a ResNet backbone's first conv for its GrayscaleStem, in place."""
+    backbone[0] = GrayscaleStem(backbone[0])
+    return backbone
@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import glob
+import logging
+import argparse
+import tempfile
+
+import numpy as np
+
+import compare_handwriting as ch
+from export_model import DEFAULT_PAIRS_DIR, export_onnx, load_pairs, score_pairs
+from inference_backends import INT8_ONNX_MODEL_PATH, OnnxBackend, load_torch_model
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+DEFAULT_CALIBRATION_DIR = os.path.join(DEFAULT_PAIRS_DIR, "raw")
+
+def calibration_batches(calibration_dir: str):
+    """Preprocessed (1, 3, 224, 224) inputs for every raw scan, decoded exactly like a live page."""
+    batches = []
+    for path in sorted(glob.glob(os.path.join(calibration_dir, "*"))):
+        if path.rsplit(".", 1)[-1].lower() not in ch.ALLOWED_EXTENSIONS:
+            continue
+        with open(path, "rb") as f:
+            for image in ch.convert_bytes_to_image(f.read(), os.path.basename(path), "calibration"):
+                batches.append(ch.preprocess_image(image).numpy())
+    return batches
+
+def quantize(calibration_dir: str, output_path: str, per_channel: bool = True) -> int:
+    """
+    Static INT8 quantization with ONNX Runtime: exports the float graph,
+    calibrates activation ranges on the raw scans and writes a QDQ model.
+    Returns the number of calibration images.
+    """
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                          QuantType, quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    batches = calibration_batches(calibration_dir)
+    if not batches:
+        raise FileNotFoundError(f"No calibration images found in {calibration_dir}")
+
+    class RawScans(CalibrationDataReader):
+        def __init__(self):
+            self.inputs = iter({"input": batch} for batch in batches)
+
+        def get_next(self):
+            return next(self.inputs, None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        float_path = os.path.join(tmp, "float.onnx")
+        prepared_path = os.path.join(tmp, "prepared.onnx")
+        export_onnx(load_torch_model("cpu"), float_path)
+        quant_pre_process(float_path, prepared_path)
+        quantize_static(
+            prepared_path, output_path, RawScans(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=per_channel,
+            calibrate_method=CalibrationMethod.MinMax
+        )
+    return len(batches)
+
+def accuracy_gate(pairs_dir: str, model_path: str, max_drift: float) -> dict:
+    """
+    Scores every matched/unmatched pair with the float model and the INT8
+    model and counts how many match decisions at SIMILARITY_THRESHOLD flip.
+    The gate passes when the flipped fraction is at most ``max_drift``.
+    """
+    pairs = load_pairs(pairs_dir)
+    if not pairs:
+        raise FileNotFoundError(f"No img1/img2 pairs found under {pairs_dir}")
+    labels = np.array([name.startswith("matched") for name, _, _ in pairs])
+
+    float_scores, float_ms = score_pairs(load_torch_model("cpu"), pairs)
+    int8_scores, int8_ms = score_pairs(OnnxBackend(model_path), pairs)
+    float_decisions = np.array(float_scores) >= ch.SIMILARITY_THRESHOLD
+    int8_decisions = np.array(int8_scores) >= ch.SIMILARITY_THRESHOLD
+
+    flipped = int((float_decisions != int8_decisions).sum())
+    drift = flipped / len(pairs)
+    return {
+        "pairs": len(pairs),
+        "threshold": ch.SIMILARITY_THRESHOLD,
+        "flipped_decisions": flipped,
+        "drift": round(drift, 4),
+        "max_drift": max_drift,
+        "max_abs_score_diff": round(float(np.max(np.abs(np.array(float_scores) - np.array(int8_scores)))), 2),
+        "float_accuracy": round(float((float_decisions == labels).mean()), 4),
+        "int8_accuracy": round(float((int8_decisions == labels).mean()), 4),
+        "float_page_ms": round(float_ms, 2),
+        "int8_page_ms": round(int8_ms, 2),
+        "passed": drift <= max_drift
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the Siamese model to INT8 and gate it on decision drift.")
+    parser.add_argument("--calibration-dir", default=DEFAULT_CALIBRATION_DIR)
+    parser.add_argument("--pairs-dir", default=DEFAULT_PAIRS_DIR)
+    parser.add_argument("--output", default=INT8_ONNX_MODEL_PATH)
+    parser.add_argument("--max-drift", type=float, default=float(os.getenv("QUANT_MAX_DRIFT", "0.02")),
+                        help="Largest allowed fraction of pairs whose match decision changes.")
+    parser.add_argument("--per-tensor", action="store_true", help="Per-tensor instead of per-channel weight scales.")
+    parser.add_argument("--gate-only", action="store_true", help="Re-run the accuracy gate on an existing INT8 model.")
+    args = parser.parse_args()
+
+    result = {"model": args.output}
+    candidate = args.output
+    if not args.gate_only:
+        # Quantize next to the target and only move it into place once the gate passes,
+        # so a drifted model never replaces the one the onnx_int8 backend loads
+        output_dir = os.path.dirname(os.path.abspath(args.output))
+        os.makedirs(output_dir, exist_ok=True)
+        fd, candidate = tempfile.mkstemp(suffix=".onnx", dir=output_dir)
+        os.close(fd)
+
+    try:
+        if not args.gate_only:
+            result["calibration_images"] = quantize(args.calibration_dir, candidate, per_channel=not args.per_tensor)
+            result["float_mb"] = round(os.path.getsize(ch.weights_path("torch")) / 1e6, 1)
+            result["int8_mb"] = round(os.path.getsize(candidate) / 1e6, 1)
+        result["gate"] = accuracy_gate(args.pairs_dir, candidate, args.max_drift)
+        if candidate != args.output and result["gate"]["passed"]:
+            os.replace(candidate, args.output)
+    finally:
+        if candidate != args.output and os.path.exists(candidate):
+            os.remove(candidate)
+    print(json.dumps(result, indent=2))
+
+    if not result["gate"]["passed"]:
+        logging.error(f"INT8 model flipped {result['gate']['flipped_decisions']} of {result['gate']['pairs']} "
+                      f"decisions (drift {result['gate']['drift']} > {args.max_drift}); "
+                      f"{args.output} was left unchanged.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,144 @@
 import torch
 import torch.nn as nn
 import torchvision.models as models
-import torchvision.transforms as transforms
+import numpy as np
 from PIL import Image
 import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from preprocessing import GRAYSCALE_STEM, batch_buffer, fold_grayscale_stem, preprocess_batch
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+def find_resnet_weights(weights_path=None):
+    """
+    Local ImageNet ResNet18 weights: ``weights_path``, then RESNET_WEIGHTS,
+    then torchvision's download cache (torch.hub.get_dir()/checkpoints).
+    Returns None if none of them exists.
+    """
+    candidates = [
+        weights_path,
+        os.getenv("RESNET_WEIGHTS"),
+        os.path.join(torch.hub.get_dir(), "checkpoints", os.path.basename(models.ResNet18_Weights.IMAGENET1K_V1.url))
+    ]
+    return next((path for path in candidates if path and os.path.exists(path)), None)
 
 # ----------------------------
 # ✅ ResNet Feature Extractor
 # ----------------------------
 class ResNetEmbedder(nn.Module):
-    def __init__(self, device='cpu'):
+    def __init__(self, device='cpu', weights_path=None, batch_size=32, grayscale_stem=GRAYSCALE_STEM):
         super(ResNetEmbedder, self).__init__()
         self.device = device
+        self.batch_size = batch_size
+        self.input_channels = 1 if grayscale_stem else 3
+
+        # Load pre-trained ResNet18 from a local file when possible; only download on a cold machine
+        local_weights = find_resnet_weights(weights_path)
+        if local_weights:
+            resnet = models.resnet18(weights=None)
+            resnet.load_state_dict(torch.load(local_weights, map_location="cpu"))
+        elif weights_path:
+            raise FileNotFoundError(f"ResNet weights not found at: {weights_path}")
+        else:
+            logging.warning("No local ResNet18 weights found; downloading them into the torch hub cache.")
+            resnet = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1)
 
-        # Load pre-trained ResNet18 model and remove the final classification layer
-        resnet = models.resnet18(pretrained=True)
         self.feature_extractor = nn.Sequential(*list(resnet.children())[:-1])  # Remove final FC layer
+        if grayscale_stem:
+            # Inputs are always grayscale: fold the RGB stem and ImageNet normalisation into one channel
+            fold_grayscale_stem(self.feature_extractor)
         self.feature_extractor.to(self.device)
         self.feature_extractor.eval()
 
-        # Preprocessing transform: Resize, Grayscale to RGB, Normalize
-        self.preprocess = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.Grayscale(num_output_channels=3),  # Convert grayscale to RGB-like
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                                 std=[0.229, 0.224, 0.225])
-        ])
+    @staticmethod
+    def _to_gray(image):
+        """Path, PIL image or NumPy array -> uint8 (H, W) luma array (as Grayscale() did)."""
+        if isinstance(image, (str, os.PathLike)):
+            if not os.path.exists(image):
+                raise FileNotFoundError(f"Image not found: {image}")
+            image = Image.open(image)
+        if isinstance(image, np.ndarray):
+            if image.ndim == 2 and image.dtype == np.uint8:
+                return image
+            image = Image.fromarray(image)
+        return np.asarray(image.convert("L"))
 
-    def get_embedding(self, image_path):
+    def preprocess(self, image):
         """
-        Takes in an image path and returns a flattened feature embedding.
+        Path, PIL image or NumPy array -> normalised (3, 224, 224) CPU tensor,
+        as the old transforms.Compose did. feature_extractor accepts it with
+        or without the folded stem; the batch APIs below skip it.
         """
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"Image not found: {image_path}")
-
-        image = Image.open(image_path).convert("RGB")
-        image_tensor = self.preprocess(image).unsqueeze(0).to(self.device)  # Shape: [1, 3, 224, 224]
+        return torch.from_numpy(preprocess_batch([self._to_gray(image)], channels=3)[0])
 
+    def _embed_gray(self, grays):
+        """One forward pass over already decoded grayscale arrays -> (N, 512) NumPy features."""
+        channels = self.input_channels
+        batch = preprocess_batch(grays, channels=channels, out=batch_buffer(len(grays), channels=channels))
         with torch.no_grad():
-            features = self.feature_extractor(image_tensor)
-            features = features.view(features.size(0), -1)  # Flatten
-        return features.squeeze().cpu().numpy()  # NumPy array
+            features = self.feature_extractor(torch.from_numpy(batch).to(self.device))
+        return features.view(features.size(0), -1).cpu().numpy()
+
+    def get_embeddings(self, images, batch_size=None):
+        """
+        Embeds many images, ``batch_size`` per forward pass. ``images`` is a
+        list of paths, PIL images or NumPy arrays, or one (N, H, W) uint8
+        array. Returns an (N, 512) NumPy array in input order.
+        """
+        batch_size = batch_size or self.batch_size
+        if len(images) == 0:
+            return np.empty((0, 512), dtype=np.float32)
+        chunks = []
+        for start in range(0, len(images), batch_size):
+            chunks.append(self._embed_gray([self._to_gray(image) for image in images[start:start + batch_size]]))
+        return np.concatenate(chunks)
+
+    def iter_embeddings(self, directory, batch_size=None, workers=4):
+        """
+        Walks ``directory`` (recursively, in sorted order) and yields
+        (path, embedding) for every image file. Only one batch is held in
+        memory at a time. The next batch is decoded on a thread pool while
+        the current one runs through the model. Unreadable files are skipped
+        with a warning.
+        """
+        batch_size = batch_size or self.batch_size
+        paths = []
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            paths += [os.path.join(root, name) for name in sorted(files) if name.lower().endswith(IMAGE_EXTENSIONS)]
+
+        def decode(path):
+            try:
+                return self._to_gray(path)
+            except Exception as e:
+                logging.warning(f"Skipping unreadable image {path}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            batches = (paths[start:start + batch_size] for start in range(0, len(paths), batch_size))
+            pending = None
+            for batch_paths in batches:
+                decoded = pool.map(decode, batch_paths)
+                if pending is not None:
+                    yield from self._embed_decoded(*pending)
+                pending = (batch_paths, decoded)
+            if pending is not None:
+                yield from self._embed_decoded(*pending)
+
+    def _embed_decoded(self, paths, decoded):
+        kept = [(path, gray) for path, gray in zip(paths, decoded) if gray is not None]
+        if kept:
+            yield from zip([path for path, _ in kept], self._embed_gray([gray for _, gray in kept]))
+
+    def get_embedding(self, image_path):
+        """
+        Takes in an image path and returns a flattened feature embedding.
+        """
+        return self.get_embeddings([image_path])[0]  # NumPy array
 
     def get_embedding_from_array(self, img_array):
         """
         Takes in an image as a NumPy array and returns a flattened feature embedding.
         """
-        # Convert the NumPy array to a PIL Image and preprocess it
-        image = Image.fromarray(img_array).convert("RGB")
-        image_tensor = self.preprocess(image).unsqueeze(0).to(self.device)  # Shape: [1, 3, 224, 224]
-
-        with torch.no_grad():
-            features = self.feature_extractor(image_tensor)
-            features = features.view(features.size(0), -1)  # Flatten
-        return features.squeeze().cpu().numpy()  # NumPy array
+        return self.get_embeddings([img_array])[0]  # NumPy array
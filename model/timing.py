@@ -0,0 +1,124 @@
+import os
+import re
+import sys
+import time
+import random
+import logging
+import tempfile
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# PIPELINE_TIMINGS=1 adds a "spans" object (stage -> ms) to every result JSON
+TIMINGS_ENABLED = os.getenv("PIPELINE_TIMINGS", "0") == "1"
+# PIPELINE_PROFILE=cprofile|pyinstrument dumps a profile for a sample of requests
+PROFILER = os.getenv("PIPELINE_PROFILE", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PIPELINE_PROFILE_SAMPLE", "1.0"))
+PROFILE_DIR = os.getenv("PIPELINE_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "pipeline_profiles"))
+
+_current = contextvars.ContextVar("pipeline_trace", default=None)
+
+@contextmanager
+def span(name: str):
+    """
+    Times the enclosed block into the active trace under ``name``. Repeated
+    spans with the same name add up. Costs nothing when no trace is active.
+    """
+    trace = _current.get()
+    if trace is None or trace.spans is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans[name] = trace.spans.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+class _Profiler:
+    """cProfile or pyinstrument behind one start/stop interface."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        if kind == "pyinstrument":
+            from pyinstrument import Profiler
+            self.profiler = Profiler()
+        else:
+            import cProfile
+            self.profiler = cProfile.Profile()
+
+    def start(self):
+        if self.kind == "pyinstrument":
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop_and_dump(self, path_prefix: str) -> str:
+        if self.kind == "pyinstrument":
+            self.profiler.stop()
+            path = f"{path_prefix}.html"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.profiler.output_html())
+        else:
+            self.profiler.disable()
+            path = f"{path_prefix}.prof"
+            self.profiler.dump_stats(path)
+        return path
+
+class Trace:
+    """
+    Per-request timing context. While entered, span() calls anywhere on the
+    same thread record into it, so deep helpers need no extra parameters.
+    When profiling is on (or ``profile=True``), the request is also run under
+    a profiler and the dump path is reported. attach() copies both into the
+    result dictionary.
+    """
+
+    def __init__(self, label: str, profile: Optional[bool] = None):
+        self.label = label
+        self.spans: Optional[Dict[str, float]] = {} if TIMINGS_ENABLED else None
+        self.total_ms = None
+        self.profile_path = None
+        if profile is None:
+            profile = bool(PROFILER) and random.random() < PROFILE_SAMPLE_RATE
+        self._profiler = None
+        if profile:
+            try:
+                self._profiler = _Profiler(PROFILER or "cprofile")
+            except ImportError:
+                logging.warning(f"Profiler '{PROFILER}' is not installed; falling back to cProfile.")
+                self._profiler = _Profiler("cprofile")
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self._started = time.perf_counter()
+        if self._profiler is not None:
+            try:
+                self._profiler.start()
+            except ValueError as e:  # another profiler is already active on this interpreter
+                logging.warning(f"Skipping profile for {self.label}: {e}")
+                self._profiler = None
+        return self
+
+    def __exit__(self, *exc):
+        self.total_ms = (time.perf_counter() - self._started) * 1000
+        if self._profiler is not None:
+            try:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                name = re.sub(r"[^A-Za-z0-9_-]", "_", self.label)
+                prefix = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{id(self):x}")
+                self.profile_path = self._profiler.stop_and_dump(prefix)
+                print(f"Profile for {self.label} written to {self.profile_path}", file=sys.stderr)
+            except Exception as e:
+                logging.warning(f"Could not write profile for {self.label}: {e}")
+        _current.reset(self._token)
+        return False
+
+    def attach(self, result: dict) -> dict:
+        """Adds "spans" (when PIPELINE_TIMINGS=1) and "profile" (when profiled) to a result."""
+        if self.spans is not None:
+            result["spans"] = {name: round(ms, 2) for name, ms in self.spans.items()}
+            if self.total_ms is not None:
+                result["spans"]["total"] = round(self.total_ms, 2)
+        if self.profile_path:
+            result["profile"] = self.profile_path
+        return result
@@ -0,0 +1,169 @@
+# attendance_store.py
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+
+ATTENDANCE_FIELDS = ['student_id', 'name', 'date', 'time', 'subject', 'status']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendance (
+    student_id TEXT NOT NULL,
+    name       TEXT NOT NULL,
+    date       TEXT NOT NULL,
+    time       TEXT NOT NULL,
+    subject    TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    PRIMARY KEY (student_id, date, time)
+);
+CREATE INDEX IF NOT EXISTS idx_attendance_date_subject ON attendance (date, subject);
+CREATE INDEX IF NOT EXISTS idx_attendance_subject_date ON attendance (subject, date);
+"""
+
+class AttendanceStore:
+    """
+    SQLite-backed attendance history, replacing the append-only attendance.csv.
+
+    A session is one bulk insert in a single transaction, a status edit is a
+    primary-key lookup on (student_id, date, time), and date/subject filters
+    are served from indexes instead of scanning the whole history. The
+    database runs in WAL mode so the face service can write while the
+    backend reads.
+    """
+
+    def __init__(self, db_path: str = 'attendance.db', legacy_csv: str = None):
+        is_new = not os.path.exists(db_path) or os.path.getsize(db_path) == 0
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+        # First open next to an existing CSV history: carry it over once
+        legacy_csv = legacy_csv or os.path.join(os.path.dirname(os.path.abspath(db_path)), 'attendance.csv')
+        if is_new and os.path.exists(legacy_csv):
+            imported = self.import_csv(legacy_csv)
+            print(f"Imported {imported} attendance rows from {legacy_csv}.", file=sys.stderr)
+
+    def close(self):
+        self.conn.close()
+
+    def record_session(self, records: list) -> int:
+        """Inserts one session's rows (dicts with ATTENDANCE_FIELDS) in a single transaction."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO attendance (student_id, name, date, time, subject, status) "
+                "VALUES (:student_id, :name, :date, :time, :subject, :status)",
+                records
+            )
+        return len(records)
+
+    def update_status(self, student_id: str, date: str, time: str, status: str) -> bool:
+        """Sets the status of one record. Returns False if no such record exists."""
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE attendance SET status = ? WHERE student_id = ? AND date = ? AND time = ?",
+                (status, student_id, date, time)
+            )
+        return cursor.rowcount > 0
+
+    def _where(self, date: str = None, subject: str = None):
+        clauses, params = [], []
+        if date:
+            clauses.append("date = ?")
+            params.append(date)
+        if subject:
+            clauses.append("subject = ?")
+            params.append(subject)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, date: str = None, subject: str = None) -> list:
+        """Returns matching records as dicts, in the order they were recorded."""
+        where, params = self._where(date, subject)
+        rows = self.conn.execute(
+            f"SELECT student_id, name, date, time, subject, status FROM attendance{where} ORDER BY rowid",
+            params
+        )
+        return [dict(row) for row in rows]
+
+    def statistics(self, date: str = None, subject: str = None) -> dict:
+        """Present/absent counts overall, per subject and per date, aggregated in SQL."""
+        where, params = self._where(date, subject)
+        stats = {'total': 0, 'present': 0, 'absent': 0, 'bySubject': {}, 'byDate': {}}
+        rows = self.conn.execute(
+            f"SELECT subject, date, status, COUNT(*) AS n FROM attendance{where} GROUP BY subject, date, status",
+            params
+        )
+        for row in rows:
+            key = 'present' if row['status'] == 'Present' else 'absent' if row['status'] == 'Absent' else None
+            for bucket in (stats, stats['bySubject'].setdefault(row['subject'], {'total': 0, 'present': 0, 'absent': 0}),
+                           stats['byDate'].setdefault(row['date'], {'total': 0, 'present': 0, 'absent': 0})):
+                bucket['total'] += row['n']
+                if key:
+                    bucket[key] += row['n']
+        return stats
+
+    def import_csv(self, csv_path: str) -> int:
+        """Imports an attendance.csv history. Rows already present are left untouched."""
+        with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+            records = [
+                {field: (row.get(field) or '').strip() for field in ATTENDANCE_FIELDS}
+                for row in csv.DictReader(f)
+                if row.get('student_id') and row.get('date') and row.get('time')
+            ]
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO attendance (student_id, name, date, time, subject, status) "
+                "VALUES (:student_id, :name, :date, :time, :subject, :status)",
+                records
+            )
+            return self.conn.total_changes - before
+
+def main():
+    parser = argparse.ArgumentParser(description="Query and maintain the attendance database.")
+    parser.add_argument("--db", default="attendance.db", help="Path to the SQLite database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query = commands.add_parser("query", help="List attendance records.")
+    query.add_argument("--date")
+    query.add_argument("--subject")
+
+    stats = commands.add_parser("stats", help="Present/absent counts.")
+    stats.add_argument("--date")
+    stats.add_argument("--subject")
+
+    update = commands.add_parser("update", help="Change the status of one record.")
+    update.add_argument("student_id")
+    update.add_argument("date")
+    update.add_argument("time")
+    update.add_argument("status", choices=["Present", "Absent"])
+
+    import_cmd = commands.add_parser("import", help="Import an attendance.csv history.")
+    import_cmd.add_argument("csv_path")
+
+    args = parser.parse_args()
+    try:
+        store = AttendanceStore(args.db)
+        if args.command == "query":
+            records = store.query(args.date, args.subject)
+            result = {"success": True, "records": records, "count": len(records)}
+        elif args.command == "stats":
+            result = {"success": True, "statistics": store.statistics(args.date, args.subject)}
+        elif args.command == "update":
+            updated = store.update_status(args.student_id, args.date, args.time, args.status)
+            result = {"success": updated, "message": None if updated else "record_not_found"}
+        else:
+            result = {"success": True, "imported": store.import_csv(args.csv_path)}
+        store.close()
+    except (sqlite3.Error, OSError, csv.Error) as e:
+        result = {"success": False, "message": str(e)}
+
+    print(json.dumps(result))
+    if not result["success"] and result.get("message") != "record_not_found":
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
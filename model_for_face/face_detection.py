@@ -0,0 +1,178 @@
+# face_detection.py
+import math
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+def plan_tiles(width: int, height: int, tile_size: int, overlap: int) -> list:
+    """
+    Splits a width x height image into overlapping (x0, y0, x1, y1) tiles.
+    Neighbouring tiles share ``overlap`` pixels, so any face smaller than the
+    overlap lies wholly inside at least one tile.
+    """
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        step = tile_size - overlap
+        count = math.ceil((length - tile_size) / step) + 1
+        # Spread the tiles evenly so the last one ends exactly on the border
+        return [round(i * (length - tile_size) / (count - 1)) for i in range(count)]
+
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in starts(height) for x0 in starts(width)
+    ]
+
+def _init_worker(detector_backend: str):
+    """
+    Loads the detector once per pool process. fd 1 is the parent's NDJSON
+    reply pipe in --serve mode, so the worker's stdout (TF/DeepFace banners,
+    download progress) is pointed at stderr first.
+    """
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+    from deepface import DeepFace
+    DeepFace.build_model(model_name=detector_backend, task="face_detector")
+
+def detect_tile(tile: np.ndarray, offset: tuple, detector_backend: str) -> list:
+    """
+    Runs the detector on one tile and returns (x, y, w, h, confidence,
+    left_eye, right_eye) tuples in the coordinates of the image the tile was
+    cut from. Alignment is skipped here; crops are taken later at full resolution.
+    """
+    from deepface import DeepFace
+    faces = DeepFace.extract_faces(
+        img_path=tile, detector_backend=detector_backend, enforce_detection=False, align=False
+    )
+    offset_x, offset_y = offset
+    shift = lambda point: (point[0] + offset_x, point[1] + offset_y) if point is not None else None
+    return [
+        (area['x'] + offset_x, area['y'] + offset_y, area['w'], area['h'], face['confidence'],
+         shift(area.get('left_eye')), shift(area.get('right_eye')))
+        for face in faces if face['confidence'] != 0
+        for area in [face['facial_area']]
+    ]
+
+def merge_detections(detections: list, iou_threshold: float = 0.4, containment_threshold: float = 0.7) -> list:
+    """
+    Greedy non-maximum suppression over detections from overlapping tiles.
+    A box is dropped if it overlaps a higher-confidence box by more than
+    ``iou_threshold`` IoU, or if most of it (``containment_threshold`` of the
+    smaller box) lies inside one, which removes faces cut in half at a seam.
+    """
+    if not detections:
+        return []
+    boxes = np.array([d[:4] for d in detections], dtype=np.float32)
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+    order = np.argsort([-d[4] for d in detections], kind='stable')
+
+    kept = []
+    while len(order):
+        best, rest = order[0], order[1:]
+        kept.append(detections[best])
+        inter_w = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None)
+        inter = inter_w * inter_h
+        iou = inter / (areas[best] + areas[rest] - inter + 1e-6)
+        containment = inter / (np.minimum(areas[best], areas[rest]) + 1e-6)
+        order = rest[(iou <= iou_threshold) & (containment <= containment_threshold)]
+    return kept
+
+def align_face(img: np.ndarray, facial_area: dict) -> np.ndarray:
+    """
+    Cuts one face out of the full-resolution BGR image, rotated so the eyes
+    are level, and returns it the way DeepFace.extract_faces does: RGB float
+    in [0, 1]. Only the w x h output is warped, never the whole image.
+    """
+    x, y, w, h = facial_area['x'], facial_area['y'], facial_area['w'], facial_area['h']
+    left_eye, right_eye = facial_area.get('left_eye'), facial_area.get('right_eye')
+    angle = 0.0
+    if left_eye is not None and right_eye is not None:
+        angle = math.degrees(math.atan2(left_eye[1] - right_eye[1], left_eye[0] - right_eye[0]))
+
+    matrix = cv2.getRotationMatrix2D((x + w / 2, y + h / 2), angle, 1.0)
+    matrix[0, 2] -= x
+    matrix[1, 2] -= y
+    crop = cv2.warpAffine(img, matrix, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+    return crop[:, :, ::-1].astype(np.float32) / 255
+
+class TiledFaceDetector:
+    """
+    Face detection for large classroom photos. The image is first downscaled
+    so its longer side is at most ``max_side``, then cut into overlapping
+    tiles that are detected in parallel on a process pool. Boxes are mapped
+    back to full-resolution coordinates, duplicates from tile seams are
+    merged, and each face is cropped from the full-resolution image.
+    """
+
+    def __init__(self, detector_backend: str = 'mtcnn', max_side: int = None, tile_size: int = None,
+                 overlap: int = None, workers: int = None):
+        self.detector_backend = detector_backend
+        self.max_side = max_side or int(os.getenv('FACE_DETECTION_MAX_SIDE', '2560'))
+        self.tile_size = tile_size or int(os.getenv('FACE_DETECTION_TILE', '1024'))
+        self.overlap = overlap or int(os.getenv('FACE_DETECTION_OVERLAP', '160'))
+        self.workers = workers or int(os.getenv('FACE_DETECTION_WORKERS', str(min(4, os.cpu_count() or 1))))
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # TensorFlow is not fork-safe, so pool processes are spawned fresh
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.detector_backend,)
+            )
+        return self._pool
+
+    def warm_up(self):
+        """Starts every pool process and loads its detector before the first photo arrives."""
+        pool = self._get_pool()
+        list(pool.map(_init_worker, [self.detector_backend] * self.workers))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def detect(self, img: np.ndarray) -> list:
+        """
+        Returns the faces in a BGR image as extract_faces-style dicts with
+        'face', 'facial_area' (full-resolution coordinates) and 'confidence'.
+        """
+        height, width = img.shape[:2]
+        scale = min(1.0, self.max_side / max(height, width))
+        small = cv2.resize(img, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA) \
+            if scale < 1.0 else img
+
+        tiles = plan_tiles(small.shape[1], small.shape[0], self.tile_size, self.overlap)
+        jobs = [(small[y0:y1, x0:x1], (x0, y0), self.detector_backend) for x0, y0, x1, y1 in tiles]
+        if len(jobs) == 1 or self.workers <= 1:
+            results = [detect_tile(*job) for job in jobs]
+        else:
+            results = list(self._get_pool().map(detect_tile, *zip(*jobs)))
+
+        merged = merge_detections([detection for result in results for detection in result])
+
+        faces = []
+        for x, y, w, h, confidence, left_eye, right_eye in merged:
+            to_full = lambda value: int(round(value / scale))
+            facial_area = {
+                'x': max(0, to_full(x)),
+                'y': max(0, to_full(y)),
+                'w': min(width - max(0, to_full(x)), to_full(w)),
+                'h': min(height - max(0, to_full(y)), to_full(h)),
+                'left_eye': (to_full(left_eye[0]), to_full(left_eye[1])) if left_eye is not None else None,
+                'right_eye': (to_full(right_eye[0]), to_full(right_eye[1])) if right_eye is not None else None
+            }
+            if facial_area['w'] <= 0 or facial_area['h'] <= 0:
+                continue
+            faces.append({'face': align_face(img, facial_area), 'facial_area': facial_area, 'confidence': confidence})
+        return faces
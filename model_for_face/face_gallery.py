@@ -0,0 +1,106 @@
+# face_gallery.py
+import numpy as np
+
+class FaceGallery:
+    """
+    Registered face embeddings kept as one contiguous, L2-normalised float32
+    matrix, so cosine similarity against every student is a single matrix
+    multiply instead of a Python loop.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.names = []
+        self._buffer = np.empty((0, 0), dtype=np.float32)
+        self._size = 0
+        self.index = None
+
+    @staticmethod
+    def normalize(embeddings) -> np.ndarray:
+        """Returns the embeddings as a C-contiguous float32 matrix with unit-length rows."""
+        matrix = np.ascontiguousarray(np.atleast_2d(embeddings), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """The (students, dim) normalised gallery; a view, not a copy."""
+        return self._buffer[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def load(self, ids, names, embeddings):
+        """Replaces the gallery contents in one go."""
+        self.ids = list(ids)
+        self.names = list(names)
+        self._buffer = self.normalize(embeddings) if self.ids else np.empty((0, 0), dtype=np.float32)
+        self._size = len(self.ids)
+        self.index = None
+
+    def attach_index(self, index):
+        """
+        Routes matching through an approximate index (see face_index.IVFIndex).
+        Rows registered after the index was built are filed into it here.
+        """
+        filed = index.ntotal
+        index.bind(self.matrix)
+        if filed < self._size:
+            index.add(np.arange(filed, self._size), self.matrix[filed:])
+        self.index = index
+
+    def add(self, student_id: str, name: str, embedding):
+        """Appends one student, growing the buffer geometrically so appends stay amortised O(dim)."""
+        row = self.normalize(embedding)[0]
+        if self._size == 0 and self._buffer.shape[1] != row.shape[0]:
+            self._buffer = np.empty((16, row.shape[0]), dtype=np.float32)
+        elif self._size == self._buffer.shape[0]:
+            grown = np.empty((max(16, self._size * 2), self._buffer.shape[1]), dtype=np.float32)
+            grown[:self._size] = self._buffer[:self._size]
+            self._buffer = grown
+        self._buffer[self._size] = row
+        self._size += 1
+        self.ids.append(student_id)
+        self.names.append(name)
+        if self.index is not None:
+            self.index.add(self._size - 1, row)
+
+    def similarities(self, queries) -> np.ndarray:
+        """Cosine similarity of every query against every student, shape (queries, students)."""
+        return self.normalize(queries) @ self.matrix.T
+
+    def top_k(self, queries, k: int = 1):
+        """
+        Returns (indices, scores), each of shape (queries, k), sorted by
+        descending similarity. k is capped at the gallery size. Uses the
+        attached approximate index when there is one, else exact search.
+        """
+        if self.index is not None:
+            return self.index.search(self.normalize(queries), k=min(k, self._size))
+
+        scores = self.similarities(queries)
+        k = min(k, self._size)
+        if k == 0:
+            empty = np.empty((scores.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        if k < self._size:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.tile(np.arange(self._size), (scores.shape[0], 1))
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+    def best_matches(self, queries, threshold: float):
+        """
+        Returns one (index, score) per query for its most similar student, or
+        (None, score) when even the best score does not exceed ``threshold``.
+        """
+        if self._size == 0:
+            return [(None, 0.0) for _ in range(len(np.atleast_2d(queries)))]
+        indices, scores = self.top_k(queries, k=1)
+        return [
+            (int(index), float(score)) if index >= 0 and score > threshold else (None, max(float(score), 0.0))
+            for index, score in zip(indices[:, 0], scores[:, 0])
+        ]
@@ -0,0 +1,130 @@
+# face_index.py
+import json
+import sys
+import numpy as np
+
+class IVFIndex:
+    """
+    Inverted-file (IVF) index over L2-normalised face embeddings.
+
+    Gallery rows are clustered around ``nlist`` spherical k-means centroids. A
+    query only scores the rows filed under its ``nprobe`` closest centroids, so
+    search cost grows with nprobe * (students / nlist) instead of with the whole
+    gallery. Scores are exact cosine similarities, so thresholds keep their
+    meaning; only recall is approximate.
+    """
+
+    def __init__(self, centroids: np.ndarray, lists: list, nprobe: int = 8):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.lists = lists
+        self.nprobe = nprobe
+        # Per-list contiguous copies of the filed vectors, filled by bind()/add()
+        self.blocks = None
+
+    @property
+    def ntotal(self) -> int:
+        return sum(len(rows) for rows in self.lists)
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, nlist: int = None, nprobe: int = 8,
+              iterations: int = 10, seed: int = 0) -> "IVFIndex":
+        """Runs spherical k-means over a normalised (rows, dim) gallery matrix."""
+        count = matrix.shape[0]
+        nlist = nlist or max(1, int(np.sqrt(count)))
+        nlist = min(nlist, count)
+        rng = np.random.default_rng(seed)
+        centroids = matrix[rng.choice(count, nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = np.argmax(matrix @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, matrix)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty clusters from random rows so every list stays useful
+            sums[empty] = matrix[rng.choice(count, int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = sums / norms
+
+        index = cls(centroids, [np.empty(0, dtype=np.int64) for _ in range(nlist)], nprobe)
+        index.bind(np.empty((0, matrix.shape[1]), dtype=np.float32))
+        index.add(np.arange(count), matrix)
+        return index
+
+    def bind(self, matrix: np.ndarray):
+        """Copies each list's vectors out of the gallery matrix into contiguous blocks."""
+        self.blocks = [np.ascontiguousarray(matrix[rows], dtype=np.float32) for rows in self.lists]
+
+    def add(self, row_ids, vectors):
+        """Files new gallery rows (and their vectors) under their closest centroid."""
+        row_ids = np.atleast_1d(np.asarray(row_ids, dtype=np.int64))
+        vectors = np.atleast_2d(vectors).astype(np.float32, copy=False)
+        assignment = np.argmax(vectors @ self.centroids.T, axis=1)
+        for list_id in np.unique(assignment):
+            selected = assignment == list_id
+            self.lists[list_id] = np.concatenate([self.lists[list_id], row_ids[selected]])
+            self.blocks[list_id] = np.vstack([self.blocks[list_id], vectors[selected]])
+
+    def search(self, queries: np.ndarray, k: int = 1, nprobe: int = None):
+        """
+        Returns (indices, scores) of shape (queries, k) for normalised queries,
+        best first. Slots without a candidate hold index -1 and score -inf.
+
+        Work is grouped by list: every probed list is scored against all the
+        queries that probe it in one matrix multiply.
+        """
+        nprobe = min(nprobe or self.nprobe, len(self.lists))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+
+        for list_id in np.unique(probes):
+            rows = self.lists[list_id]
+            if len(rows) == 0:
+                continue
+            query_ids = np.flatnonzero((probes == list_id).any(axis=1))
+            block_scores = queries[query_ids] @ self.blocks[list_id].T
+            top = min(k, len(rows))
+            best = np.argpartition(-block_scores, top - 1, axis=1)[:, :top]
+
+            # Merge this list's best candidates into each query's running top-k
+            merged_scores = np.hstack([scores[query_ids], np.take_along_axis(block_scores, best, axis=1)])
+            merged_indices = np.hstack([indices[query_ids], rows[best]])
+            order = np.argsort(-merged_scores, axis=1)[:, :k]
+            scores[query_ids] = np.take_along_axis(merged_scores, order, axis=1)
+            indices[query_ids] = np.take_along_axis(merged_indices, order, axis=1)
+        return indices, scores
+
+    def save(self, path: str):
+        sizes = np.array([len(rows) for rows in self.lists], dtype=np.int64)
+        rows = np.concatenate(self.lists) if self.lists else np.empty(0, dtype=np.int64)
+        np.savez(path, centroids=self.centroids, sizes=sizes, rows=rows, nprobe=self.nprobe)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        data = np.load(path)
+        offsets = np.concatenate([[0], np.cumsum(data['sizes'])])
+        lists = [data['rows'][offsets[i]:offsets[i + 1]] for i in range(len(data['sizes']))]
+        return cls(data['centroids'], lists, int(data['nprobe']))
+
+if __name__ == "__main__":
+    # Offline build: python face_index.py build [nlist] [nprobe]
+    if len(sys.argv) < 2 or sys.argv[1] != "build":
+        print("Usage: face_index.py build [nlist] [nprobe]", file=sys.stderr)
+        sys.exit(1)
+
+    from face_gallery import FaceGallery
+    from face_store import FaceStore
+
+    ids, names, embeddings = FaceStore('registered_students').load()
+    if not ids:
+        print(json.dumps({"success": False, "message": "No registered students to index."}))
+        sys.exit(1)
+
+    gallery = FaceGallery()
+    gallery.load(ids, names, embeddings)
+    nlist = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    nprobe = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    index = IVFIndex.build(gallery.matrix, nlist=nlist, nprobe=nprobe)
+    index.save('registered_students.ivf.npz')
+    print(json.dumps({"success": True, "students": index.ntotal, "nlist": len(index.lists), "nprobe": index.nprobe}))
@@ -6,8 +6,19 @@ import os
 import sys
 import jwt
 import json
+import time
 from datetime import datetime
 from deepface import DeepFace
+from face_gallery import FaceGallery
+from face_store import FaceStore
+from face_index import IVFIndex
+from attendance_store import AttendanceStore
+from face_detection import TiledFaceDetector
+from face_tracking import FaceTracker, iter_frames
+
+# Per-stage timing spans are shared with the handwriting scripts in ../model
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model'))
+from timing import Trace, span
 
 # Suppress TensorFlow informational messages
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3' 
@@ -17,28 +28,104 @@ JWT_SECRET = "4349ef690de9a0fa8704f4d8ec9238e01a8446000d6d4cbc494dfa397468772b"
 class ArcFaceSystem:
     def __init__(self):
         self.registered_students = []
+        self.store = FaceStore('registered_students')
+        self.gallery = FaceGallery()
         self.load_registered_students()
         self.detector_backend = 'mtcnn'
         self.embedding_model = 'ArcFace'
         self.threshold = 0.68
         self.distance_metric = 'cosine'
         self.duplicate_threshold = 0.80
+        self.embedding_batch_size = 32
+        # Burst/video attendance: embed each tracked face at most this many times
+        self.max_embeddings_per_track = 3
+        self.video_sample_fps = 2.0
+        self.max_burst_frames = 60
+        self.last_timings = {}
+        self.attendance_store = None
+        # 'full' runs the detector on the whole photo; 'tiled' on downscaled tiles in a process pool
+        self.detection_mode = os.getenv('FACE_DETECTION', 'full')
+        self.tiled_detector = TiledFaceDetector(self.detector_backend) if self.detection_mode == 'tiled' else None
 
     def load_registered_students(self):
-        """Load registered students from the CSV file into memory."""
-        if os.path.exists('registered_students.csv'):
-            try:
-                with open('registered_students.csv', 'r', newline='') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        self.registered_students.append({
-                            'id': row['id'],
-                            'name': row['name'],
-                            'embedding': np.array(eval(row['embedding']))
-                        })
-            except (IOError, csv.Error) as e:
-                print(f"Warning: Could not load students. Error: {e}", file=sys.stderr)
-                self.registered_students = []
+        """Load registered students from the binary face store into memory."""
+        try:
+            if not self.store.exists() and os.path.exists('registered_students.csv'):
+                migrated = self.store.migrate_csv('registered_students.csv')
+                print(f"Migrated {migrated} students from registered_students.csv to the binary store.", file=sys.stderr)
+
+            ids, names, embeddings = self.store.load()
+            embeddings = np.asarray(embeddings)  # plain ndarray view over the memmap
+            self.registered_students = [
+                {'id': student_id, 'name': name, 'embedding': embeddings[i]}
+                for i, (student_id, name) in enumerate(zip(ids, names))
+            ]
+            self.gallery.load(ids, names, embeddings)
+            if os.path.exists('registered_students.ivf.npz') and os.getenv('FACE_ANN', '1') != '0':
+                self.gallery.attach_index(IVFIndex.load('registered_students.ivf.npz'))
+        except (IOError, ValueError, KeyError, csv.Error) as e:
+            print(f"Warning: Could not load students. Error: {e}", file=sys.stderr)
+            self.registered_students = []
+            self.gallery.load([], [], [])
+
+    def match_faces(self, embeddings, top_k: int = 1) -> list:
+        """
+        Scores every face embedding against every registered student with one
+        matrix multiply. Returns, per face, up to ``top_k`` dicts with the
+        student id, name and cosine similarity, best first.
+        """
+        if len(self.gallery) == 0:
+            return [[] for _ in embeddings]
+        indices, scores = self.gallery.top_k(np.asarray(embeddings), k=top_k)
+        return [
+            [{'id': self.gallery.ids[i], 'name': self.gallery.names[i], 'similarity': float(score)}
+             for i, score in zip(row_indices, row_scores) if i >= 0]
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+
+    def warm_up(self):
+        """Loads the detector and embedding weights now rather than on the first request."""
+        DeepFace.build_model(model_name=self.embedding_model)
+        DeepFace.build_model(model_name=self.detector_backend, task="face_detector")
+        if self.tiled_detector is not None:
+            self.tiled_detector.warm_up()
+
+    def _embed_faces(self, face_images: list) -> np.ndarray:
+        """
+        Embeds already-cropped faces with ArcFace, sending up to
+        ``embedding_batch_size`` crops through the model per forward pass
+        instead of one DeepFace.represent call per face. Batched represent
+        needs deepface >= 0.0.94 (pinned in requirements.txt).
+        """
+        embeddings = []
+        for start in range(0, len(face_images), self.embedding_batch_size):
+            chunk = face_images[start:start + self.embedding_batch_size]
+            with span('embedding'):
+                results = DeepFace.represent(
+                    img_path=chunk, model_name=self.embedding_model, detector_backend='skip'
+                )
+            # A single-image batch comes back unwrapped
+            if len(chunk) == 1:
+                results = [results]
+            embeddings.extend(result[0]['embedding'] for result in results)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def _detect_faces(self, processed_img: np.ndarray) -> list:
+        """
+        Detects faces in a brightness-adjusted BGR image. Returns extract_faces
+        style dicts ('face', 'facial_area', 'confidence') for real detections only.
+        """
+        if self.tiled_detector is not None:
+            with span('detection'):
+                return self.tiled_detector.detect(processed_img)
+        with span('detection'):
+            faces = DeepFace.extract_faces(
+                img_path=processed_img,
+                detector_backend=self.detector_backend,
+                enforce_detection=False
+            )
+        # Keep only real detections; extract_faces has already aligned each crop
+        return [face_data for face_data in faces if face_data['confidence'] != 0]
 
     def _adjust_brightness(self, img: np.ndarray) -> np.ndarray:
         """Improves brightness and contrast of an image using CLAHE."""
@@ -52,13 +139,9 @@ class ArcFaceSystem:
 
     def check_duplicate_face(self, new_embedding):
         """Check if the face embedding already exists in the database."""
-        for student in self.registered_students:
-            ref_embedding = student['embedding']
-            similarity = np.dot(new_embedding, ref_embedding) / (
-                np.linalg.norm(new_embedding) * np.linalg.norm(ref_embedding)
-            )
-            if similarity > self.duplicate_threshold:
-                return True, student['id'], student['name'], similarity
+        index, similarity = self.gallery.best_matches(new_embedding, self.duplicate_threshold)[0]
+        if index is not None:
+            return True, self.gallery.ids[index], self.gallery.names[index], similarity
         return False, None, None, 0.0
 
     def register_student(self, student_id: str, name: str, image_path: str) -> tuple:
@@ -70,14 +153,16 @@ class ArcFaceSystem:
             if not student_id.isalnum():
                 return False, "Invalid student ID format. Use only letters and numbers."
 
-            img = cv2.imread(image_path)
+            with span('read_image'):
+                img = cv2.imread(image_path)
             if img is None:
                 return False, f"Cannot read the image file at: {image_path}"
 
-            embedding_obj = DeepFace.represent(
-                img_path=image_path, model_name=self.embedding_model,
-                detector_backend=self.detector_backend, enforce_detection=True
-            )
+            with span('represent'):
+                embedding_obj = DeepFace.represent(
+                    img_path=image_path, model_name=self.embedding_model,
+                    detector_backend=self.detector_backend, enforce_detection=True
+                )
 
             if len(embedding_obj) > 1:
                 return False, "Multiple faces were detected. Please use an image with only one person."
@@ -85,20 +170,18 @@ class ArcFaceSystem:
             new_embedding = embedding_obj[0]['embedding']
             new_embedding_array = np.array(new_embedding)
 
-            is_duplicate, existing_id, existing_name, similarity = self.check_duplicate_face(new_embedding_array)
+            with span('duplicate_check'):
+                is_duplicate, existing_id, existing_name, similarity = self.check_duplicate_face(new_embedding_array)
             if is_duplicate:
                 return False, f"Face already registered as Student ID: {existing_id}, Name: {existing_name} (Similarity: {similarity:.2%}). Cannot register duplicate face."
 
-            file_exists = os.path.exists('registered_students.csv') and os.path.getsize('registered_students.csv') > 0
-            with open('registered_students.csv', 'a', newline='') as f:
-                writer = csv.writer(f)
-                if not file_exists:
-                    writer.writerow(['id', 'name', 'embedding'])
-                writer.writerow([student_id, name, list(new_embedding)])
+            with span('store_write'):
+                self.store.append(student_id, name, new_embedding_array)
 
             self.registered_students.append({
                 'id': student_id, 'name': name, 'embedding': new_embedding_array
             })
+            self.gallery.add(student_id, name, new_embedding_array)
 
             return True, "Student registered successfully."
 
@@ -117,7 +200,8 @@ class ArcFaceSystem:
             if not self.registered_students:
                 return False, "No students are registered in the system. Cannot take attendance."
 
-            img = cv2.imread(image_path)
+            with span('read_image'):
+                img = cv2.imread(image_path)
             if img is None:
                 return False, f"Cannot read the image file at: {image_path}"
 
@@ -128,50 +212,45 @@ class ArcFaceSystem:
                 return False, f"Invalid date format: {attendance_date}. Expected YYYY-MM-DD."
 
             # Step 1: Adjust brightness/contrast of the image
-            processed_img = self._adjust_brightness(img)
+            with span('brightness'):
+                processed_img = self._adjust_brightness(img)
 
             present_student_ids = set()
             
             # Step 2: Extract faces from the adjusted image
-            faces = DeepFace.extract_faces(
-                img_path=processed_img,
-                detector_backend=self.detector_backend,
-                enforce_detection=False
-            )
-
-            for face_data in faces:
-                if face_data['confidence'] == 0: 
-                    continue
-
+            started = time.perf_counter()
+            detected = self._detect_faces(processed_img)
+            detection_ms = (time.perf_counter() - started) * 1000
+            detected_faces = [face_data['facial_area'] for face_data in detected]
+
+            # Step 2b: Embed every crop in batched forward passes
+            started = time.perf_counter()
+            face_embeddings = self._embed_faces([face_data['face'] for face_data in detected])
+            embedding_ms = (time.perf_counter() - started) * 1000
+
+            # Match all faces against all students in a single matrix multiply
+            started = time.perf_counter()
+            with span('matching'):
+                matches = self.gallery.best_matches(face_embeddings, self.threshold) if len(face_embeddings) else []
+            matching_ms = (time.perf_counter() - started) * 1000
+
+            self.last_timings = {
+                'faces': len(detected_faces),
+                'detection_mode': self.detection_mode,
+                'detection_ms': round(detection_ms, 2),
+                'embedding_ms': round(embedding_ms, 2),
+                'matching_ms': round(matching_ms, 2)
+            }
+            print(f"Attendance timings: {self.last_timings}", file=sys.stderr)
+
+            for facial_area, (match_index, similarity) in zip(detected_faces, matches):
                 # Get coordinates for drawing the box
-                x, y, w, h = face_data['facial_area']['x'], face_data['facial_area']['y'], face_data['facial_area']['w'], face_data['facial_area']['h']
-                
-                # The cropped face image is already provided by extract_faces
-                face_image = face_data['face']
-                
-                embedding_obj = DeepFace.represent(
-                    img_path=face_image, model_name=self.embedding_model, detector_backend='skip'
-                )
-                
-                test_embedding = np.array(embedding_obj[0]['embedding'])
-                best_match_student_id = None
-                best_match_student_name = "Unknown"
-                max_similarity = 0.0
-
-                for student in self.registered_students:
-                    ref_embedding = student['embedding']
-                    similarity = np.dot(test_embedding, ref_embedding) / (
-                        np.linalg.norm(test_embedding) * np.linalg.norm(ref_embedding)
-                    )
-                    if similarity > self.threshold and similarity > max_similarity:
-                        max_similarity = similarity
-                        best_match_student_id = student['id']
-                        best_match_student_name = student['name']
+                x, y, w, h = facial_area['x'], facial_area['y'], facial_area['w'], facial_area['h']
 
                 # Step 3: Draw boxes and labels on the image
-                if best_match_student_id:
-                    present_student_ids.add(best_match_student_id)
-                    label = f"{best_match_student_name} ({max_similarity:.2f})"
+                if match_index is not None:
+                    present_student_ids.add(self.gallery.ids[match_index])
+                    label = f"{self.gallery.names[match_index]} ({similarity:.2f})"
                     color = (0, 255, 0) # Green for recognized
                 else:
                     label = "Unknown"
@@ -185,7 +264,8 @@ class ArcFaceSystem:
             # Step 4: Save the processed image to a new file
             base, ext = os.path.splitext(image_path)
             output_image_path = f"{base}_processed{ext}"
-            cv2.imwrite(output_image_path, processed_img)
+            with span('write_image'):
+                cv2.imwrite(output_image_path, processed_img)
 
             # Step 5: Save attendance with the provided date instead of current date
             self._save_full_attendance_report(subject, present_student_ids, attendance_date)
@@ -201,6 +281,83 @@ class ArcFaceSystem:
         except Exception as e:
             return False, f"An unexpected attendance error occurred: {str(e)}"
 
+    def take_attendance_burst(self, subject: str, media_paths: list, attendance_date: str) -> tuple:
+        """
+        Takes attendance from several photos and/or short videos of the same
+        class. Faces are tracked across the frames of one video by box overlap,
+        so a face that has been identified is not embedded again, and an
+        unidentified one is embedded at most ``max_embeddings_per_track``
+        times. Every photo and video starts a fresh tracker: overlapping boxes
+        in different files say nothing about who the face belongs to. Processing stops
+        as soon as every registered student has been seen. One merged report
+        is saved for the whole burst.
+        """
+        try:
+            if not self.registered_students:
+                return False, "No students are registered in the system. Cannot take attendance."
+
+            try:
+                datetime.strptime(attendance_date, '%Y-%m-%d')
+            except ValueError:
+                return False, f"Invalid date format: {attendance_date}. Expected YYYY-MM-DD."
+
+            tracker, tracked_media = None, None
+            present_student_ids = set()
+            all_ids = set(self.gallery.ids)
+            timings = {'frames': 0, 'faces': 0, 'embedded': 0, 'detection_ms': 0.0, 'embedding_ms': 0.0, 'matching_ms': 0.0}
+
+            frames = iter_frames(media_paths, self.video_sample_fps, self.max_burst_frames)
+            for frame_index, (media_index, frame) in enumerate(frames):
+                if media_index != tracked_media:
+                    tracker, tracked_media = FaceTracker(), media_index
+                timings['frames'] += 1
+                started = time.perf_counter()
+                detected = self._detect_faces(self._adjust_brightness(frame))
+                timings['detection_ms'] += (time.perf_counter() - started) * 1000
+                timings['faces'] += len(detected)
+
+                tracks = tracker.update([face_data['facial_area'] for face_data in detected], frame_index)
+                pending = [
+                    (face_data, track) for face_data, track in zip(detected, tracks)
+                    if track.student_index is None and track.embeddings < self.max_embeddings_per_track
+                ]
+                if not pending:
+                    continue
+
+                started = time.perf_counter()
+                embeddings = self._embed_faces([face_data['face'] for face_data, _ in pending])
+                timings['embedding_ms'] += (time.perf_counter() - started) * 1000
+                timings['embedded'] += len(pending)
+
+                started = time.perf_counter()
+                with span('matching'):
+                    matches = self.gallery.best_matches(embeddings, self.threshold)
+                timings['matching_ms'] += (time.perf_counter() - started) * 1000
+
+                for (_, track), (match_index, similarity) in zip(pending, matches):
+                    track.embeddings += 1
+                    if match_index is not None:
+                        track.student_index = match_index
+                        track.similarity = similarity
+                        present_student_ids.add(self.gallery.ids[match_index])
+
+                if present_student_ids >= all_ids:
+                    print(f"Every registered student matched after {timings['frames']} frames.", file=sys.stderr)
+                    break
+
+            if timings['frames'] == 0:
+                return False, "None of the uploaded images or videos could be read."
+
+            self.last_timings = {key: round(value, 2) if isinstance(value, float) else value for key, value in timings.items()}
+            print(f"Burst attendance timings: {self.last_timings}", file=sys.stderr)
+
+            self._save_full_attendance_report(subject, present_student_ids, attendance_date)
+            return True, (f"Attendance recorded for {attendance_date} from {timings['frames']} frames. "
+                          f"{len(present_student_ids)} students marked as Present.")
+
+        except Exception as e:
+            return False, f"An unexpected attendance error occurred: {str(e)}"
+
     # MODIFIED: Accept date parameter
     def _save_full_attendance_report(self, subject: str, present_ids: set, attendance_date: str):
         """Helper function to save a complete attendance list for all registered students."""
@@ -222,13 +379,10 @@ class ArcFaceSystem:
         if not attendance_records:
             return
 
-        file_exists = os.path.exists('attendance.csv') and os.path.getsize('attendance.csv') > 0
-        with open('attendance.csv', 'a', newline='') as f:
-            fieldnames = ['student_id', 'name', 'date', 'time', 'subject', 'status']
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            if not file_exists:
-                writer.writeheader()
-            writer.writerows(attendance_records)
+        with span('report'):
+            if self.attendance_store is None:
+                self.attendance_store = AttendanceStore(os.getenv('ATTENDANCE_DB', 'attendance.db'))
+            self.attendance_store.record_session(attendance_records)
 
     def list_registered_students(self):
         """Utility method to list all registered students (for debugging)."""
@@ -242,9 +396,78 @@ def validate_token(token):
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         return False
 
+def run_operation(system: ArcFaceSystem, operation: str, params: dict) -> dict:
+    """
+    Runs one register/attendance/list operation and returns its JSON response,
+    with per-stage "spans" when PIPELINE_TIMINGS=1 and a "profile" dump path
+    when the request is profiled (PIPELINE_PROFILE or "profile": true).
+    """
+    with Trace(operation or "face", profile=True if params.get('profile') else None) as trace:
+        response = _run_operation(system, operation, params)
+    return trace.attach(response)
+
+def _run_operation(system: ArcFaceSystem, operation: str, params: dict) -> dict:
+    if operation == "register":
+        success, message = system.register_student(params['student_id'], params['name'], params['image_path'])
+        return {"success": success, "message": message}
+
+    if operation == "attendance":
+        success, message = system.take_attendance(params['subject'], params['image_path'], params['date'])
+        return {"success": success, "message": message, "timings": system.last_timings}
+
+    if operation == "attendance_burst":
+        success, message = system.take_attendance_burst(params['subject'], params['media_paths'], params['date'])
+        return {"success": success, "message": message, "timings": system.last_timings}
+
+    if operation == "list":
+        students = system.list_registered_students()
+        return {"success": True, "count": len(students), "students": students}
+
+    raise ValueError(f"Invalid operation: '{operation}'.")
+
+def serve():
+    """
+    Resident service mode: keeps the detector, the ArcFace model and the
+    gallery in memory and answers newline-delimited JSON requests on stdin,
+    e.g. {"id": 1, "operation": "list", "token": "..."}. Every request is
+    authorised with validate_token, and registrations update the in-memory
+    gallery immediately.
+    """
+    # Anything DeepFace/TensorFlow prints must not corrupt the reply stream
+    replies = sys.stdout
+    sys.stdout = sys.stderr
+
+    system = ArcFaceSystem()
+    system.warm_up()
+    print(f"Face service ready with {len(system.registered_students)} registered students.", file=sys.stderr)
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            if not validate_token(request.get('token', '')):
+                response = {"success": False, "message": "Unauthorized: Invalid token."}
+            else:
+                response = run_operation(system, request.get('operation'), request)
+        except Exception as e:
+            response = {"success": False, "message": "A critical system error occurred.", "error": str(e)}
+
+        response['id'] = request_id
+        replies.write(json.dumps(response) + "\n")
+        replies.flush()
+
 def main():
     """Main function to handle command-line operations."""
     try:
+        if len(sys.argv) == 2 and sys.argv[1] == "--serve":
+            serve()
+            return
+
         if len(sys.argv) < 3:
             raise ValueError("Insufficient arguments.")
 
@@ -260,28 +483,28 @@ def main():
         if operation == "register":
             if len(sys.argv) != 6:
                 raise ValueError("Usage: register <id> <name> <path> <token>")
-            student_id, name, image_path = sys.argv[2], sys.argv[3], sys.argv[4]
-            success, message = system.register_student(student_id, name, image_path)
-            print(json.dumps({"success": success, "message": message}))
+            params = {'student_id': sys.argv[2], 'name': sys.argv[3], 'image_path': sys.argv[4]}
 
         elif operation == "attendance":
             # Updated to expect 6 arguments: attendance <subject> <path> <date> <token>
             if len(sys.argv) != 6:
                 raise ValueError("Usage: attendance <subject> <path> <date> <token>")
-            subject, image_path, attendance_date = sys.argv[2], sys.argv[3], sys.argv[4]
-            success, message = system.take_attendance(subject, image_path, attendance_date)
-            print(json.dumps({"success": success, "message": message}))
-            
-        elif operation == "list":
-            students = system.list_registered_students()
-            print(json.dumps({"success": True, "count": len(students), "students": students}))
+            params = {'subject': sys.argv[2], 'image_path': sys.argv[3], 'date': sys.argv[4]}
             
+        elif operation == "attendance_burst":
+            # attendance_burst <subject> <date> <path> [<path> ...] <token>
+            if len(sys.argv) < 6:
+                raise ValueError("Usage: attendance_burst <subject> <date> <path> [<path> ...] <token>")
+            params = {'subject': sys.argv[2], 'date': sys.argv[3], 'media_paths': sys.argv[4:-1]}
+
         else:
-            raise ValueError(f"Invalid operation: '{operation}'.")
+            params = {}
+
+        print(json.dumps(run_operation(system, operation, params)))
 
     except Exception as e:
         print(json.dumps({"success": False, "message": "A critical system error occurred.", "error": str(e)}), file=sys.stderr)
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,200 @@
+# face_store.py
+import ast
+import csv
+import io
+import json
+import os
+import re
+import sys
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+EMBEDDING_DTYPE = np.dtype('<f4')
+
+def parse_legacy_embedding(text: str) -> list:
+    """
+    Parses an embedding written by the old CSV writer without eval(). Lists
+    written under NumPy 2 look like "[np.float64(0.1), ...]", so the scalar
+    wrappers are stripped first.
+    """
+    return ast.literal_eval(re.sub(r'np\.float\d+\(([^()]*)\)', r'\1', text))
+
+class FaceStore:
+    """
+    Append-only binary store for registered face embeddings.
+
+    ``<prefix>.emb``       raw little-endian float32 rows, memory-mapped on load
+    ``<prefix>.index.csv`` one ``id,name`` row per embedding row
+    ``<prefix>.meta.json`` embedding dimension and dtype
+
+    A registration writes the embedding row first and the index row last, and
+    loading only trusts rows that have both (and a newline-terminated index
+    row). An interrupted append can never expose a half-written student.
+    Appends from different processes are serialised by a lock on
+    ``<prefix>.lock``.
+    """
+
+    def __init__(self, prefix: str = 'registered_students'):
+        self.emb_path = f"{prefix}.emb"
+        self.index_path = f"{prefix}.index.csv"
+        self.meta_path = f"{prefix}.meta.json"
+        self.lock_path = f"{prefix}.lock"
+        # Committed index rows and the byte offset just past them, as of the last append
+        self._committed = 0
+        self._index_end = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.meta_path) and os.path.exists(self.index_path)
+
+    def _read_meta(self):
+        with open(self.meta_path, 'r') as f:
+            return json.load(f)
+
+    def _write_meta(self, dim: int):
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'dim': dim, 'dtype': EMBEDDING_DTYPE.str}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive inter-process lock, e.g. the resident face service vs. a one-shot CLI run."""
+        with open(self.lock_path, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    @staticmethod
+    def _parse_rows(data: bytes):
+        """(id, name) rows of newline-terminated index bytes, plus the offset past the last newline."""
+        end = data.rfind(b'\n') + 1
+        text = data[:end].decode('utf-8')
+        return [(row[0], row[1]) for row in csv.reader(io.StringIO(text, newline='')) if len(row) == 2], end
+
+    def _read_index(self):
+        with open(self.index_path, 'rb') as f:
+            return self._parse_rows(f.read())[0]
+
+    def _committed_rows(self) -> int:
+        """
+        Number of committed index rows. Only rows appended since the last call
+        (e.g. by another process) are parsed. A trailing row without its
+        newline is a torn append and is truncated. Call with the lock held.
+        """
+        size = os.path.getsize(self.index_path)
+        if self._index_end is None or size < self._index_end:
+            self._committed, self._index_end = 0, 0
+        if size > self._index_end:
+            with open(self.index_path, 'rb') as f:
+                f.seek(self._index_end)
+                rows, end = self._parse_rows(f.read())
+            self._committed += len(rows)
+            self._index_end += end
+        if size > self._index_end:
+            with open(self.index_path, 'r+b') as f:
+                f.truncate(self._index_end)
+        return self._committed
+
+    def load(self):
+        """
+        Returns (ids, names, embeddings) where embeddings is a read-only
+        (students, dim) memmap. Returns empty lists/array if nothing is stored.
+        """
+        if not self.exists():
+            return [], [], np.empty((0, 0), dtype=EMBEDDING_DTYPE)
+
+        dim = self._read_meta()['dim']
+        entries = self._read_index()
+        row_bytes = dim * EMBEDDING_DTYPE.itemsize
+        stored_rows = os.path.getsize(self.emb_path) // row_bytes if os.path.exists(self.emb_path) else 0
+        count = min(len(entries), stored_rows)
+        if count == 0:
+            return [], [], np.empty((0, dim), dtype=EMBEDDING_DTYPE)
+
+        embeddings = np.memmap(self.emb_path, dtype=EMBEDDING_DTYPE, mode='r', shape=(count, dim))
+        ids = [entry[0] for entry in entries[:count]]
+        names = [entry[1] for entry in entries[:count]]
+        return ids, names, embeddings
+
+    def append(self, student_id: str, name: str, embedding):
+        """Durably appends one student. The index row is the commit record."""
+        row = np.asarray(embedding, dtype=EMBEDDING_DTYPE).ravel()
+        with self._locked():
+            if not self.exists():
+                self._write_meta(row.shape[0])
+                open(self.index_path, 'a').close()
+            dim = self._read_meta()['dim']
+            if row.shape[0] != dim:
+                raise ValueError(f"Embedding has {row.shape[0]} values, store expects {dim}.")
+
+            # Drop any embedding rows left behind by an append that never committed.
+            committed = self._committed_rows()
+            with open(self.emb_path, 'ab') as f:
+                if f.tell() != committed * row.nbytes:
+                    f.truncate(committed * row.nbytes)
+                f.write(row.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            line = io.StringIO(newline='')
+            csv.writer(line).writerow([student_id, name])
+            data = line.getvalue().encode('utf-8')
+            with open(self.index_path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._committed += 1
+            self._index_end += len(data)
+
+    def migrate_csv(self, csv_path: str = 'registered_students.csv') -> int:
+        """One-shot import of the legacy text CSV. Returns the number of students written."""
+        if self.exists() and self._read_index():
+            raise RuntimeError(f"Refusing to migrate: {self.index_path} already has students.")
+
+        ids, names, rows = [], [], []
+        with open(csv_path, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                ids.append(row['id'])
+                names.append(row['name'])
+                rows.append(parse_legacy_embedding(row['embedding']))
+        if not rows:
+            return 0
+
+        embeddings = np.asarray(rows, dtype=EMBEDDING_DTYPE)
+        self._write_meta(embeddings.shape[1])
+        with open(self.emb_path, 'wb') as f:
+            f.write(embeddings.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_path, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(zip(ids, names))
+            f.flush()
+            os.fsync(f.fileno())
+        return len(ids)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Usage: face_store.py migrate [registered_students.csv]", file=sys.stderr)
+        sys.exit(1)
+    try:
+        migrated = FaceStore().migrate_csv(sys.argv[2] if len(sys.argv) > 2 else 'registered_students.csv')
+        print(json.dumps({"success": True, "migrated": migrated}))
+    except Exception as e:
+        print(json.dumps({"success": False, "message": str(e)}))
+        sys.exit(1)
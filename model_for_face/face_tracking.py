@@ -0,0 +1,108 @@
+# face_tracking.py
+import os
+import sys
+import cv2
+
+VIDEO_EXTENSIONS = {'.mp4', '.mov', '.avi', '.mkv', '.webm'}
+
+def iter_frames(media_paths: list, sample_fps: float = 2.0, max_frames: int = 60):
+    """
+    Yields (media index, BGR frame) from a mix of photos and short videos, in
+    order. Videos are sampled at ``sample_fps`` rather than decoded frame by
+    frame into the pipeline; at most ``max_frames`` frames are yielded overall.
+    """
+    yielded = 0
+    for media_index, path in enumerate(media_paths):
+        if yielded >= max_frames:
+            return
+        if os.path.splitext(path)[1].lower() not in VIDEO_EXTENSIONS:
+            frame = cv2.imread(path)
+            if frame is None:
+                print(f"Warning: Cannot read image {path}, skipping.", file=sys.stderr)
+                continue
+            yielded += 1
+            yield media_index, frame
+            continue
+
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            print(f"Warning: Cannot open video {path}, skipping.", file=sys.stderr)
+            continue
+        video_fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        step = max(1, int(round(video_fps / sample_fps)))
+        index = 0
+        try:
+            while yielded < max_frames:
+                # grab() skips decoding for frames that are not sampled
+                if not capture.grab():
+                    break
+                if index % step == 0:
+                    ok, frame = capture.retrieve()
+                    if ok:
+                        yielded += 1
+                        yield media_index, frame
+                index += 1
+        finally:
+            capture.release()
+
+def box_iou(a: dict, b: dict) -> float:
+    """IoU of two facial_area dicts (x, y, w, h)."""
+    inter_w = min(a['x'] + a['w'], b['x'] + b['w']) - max(a['x'], b['x'])
+    inter_h = min(a['y'] + a['h'], b['y'] + b['h']) - max(a['y'], b['y'])
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    inter = inter_w * inter_h
+    return inter / (a['w'] * a['h'] + b['w'] * b['h'] - inter)
+
+class FaceTrack:
+    """One face followed across frames, with what is known about its identity so far."""
+
+    def __init__(self, track_id: int, facial_area: dict, frame_index: int):
+        self.track_id = track_id
+        self.facial_area = facial_area
+        self.last_seen = frame_index
+        self.embeddings = 0
+        self.student_index = None
+        self.similarity = 0.0
+
+class FaceTracker:
+    """
+    Greedy IoU tracker. Each detection is attached to the unclaimed live track
+    it overlaps most (IoU >= ``iou_threshold``), or starts a new track. Tracks
+    not seen for ``max_age`` frames are retired.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_age: int = 5):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.tracks = []
+        self._next_id = 0
+
+    def update(self, facial_areas: list, frame_index: int) -> list:
+        """Returns the track of each detection, in order."""
+        self.tracks = [track for track in self.tracks if frame_index - track.last_seen <= self.max_age]
+        pairs = sorted(
+            ((box_iou(area, track.facial_area), i, track) for i, area in enumerate(facial_areas) for track in self.tracks),
+            key=lambda pair: -pair[0]
+        )
+
+        assigned, claimed = {}, set()
+        for iou, i, track in pairs:
+            if iou < self.iou_threshold:
+                break
+            if i in assigned or track.track_id in claimed:
+                continue
+            assigned[i] = track
+            claimed.add(track.track_id)
+
+        result = []
+        for i, area in enumerate(facial_areas):
+            track = assigned.get(i)
+            if track is None:
+                track = FaceTrack(self._next_id, area, frame_index)
+                self._next_id += 1
+                self.tracks.append(track)
+            track.facial_area = area
+            track.last_seen = frame_index
+            result.append(track)
+        return result
@@ -1,17 +1,80 @@
 import os
+import sys
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from PIL import Image
 import torch
 from torch.utils.data import Dataset
-import torchvision.transforms as transforms
+
+# Resizing is shared with the inference scripts in ../model
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model'))
+from preprocessing import INPUT_SIZE, preprocess_batch, resize
+
+IMAGE_SIZE = INPUT_SIZE
+
+def to_tensor(image):
+    """PIL RGB image -> (3, 224, 224) float tensor in [0, 1], as Resize + ToTensor produced."""
+    return torch.from_numpy(preprocess_batch([np.asarray(image)], normalize=False)[0])
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def _decode_resized(path):
+    """Decodes one image exactly like the uncached path, returned as a (3, H, W) uint8 array."""
+    return resize(np.asarray(Image.open(path).convert('RGB'))).transpose(2, 0, 1)
+
+def build_image_cache(paths, cache_path, workers=4):
+    """
+    Decodes and resizes every image once into ``<cache_path>.npy``, a uint8
+    (N, 3, 224, 224) array, with ``<cache_path>.json`` mapping each file to
+    its row. Files with identical content (the pair folders hold copies of
+    the same raw scans) share one row. The cache is reused as long as every
+    file still has the size and mtime it was built from.
+    """
+    array_path, manifest_path = f"{cache_path}.npy", f"{cache_path}.json"
+    signatures = {path: _file_signature(path) for path in paths}
+
+    if os.path.exists(array_path) and os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("size") == IMAGE_SIZE and all(
+            manifest["files"].get(path, {}).get("signature") == signature for path, signature in signatures.items()
+        ):
+            return manifest
+
+    digests = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            digests[path] = hashlib.sha1(f.read()).hexdigest()
+    unique = list(dict.fromkeys(digests.values()))
+    row_of = {digest: row for row, digest in enumerate(unique)}
+    source_of = {digest: path for path, digest in reversed(list(digests.items()))}
+
+    images = np.lib.format.open_memmap(array_path, mode="w+", dtype=np.uint8,
+                                       shape=(len(unique), 3, IMAGE_SIZE, IMAGE_SIZE))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for row, image in enumerate(pool.map(lambda digest: _decode_resized(source_of[digest]), unique)):
+            images[row] = image
+    images.flush()
+    del images
+
+    manifest = {
+        "size": IMAGE_SIZE,
+        "files": {path: {"row": row_of[digests[path]], "signature": signatures[path]} for path in paths}
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    print(f"✅ Cached {len(unique)} unique images ({len(paths)} files) to {array_path}")
+    return manifest
 
 class HandwritingPairDataset(Dataset):
-    def __init__(self, root_dir):
+    def __init__(self, root_dir, cache_path=None):
         self.pairs = []
         self.labels = []
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor()
-        ])
+        self.transform = to_tensor
 
         match_count, unmatch_count = 0, 0
 
@@ -32,14 +95,32 @@ class HandwritingPairDataset(Dataset):
         print(f"✅ Loaded dataset: {len(self.pairs)} pairs ({match_count} matched, {unmatch_count} unmatched)")
         print(f"✅ Loaded {len(self.pairs)} image pairs (matched + unmatched)")
 
+        # Optional pre-decoded cache: pairs become row lookups into a uint8 memmap
+        self.cache_path = cache_path
+        self.pair_rows = None
+        self._images = None
+        if cache_path:
+            paths = list(dict.fromkeys(path for pair in self.pairs for path in pair))
+            files = build_image_cache(paths, cache_path)["files"]
+            self.pair_rows = [(files[img1]["row"], files[img2]["row"]) for img1, img2 in self.pairs]
 
     def __len__(self):
         return len(self.pairs)
 
+    def _cached_image(self, row):
+        # Opened lazily so each DataLoader worker maps the file itself instead of pickling it
+        if self._images is None:
+            self._images = np.load(f"{self.cache_path}.npy", mmap_mode="r")
+        return torch.from_numpy(np.array(self._images[row])).float().div_(255)
+
     def __getitem__(self, idx):
-        img1_path, img2_path = self.pairs[idx]
         label = torch.tensor(self.labels[idx], dtype=torch.float32)
 
+        if self.pair_rows is not None:
+            row1, row2 = self.pair_rows[idx]
+            return self._cached_image(row1), self._cached_image(row2), label
+
+        img1_path, img2_path = self.pairs[idx]
         img1 = self.transform(Image.open(img1_path).convert('RGB'))
         img2 = self.transform(Image.open(img2_path).convert('RGB'))
 
@@ -0,0 +1,127 @@
+import random
+from itertools import combinations
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset, Sampler
+from dataset import build_image_cache, to_tensor
+from generate_unmatched_pairs import group_images_by_student
+
+class RawImageDataset(Dataset):
+    """
+    Every image under data/raw exactly once. Items are requested by
+    (index1, index2, label) tuples coming from PairSampler, so pairs are
+    virtual: nothing is copied into pair folders.
+    """
+
+    def __init__(self, raw_dir, cache_path=None):
+        images_by_id = group_images_by_student(raw_dir)
+        self.paths, self.owners = [], []
+        for student_id in sorted(images_by_id):
+            for path in sorted(images_by_id[student_id]):
+                self.paths.append(path)
+                self.owners.append(student_id)
+        self.transform = to_tensor
+
+        self.cache_path = cache_path
+        self.rows = None
+        self._images = None
+        if cache_path:
+            files = build_image_cache(self.paths, cache_path)["files"]
+            self.rows = [files[path]["row"] for path in self.paths]
+
+        print(f"✅ Loaded {len(self.paths)} raw images from {len(images_by_id)} students")
+
+    def __len__(self):
+        return len(self.paths)
+
+    def load(self, index):
+        if self.rows is None:
+            return self.transform(Image.open(self.paths[index]).convert('RGB'))
+        if self._images is None:
+            self._images = np.load(f"{self.cache_path}.npy", mmap_mode="r")
+        return torch.from_numpy(self._images[self.rows[index]].copy()).float().div_(255)
+
+    def __getitem__(self, pair):
+        index1, index2, label = pair
+        return self.load(index1), self.load(index2), torch.tensor(label, dtype=torch.float32)
+
+class PairSampler(Sampler):
+    """
+    Yields (index1, index2, label) pairs over a RawImageDataset, rebuilt every
+    epoch. Every same-student pair is a positive. Each epoch draws
+    ``negatives_per_positive`` wrong-student pairs per positive. In hard
+    mode, ``hard_fraction`` of them are the closest wrong-student pairs under
+    the embeddings passed to set_embeddings; the rest stay random, so the
+    model still sees easy negatives.
+    """
+
+    def __init__(self, owners, negatives_per_positive=1, hard_negatives=False, hard_fraction=0.5, seed=0):
+        self.owners = list(owners)
+        self.negatives_per_positive = negatives_per_positive
+        self.hard_negatives = hard_negatives
+        self.hard_fraction = hard_fraction
+        self.seed = seed
+        self.epoch = 0
+        self.embeddings = None
+
+        by_owner = {}
+        for index, owner in enumerate(self.owners):
+            by_owner.setdefault(owner, []).append(index)
+        self.positives = [(i, j, 1.0) for indices in by_owner.values() for i, j in combinations(indices, 2)]
+        self.num_negatives = len(self.positives) * negatives_per_positive
+        if len(by_owner) < 2:
+            raise ValueError("Need images from at least two students to build unmatched pairs.")
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def set_embeddings(self, embeddings):
+        """Embeddings of every image (N, d) from the current model, used to mine hard negatives."""
+        self.embeddings = embeddings.detach().float().cpu()
+
+    def _random_negatives(self, rng, count):
+        negatives, size = [], len(self.owners)
+        while len(negatives) < count:
+            i, j = rng.randrange(size), rng.randrange(size)
+            if self.owners[i] != self.owners[j]:
+                negatives.append((i, j, 0.0))
+        return negatives
+
+    def _hard_negatives(self, count):
+        distances = torch.cdist(self.embeddings, self.embeddings)
+        owner_ids = {owner: i for i, owner in enumerate(dict.fromkeys(self.owners))}
+        owners = torch.tensor([owner_ids[owner] for owner in self.owners])
+        # Only wrong-student pairs, each unordered pair once
+        invalid = (owners[:, None] == owners[None, :]) | torch.ones_like(distances, dtype=torch.bool).tril()
+        distances[invalid] = float("inf")
+        count = min(count, int((~invalid).sum()))
+        flat = torch.topk(distances.flatten(), count, largest=False).indices
+        size = len(self.owners)
+        return [(int(index) // size, int(index) % size, 0.0) for index in flat]
+
+    def __iter__(self):
+        rng = random.Random(self.seed + self.epoch)
+        negatives = []
+        if self.hard_negatives and self.embeddings is not None:
+            negatives = self._hard_negatives(int(self.num_negatives * self.hard_fraction))
+        negatives += self._random_negatives(rng, self.num_negatives - len(negatives))
+
+        pairs = self.positives + negatives
+        rng.shuffle(pairs)
+        return iter(pairs)
+
+    def __len__(self):
+        return len(self.positives) + self.num_negatives
+
+@torch.no_grad()
+def embed_all(model, dataset, device, batch_size=32):
+    """Embeds every image of a RawImageDataset with the model in eval mode."""
+    was_training = model.training
+    model.eval()
+    embeddings = []
+    for start in range(0, len(dataset), batch_size):
+        batch = torch.stack([dataset.load(i) for i in range(start, min(start + batch_size, len(dataset)))])
+        embeddings.append(model.forward_once(batch.to(device)).cpu())
+    model.train(was_training)
+    return torch.cat(embeddings)
@@ -4,9 +4,11 @@ import torchvision.models as models
 import torch.nn.functional as F
 
 class SiameseNetwork(nn.Module):
-    def __init__(self):
+    def __init__(self, pretrained=True):
         super(SiameseNetwork, self).__init__()
-        resnet = models.resnet18(weights=models.ResNet18_Weights.DEFAULT)
+        # Skip the ImageNet weights when a trained state dict is loaded right after
+        weights = models.ResNet18_Weights.DEFAULT if pretrained else None
+        resnet = models.resnet18(weights=weights)
         self.backbone = nn.Sequential(*list(resnet.children())[:-1])  # remove final FC layer
         self.embedding = nn.Sequential(
             nn.Linear(512, 256),
@@ -17,7 +19,11 @@ class SiameseNetwork(nn.Module):
     def forward_once(self, x):
         x = self.backbone(x)
         x = x.view(x.size(0), -1)
-        x = self.embedding(x)
+        return self.embed_features(x)
+
+    def embed_features(self, features):
+        """Head only: 512-d pooled backbone features -> normalised 128-d embeddings."""
+        x = self.embedding(features)
         x = F.normalize(x, p=2, dim=1)  # 🔥 normalize embeddings
         return x
 
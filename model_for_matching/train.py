@@ -2,23 +2,100 @@ import torch
 from torch import optim
 from torch.utils.data import DataLoader
 from dataset import HandwritingPairDataset
+from pair_sampler import RawImageDataset, PairSampler, embed_all
 from siamese_network import SiameseNetwork
 from contrastive_loss import ContrastiveLoss
 import os
+import time
+import random
+import argparse
+from PIL import Image
 import torch.nn.functional as F
 
-def train():
+def build_dataloader(dataset, batch_size, workers, device, sampler=None):
+    """Shuffled (or sampler-driven) loader; workers stay alive across epochs and batches are pinned for CUDA."""
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=sampler is None,
+        sampler=sampler,
+        num_workers=workers,
+        pin_memory=device.type == "cuda",
+        persistent_workers=workers > 0
+    )
+
+@torch.no_grad()
+def precompute_features(model, load_image, count, device, batch_size=32):
+    """Runs the frozen backbone (eval mode) once over every image; returns (count, 512) features."""
+    model.backbone.eval()
+    features = []
+    for start in range(0, count, batch_size):
+        batch = torch.stack([load_image(i) for i in range(start, min(start + batch_size, count))])
+        features.append(model.backbone(batch.to(device)).flatten(1))
+    return torch.cat(features)
+
+class FeaturePairBatches:
+    """
+    Batches of (features1, features2, labels) looked up from precomputed
+    backbone features. Pairs come from the PairSampler when there is one,
+    otherwise from a fixed (index1, index2, label) list reshuffled each epoch.
+    """
+
+    def __init__(self, features, batch_size, sampler=None, pairs=None):
+        self.features = features
+        self.batch_size = batch_size
+        self.sampler = sampler
+        self.pairs = pairs
+
+    def __len__(self):
+        count = len(self.sampler) if self.sampler is not None else len(self.pairs)
+        return (count + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        pairs = list(self.sampler) if self.sampler is not None else random.sample(self.pairs, len(self.pairs))
+        for start in range(0, len(pairs), self.batch_size):
+            index1, index2, labels = zip(*pairs[start:start + self.batch_size])
+            yield (self.features[list(index1)], self.features[list(index2)],
+                   torch.tensor(labels, dtype=torch.float32))
+
+def train(cache_path=None, workers=0, num_epochs=30, batch_size=8,
+          virtual_pairs=False, hard_negatives=False, negatives_per_positive=1, freeze_backbone=False):
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print(f"📦 Using device: {device}")
 
-    dataset = HandwritingPairDataset("data")
-    dataloader = DataLoader(dataset, batch_size=8, shuffle=True)
+    sampler = None
+    if virtual_pairs:
+        # Pairs are drawn by index from data/raw every epoch; nothing is copied
+        dataset = RawImageDataset("data/raw", cache_path=cache_path)
+        sampler = PairSampler(dataset.owners, negatives_per_positive=negatives_per_positive,
+                              hard_negatives=hard_negatives)
+    else:
+        dataset = HandwritingPairDataset("data", cache_path=cache_path)
 
     model = SiameseNetwork().to(device)
     criterion = ContrastiveLoss(margin=0.5)
-    optimizer = optim.Adam(model.parameters(), lr=1e-4)
 
-    num_epochs = 30
+    if freeze_backbone:
+        # ImageNet backbone stays fixed: embed every image once, then train only the head
+        model.backbone.requires_grad_(False)
+        started = time.perf_counter()
+        if virtual_pairs:
+            features = precompute_features(model, dataset.load, len(dataset), device)
+            dataloader = FeaturePairBatches(features, batch_size, sampler=sampler)
+        else:
+            paths = list(dict.fromkeys(path for pair in dataset.pairs for path in pair))
+            row_of = {path: row for row, path in enumerate(paths)}
+            features = precompute_features(
+                model, lambda i: dataset.transform(Image.open(paths[i]).convert('RGB')), len(paths), device
+            )
+            pairs = [(row_of[img1], row_of[img2], float(label)) for (img1, img2), label in zip(dataset.pairs, dataset.labels)]
+            dataloader = FeaturePairBatches(features, batch_size, pairs=pairs)
+        print(f"🧊 Precomputed backbone features for {len(features)} images in {time.perf_counter() - started:.2f}s")
+        optimizer = optim.Adam(model.embedding.parameters(), lr=1e-4)
+    else:
+        dataloader = build_dataloader(dataset, batch_size, workers, device, sampler=sampler)
+        optimizer = optim.Adam(model.parameters(), lr=1e-4)
+
     log_file_path = "training_log.txt"
 
     # Ensure previous log file is cleared
@@ -26,14 +103,33 @@ def train():
         f.write("🚀 Training started\n")
 
     for epoch in range(num_epochs):
+        epoch_started = time.perf_counter()
+        if sampler is not None:
+            sampler.set_epoch(epoch)
+            if hard_negatives:
+                # Refresh the embedding cache so negatives are mined against the current model
+                if freeze_backbone:
+                    with torch.no_grad():
+                        sampler.set_embeddings(model.embed_features(features))
+                else:
+                    sampler.set_embeddings(embed_all(model, dataset, device))
+
         model.train()
         total_loss = 0
+        data_time = 0.0
+        batch_started = time.perf_counter()
 
         print(f"\n🔁 Epoch {epoch+1}/{num_epochs}")
         for batch_idx, (img1, img2, labels) in enumerate(dataloader):
-            img1, img2, labels = img1.to(device), img2.to(device), labels.float().to(device)
+            data_time += time.perf_counter() - batch_started
+            img1 = img1.to(device, non_blocking=True)
+            img2 = img2.to(device, non_blocking=True)
+            labels = labels.float().to(device, non_blocking=True)
 
-            out1, out2 = model(img1, img2)
+            if freeze_backbone:
+                out1, out2 = model.embed_features(img1), model.embed_features(img2)
+            else:
+                out1, out2 = model(img1, img2)
             distances = F.pairwise_distance(out1, out2)
             matched_dists = distances[labels == 1]
             unmatched_dists = distances[labels == 0]
@@ -48,13 +144,15 @@ def train():
 
             total_loss += loss.item()
             print(f"  📦 Batch {batch_idx+1}/{len(dataloader)} - Loss: {loss.item():.4f}")
+            batch_started = time.perf_counter()
 
         avg_loss = total_loss / len(dataloader)
-        print(f"[Epoch {epoch+1}] 🔥 Avg Loss: {avg_loss:.4f}")
+        epoch_time = time.perf_counter() - epoch_started
+        print(f"[Epoch {epoch+1}] 🔥 Avg Loss: {avg_loss:.4f} | ⏱️ {epoch_time:.2f}s (waiting on data: {data_time:.2f}s)")
 
         # Append logs to file (utf-8 handles emojis)
         with open(log_file_path, "a", encoding="utf-8") as f:
-            f.write(f"[Epoch {epoch+1}] 🔥 Avg Loss: {avg_loss:.4f}\n")
+            f.write(f"[Epoch {epoch+1}] 🔥 Avg Loss: {avg_loss:.4f} | ⏱️ {epoch_time:.2f}s (data {data_time:.2f}s)\n")
 
     torch.save(model.state_dict(), "siamese_model_contrastive.pth")
     print("✅ Training complete with Contrastive Loss!")
@@ -62,4 +160,19 @@ def train():
         f.write("✅ Training complete with Contrastive Loss!\n")
 
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser(description="Train the Siamese handwriting model with contrastive loss.")
+    parser.add_argument("--cache", default=None, help="Pre-decode images once into <cache>.npy/.json (e.g. data/image_cache).")
+    parser.add_argument("--workers", type=int, default=0, help="DataLoader worker processes.")
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--virtual-pairs", action="store_true",
+                        help="Sample pairs from data/raw each epoch instead of reading data/matched and data/unmatched.")
+    parser.add_argument("--hard-negatives", action="store_true",
+                        help="With --virtual-pairs, mine the closest wrong-student pairs every epoch.")
+    parser.add_argument("--negatives-per-positive", type=int, default=1)
+    parser.add_argument("--freeze-backbone", action="store_true",
+                        help="Keep the ImageNet ResNet18 fixed, precompute its features once and train only the embedding head.")
+    args = parser.parse_args()
+    train(cache_path=args.cache, workers=args.workers, num_epochs=args.epochs, batch_size=args.batch_size,
+          virtual_pairs=args.virtual_pairs, hard_negatives=args.hard_negatives,
+          negatives_per_positive=args.negatives_per_positive, freeze_backbone=args.freeze_backbone)